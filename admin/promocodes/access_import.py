@@ -0,0 +1,123 @@
+"""
+Импорт списка пользователей, которым выдаётся промокод, из CSV.
+
+В первой колонке файла - UUID или email пользователя, строки с чем-то другим
+(например, заголовок) пропускаются. Файл читается построчно и обрабатывается
+пачками: пачка записывается через COPY во временную таблицу, и найденные по
+ней пользователи получают доступ через AvailableForUsers.grant - по тем же
+правилам, что и в действии админки: пользователи с доступом через группу
+пропускаются, num_uses растёт на число получивших доступ. Память не зависит
+от размера файла, каждая пачка сохраняется своей транзакцией, поэтому
+прерванный импорт можно запустить повторно: уже выданные доступы пропускаются.
+"""
+import csv
+import io
+import uuid
+from dataclasses import dataclass
+from typing import Callable, Iterable, Iterator, List, Optional, TextIO
+
+import sentry_sdk
+
+from django.db import connection, transaction
+from django.db.models import Q
+from django.db.models.expressions import RawSQL
+
+from .models import PromoCode, AvailableForUsers
+from users.models import User
+
+BATCH_SIZE = 50_000
+IMPORT_TABLE = "promocode_access_import"
+NULL = r"\N"
+
+
+@dataclass
+class ImportStats:
+    # Прочитано строк, из них без UUID или email
+    rows: int = 0
+    skipped: int = 0
+    # Найдено пользователей, из них получили доступ впервые
+    resolved: int = 0
+    granted: int = 0
+
+
+def parse_identifier(value: str):
+    """Возвращает (uuid, None) или (None, email); (None, None) для прочих строк."""
+    value = value.strip()
+    if "@" in value:
+        return None, value
+    try:
+        return str(uuid.UUID(value)), None
+    except ValueError:
+        return None, None
+
+
+def read_batches(file: TextIO, batch_size: int = BATCH_SIZE) -> Iterator[List[str]]:
+    """Построчно читает первую колонку CSV и отдаёт её пачками по batch_size."""
+    batch = []
+    for row in csv.reader(file):
+        if not row:
+            continue
+        batch.append(row[0])
+        if len(batch) == batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def _copy_batch(cursor, identifiers: Iterable[tuple]):
+    buffer = io.StringIO()
+    buffer.writelines(
+        f"{user_uuid or NULL}\t{_escape(email) if email else NULL}\n" for user_uuid, email in identifiers
+    )
+    buffer.seek(0)
+    cursor.copy_expert(f"COPY {IMPORT_TABLE} (uuid, email) FROM STDIN", buffer)
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\t", "\\t").replace("\n", "\\n").replace("\r", "\\r")
+
+
+def import_access(
+    promo_code: PromoCode,
+    file: TextIO,
+    batch_size: int = BATCH_SIZE,
+    progress: Optional[Callable[[ImportStats], None]] = None,
+) -> ImportStats:
+    """
+    Выдаёт промокод пользователям из CSV. После каждой пачки вызывает progress
+    с накопленной статистикой.
+    """
+    users = User.objects.filter(
+        Q(uuid__in=RawSQL(f"SELECT uuid FROM {IMPORT_TABLE}", []))
+        | Q(email__in=RawSQL(f"SELECT email FROM {IMPORT_TABLE}", []))
+    )
+    stats = ImportStats()
+    try:
+        with connection.cursor() as cursor:
+            # Курсор psycopg2 под обёрткой Django нужен для copy_expert
+            raw = cursor.cursor
+            raw.execute(f"CREATE TEMPORARY TABLE IF NOT EXISTS {IMPORT_TABLE} (uuid uuid, email text)")
+            for batch in read_batches(file, batch_size):
+                identifiers = [parse_identifier(value) for value in batch]
+                identifiers = [identifier for identifier in identifiers if identifier != (None, None)]
+                stats.rows += len(batch)
+                stats.skipped += len(batch) - len(identifiers)
+                with transaction.atomic():
+                    raw.execute(f"TRUNCATE {IMPORT_TABLE}")
+                    _copy_batch(raw, identifiers)
+                    resolved = users.count()
+                    granted = AvailableForUsers.grant(promo_code, users)
+                stats.resolved += resolved
+                stats.granted += granted
+                if progress is not None:
+                    progress(stats)
+    except Exception as e:
+        sentry_sdk.capture_exception(e)
+        raise
+
+    sentry_sdk.capture_message(
+        f"Импортирован доступ к промокоду {promo_code.code}: строк {stats.rows}, "
+        f"найдено пользователей {stats.resolved}, выдано {stats.granted}"
+    )
+    return stats
@@ -1,3 +1,4 @@
+import io
 import random
 import string
 import datetime
@@ -5,8 +6,22 @@ import sentry_sdk
 
 from django.contrib import admin, messages
 from django.contrib.auth.models import User, Group
-
-from . import models
+from django.core.exceptions import PermissionDenied
+from django.db.models import Prefetch
+from django.http import Http404, StreamingHttpResponse
+from django.shortcuts import redirect
+from django.template.response import TemplateResponse
+from django.urls import path, reverse
+from django.utils.html import format_html
+
+from . import models, purchase_export
+from .access_import import import_access
+from .forms import AccessImportForm, GenerateActionForm
+from .generator import Campaign, CampaignError, enqueue_campaign, iter_campaign_codes
+from users.models import User as UserModel
+
+# Сколько объектов перечислять в сообщении аудита о массовом действии
+AUDIT_LIMIT = 100
 
 admin.site.unregister(User)
 admin.site.unregister(Group)
@@ -52,7 +67,7 @@ class PromoCode(admin.ModelAdmin):
         "discount",
         "discount_type",
         "num_uses",
-        "get_purchase",
+        "purchase_count",
         "expiration_date",
         "is_active",
     )
@@ -69,6 +84,52 @@ class PromoCode(admin.ModelAdmin):
             )
         return super().formfield_for_dbfield(db_field, request, **kwargs)
 
+    def get_urls(self):
+        return [
+            path(
+                "<path:object_id>/import-access/",
+                self.admin_site.admin_view(self.import_access_view),
+                name="promocodes_promocode_import_access",
+            ),
+        ] + super().get_urls()
+
+    def import_access_view(self, request, object_id):
+        """Выдаёт промокод пользователям из загруженного CSV."""
+        promo_code = self.get_object(request, object_id)
+        if promo_code is None:
+            raise Http404
+        if not self.has_change_permission(request, promo_code):
+            raise PermissionDenied
+
+        form = AccessImportForm(request.POST or None, request.FILES or None)
+        if request.method == "POST" and form.is_valid():
+            # Файлы больше FILE_UPLOAD_MAX_MEMORY_SIZE Django сохраняет на диск,
+            # импорт читает их построчно
+            file = io.TextIOWrapper(form.cleaned_data["file"].file, encoding="utf-8-sig", newline="")
+            try:
+                stats = import_access(promo_code, file)
+            except Exception:
+                self.message_user(
+                    request, "Что-то пошло не так, попробуйте снова.", messages.ERROR
+                )
+            else:
+                self.message_user(
+                    request,
+                    f"Доступ выдан {stats.granted} пользователям: прочитано строк {stats.rows}, "
+                    f"пропущено {stats.skipped}, найдено пользователей {stats.resolved}",
+                    messages.SUCCESS,
+                )
+            return redirect(reverse("admin:promocodes_promocode_change", args=[promo_code.pk]))
+
+        context = {
+            **self.admin_site.each_context(request),
+            "title": f"Импорт доступа к промокоду {promo_code}",
+            "opts": self.model._meta,
+            "original": promo_code,
+            "form": form,
+        }
+        return TemplateResponse(request, "admin/promocodes/promocode/import_access.html", context)
+
     def get_queryset(self, request):
         qs = super().get_queryset(request)
         qs = qs.filter(is_deleted=False,  # Только не удаленные промокоды
@@ -76,18 +137,15 @@ class PromoCode(admin.ModelAdmin):
                        num_uses__gte=0)  # доступные для использования
         return qs
 
-    def get_purchase(self, obj):
-        return models.Purchase.objects.filter(promo_code=obj).count()
-    get_purchase.short_description = "Использован, раз"
-
     @admin.action(description="Удалить")
     def delete_selected(self, request, queryset):
         try:
-            for obj in queryset:
-                obj.is_deleted = True
-                obj.save()
+            # Один UPDATE: кэши loyalty сбрасывает триггер одним уведомлением на оператор
+            codes = list(queryset.values_list("code", flat=True)[:AUDIT_LIMIT])
+            count = queryset.update(is_deleted=True)
+            sentry_sdk.capture_message(f'Удалено промокодов: {count}: {", ".join(codes)}')
             self.message_user(
-                request, f"{len(queryset)} промокод(ов) удалено", messages.SUCCESS
+                request, f"{count} промокод(ов) удалено", messages.SUCCESS
             )
         except Exception as e:
             sentry_sdk.capture_exception(e)
@@ -98,12 +156,12 @@ class PromoCode(admin.ModelAdmin):
     @admin.action(description="Деактивировать")
     def deactivate_selected(self, request, queryset):
         try:
-            for obj in queryset:
-                obj.is_active = False
-                obj.save()
+            codes = list(queryset.values_list("code", flat=True)[:AUDIT_LIMIT])
+            count = queryset.update(is_active=False)
+            sentry_sdk.capture_message(f'Деактивировано промокодов: {count}: {", ".join(codes)}')
             self.message_user(
                 request,
-                f"{len(queryset)} промокод(ов) деактивировано",
+                f"{count} промокод(ов) деактивировано",
                 messages.SUCCESS,
             )
         except Exception as e:
@@ -112,7 +170,98 @@ class PromoCode(admin.ModelAdmin):
                 request, "Что-то пошло не так, попробуйте снова.", messages.ERROR
             )
 
-    actions = [delete_selected, deactivate_selected]
+    @admin.action(description="Сгенерировать кампанию по образцу")
+    def generate_campaign(self, request, queryset):
+        if queryset.count() != 1:
+            self.message_user(request, "Выберите один промокод-образец", messages.WARNING)
+            return
+        prefix = request.POST.get("prefix", "").strip().upper()
+        count = request.POST.get("count")
+        if not prefix or not count or not count.isdigit():
+            self.message_user(request, "Укажите префикс и количество промокодов", messages.WARNING)
+            return
+
+        template = queryset.first()
+        group = request.POST.get("group")
+        campaign = Campaign(
+            prefix=prefix,
+            count=int(count),
+            discount=template.discount,
+            discount_type=template.discount_type,
+            num_uses=template.num_uses,
+            expiration_date=template.expiration_date,
+            group_id=int(group) if group else None,
+        )
+        try:
+            job = enqueue_campaign(campaign)
+        except CampaignError as e:
+            self.message_user(request, str(e), messages.ERROR)
+            return
+        except Exception as e:
+            sentry_sdk.capture_exception(e)
+            self.message_user(
+                request, "Что-то пошло не так, попробуйте снова.", messages.ERROR
+            )
+            return
+        sentry_sdk.capture_message(f"Кампания {prefix} поставлена в очередь: {count} промокод(ов)")
+        self.message_user(
+            request,
+            format_html(
+                'Кампания <a href="{}">{}</a> поставлена в очередь, коды можно будет выгрузить после генерации',
+                reverse("admin:promocodes_promocodecampaign_change", args=[job.pk]),
+                prefix,
+            ),
+            messages.SUCCESS,
+        )
+
+    action_form = GenerateActionForm
+    actions = [delete_selected, deactivate_selected, generate_campaign]
+
+
+class PromoCodeCampaign(admin.ModelAdmin):
+    fields = [
+        ("prefix", "status"),
+        ("count", "created_count"),
+        ("discount", "discount_type"),
+        ("num_uses", "expiration_date"),
+        ("body_length", "group"),
+        ("created_at", "finished_at"),
+        "error",
+    ]
+    list_display = (
+        "prefix",
+        "status",
+        "count",
+        "created_count",
+        "discount",
+        "discount_type",
+        "created_at",
+        "finished_at",
+    )
+    list_filter = ("status",)
+    search_fields = ("prefix",)
+
+    def has_add_permission(self, request, obj=None):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    @admin.action(description="Выгрузить коды")
+    def export_codes(self, request, queryset):
+        if queryset.count() != 1:
+            self.message_user(request, "Выберите одну кампанию", messages.WARNING)
+            return
+        job = queryset.first()
+        if job.status != models.PromoCodeCampaign.Status.DONE:
+            self.message_user(request, f"Кампания {job.prefix} ещё не создана", messages.WARNING)
+            return
+        response = StreamingHttpResponse(iter_campaign_codes(job), content_type="text/plain; charset=utf-8")
+        response["Content-Disposition"] = f'attachment; filename="{job.prefix}.txt"'
+        sentry_sdk.capture_message(f"Выгрузка кодов кампании {job.prefix}")
+        return response
+
+    actions = [export_codes]
 
 
 class Tariff(admin.ModelAdmin):
@@ -124,11 +273,11 @@ class Tariff(admin.ModelAdmin):
     @admin.action(description="Удалить")
     def delete_selected(self, request, queryset):
         try:
-            for obj in queryset:
-                obj.is_deleted = True
-                obj.save()
+            names = list(queryset.values_list("name", flat=True)[:AUDIT_LIMIT])
+            count = queryset.update(is_deleted=True)
+            sentry_sdk.capture_message(f'Удалено тарифов: {count}: {", ".join(names)}')
             self.message_user(
-                request, f"{len(queryset)} тариф(ов) удалено", messages.SUCCESS
+                request, f"{count} тариф(ов) удалено", messages.SUCCESS
             )
         except Exception as e:
             sentry_sdk.capture_exception(e)
@@ -145,18 +294,45 @@ class Purchase(admin.ModelAdmin):
     search_fields = ("user", "tariff", "promo_code")
     list_filter = ("purchase_date",)
     readonly_fields = ("user", "tariff", "promo_code", "total_price", "purchase_date")
+    list_select_related = ("user", "tariff", "promo_code")
 
     def has_add_permission(self, request, obj=None):
         return False
 
+    def export(self, queryset, format):
+        content_type, extension = purchase_export.FORMATS[format]
+        response = StreamingHttpResponse(purchase_export.export(queryset, format), content_type=content_type)
+        filename = f"purchases-{datetime.date.today().isoformat()}.{extension}"
+        response["Content-Disposition"] = f'attachment; filename="{filename}"'
+        sentry_sdk.capture_message(f"Выгрузка покупок в {extension}")
+        return response
+
+    @admin.action(description="Выгрузить в CSV")
+    def export_csv(self, request, queryset):
+        return self.export(queryset, "csv")
+
+    @admin.action(description="Выгрузить в NDJSON (gzip)")
+    def export_ndjson(self, request, queryset):
+        return self.export(queryset, "ndjson")
+
+    actions = [export_csv, export_ndjson]
+
 
 class AvailableForUsers(admin.ModelAdmin):
     fields = ["promo_code", ("user", "group")]
     list_display = ("promo_code", "get_users", "get_groups")
     search_fields = ("promo_code",)
 
+    def get_queryset(self, request):
+        # Пользователи и группы всех строк страницы загружаются двумя запросами
+        qs = super().get_queryset(request)
+        return qs.select_related("promo_code").prefetch_related(
+            Prefetch("user", queryset=UserModel.objects.filter(is_active=True), to_attr="active_users"),
+            "group",
+        )
+
     def get_users(self, obj):
-        return ", ".join([str(user) for user in obj.user.filter(is_active=True)])
+        return ", ".join([str(user) for user in obj.active_users])
     get_users.short_description = "Пользователи"
 
     def get_groups(self, obj):
@@ -165,6 +341,7 @@ class AvailableForUsers(admin.ModelAdmin):
 
 
 admin.site.register(models.PromoCode, PromoCode)
+admin.site.register(models.PromoCodeCampaign, PromoCodeCampaign)
 admin.site.register(models.Tariff, Tariff)
 admin.site.register(models.Purchase, Purchase)
 admin.site.register(models.AvailableForUsers, AvailableForUsers)
@@ -0,0 +1,152 @@
+"""
+Фильтр Блума по всем существующим промокодам.
+
+Фильтр хранится в Redis битовой строкой (PROMOCODE_FILTER_KEY), его размер,
+количество хеш-функций и версия - в хеше PROMOCODE_FILTER_META_KEY. Сервис
+лояльности загружает фильтр в память воркеров и отбрасывает несуществующие
+коды, не обращаясь к базе. Каждая версия фильтра публикуется в поток
+PROMOCODE_FILTER_UPDATES_KEY с идентификатором "<версия>-0" и списком
+добавленных бит; воркеры применяют их к своей копии и загружают фильтр
+целиком, только если в потоке нет нужных версий или версия помечена reload. Порядок бит совпадает с SETBIT:
+бит 0 - старший бит первого байта. Реализация хеширования должна совпадать
+с loyalty/src/utils/bloom.py.
+"""
+import math
+import hashlib
+from typing import Iterable, List
+
+from django_redis import get_redis_connection
+
+PROMOCODE_FILTER_KEY = "promocodes:bloom"
+PROMOCODE_FILTER_META_KEY = "promocodes:bloom:meta"
+PROMOCODE_FILTER_TMP_KEY = "promocodes:bloom:tmp"
+PROMOCODE_FILTER_UPDATES_KEY = "promocodes:bloom:updates"
+
+MIN_BITS = 1 << 20
+# Сколько версий хранится в потоке изменений фильтра
+UPDATES_MAXLEN = 1000
+# Объединение с большим фильтром публикуется не битами, а требованием перезагрузки
+MAX_DELTA_POSITIONS = 100_000
+
+# Добавлять биты можно только в уже построенный фильтр, иначе сервис лояльности
+# примет частично заполненный фильтр за полный
+ADD_SCRIPT = """
+if redis.call('EXISTS', KEYS[2]) == 0 then
+    return 0
+end
+for i = 2, #ARGV do
+    redis.call('SETBIT', KEYS[1], ARGV[i], 1)
+end
+local version = redis.call('HINCRBY', KEYS[2], 'version', 1)
+redis.call('XADD', KEYS[3], 'MAXLEN', '~', ARGV[1], version .. '-0', 'positions', table.concat(ARGV, ',', 2))
+return 1
+"""
+
+MERGE_SCRIPT = """
+if redis.call('EXISTS', KEYS[2]) == 0 then
+    redis.call('DEL', KEYS[3])
+    return 0
+end
+redis.call('BITOP', 'OR', KEYS[1], KEYS[1], KEYS[3])
+redis.call('DEL', KEYS[3])
+local version = redis.call('HINCRBY', KEYS[2], 'version', 1)
+redis.call('XADD', KEYS[4], 'MAXLEN', '~', ARGV[1], version .. '-0', 'reload', 1)
+return 1
+"""
+
+# Прежние изменения к новому фильтру не относятся, поток начинается заново
+REPLACE_SCRIPT = """
+redis.call('RENAME', KEYS[3], KEYS[1])
+redis.call('DEL', KEYS[4])
+redis.call('HSET', KEYS[2], 'm', ARGV[1], 'k', ARGV[2])
+return redis.call('HINCRBY', KEYS[2], 'version', 1)
+"""
+
+
+class BloomFilter:
+    def __init__(self, m: int, k: int, bits: bytearray = None):
+        self.m = m
+        self.k = k
+        self.bits = bits if bits is not None else bytearray(m // 8)
+        self.added = 0
+
+    @classmethod
+    def for_capacity(cls, capacity: int, error_rate: float) -> "BloomFilter":
+        """Подбирает размер (степень двойки) и число хеш-функций под ожидаемое число кодов."""
+        bits = -capacity * math.log(error_rate) / math.log(2) ** 2
+        m = max(MIN_BITS, 1 << math.ceil(math.log2(max(bits, 1))))
+        k = max(1, round(m / max(capacity, 1) * math.log(2)))
+        return cls(m, min(k, 16))
+
+    def positions(self, code: str) -> List[int]:
+        digest = hashlib.blake2b(code.encode(), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], "big")
+        h2 = int.from_bytes(digest[8:], "big") | 1
+        return [(h1 + i * h2) % self.m for i in range(self.k)]
+
+    def add(self, code: str):
+        for position in self.positions(code):
+            self.bits[position >> 3] |= 0x80 >> (position & 7)
+        self.added += 1
+
+    def set_positions(self) -> List[int]:
+        return [
+            (index << 3) | bit
+            for index, byte in enumerate(self.bits) if byte
+            for bit in range(8) if byte & (0x80 >> bit)
+        ]
+
+    def __contains__(self, code: str) -> bool:
+        return all(self.bits[position >> 3] & (0x80 >> (position & 7)) for position in self.positions(code))
+
+
+def current_filter() -> BloomFilter:
+    """Возвращает пустой фильтр с параметрами построенного фильтра или None, если его ещё нет."""
+    meta = get_redis_connection("default").hgetall(PROMOCODE_FILTER_META_KEY)
+    if not meta:
+        return None
+    return BloomFilter(int(meta[b"m"]), int(meta[b"k"]))
+
+
+def add_codes(codes: Iterable[str]):
+    """Добавляет коды в фильтр точечными SETBIT и публикует добавленные биты."""
+    bloom = current_filter()
+    if bloom is None:
+        return
+    _add_positions([position for code in codes for position in bloom.positions(code)])
+
+
+def _add_positions(positions: List[int]):
+    if not positions:
+        return
+    redis = get_redis_connection("default")
+    redis.register_script(ADD_SCRIPT)(
+        keys=[PROMOCODE_FILTER_KEY, PROMOCODE_FILTER_META_KEY, PROMOCODE_FILTER_UPDATES_KEY],
+        args=[UPDATES_MAXLEN, *positions],
+    )
+
+
+def merge(bloom: BloomFilter):
+    """
+    Объединяет с фильтром в Redis локально построенный фильтр с теми же параметрами.
+    Небольшой фильтр публикуется битами, большой - требованием перезагрузки.
+    """
+    if bloom.added * bloom.k <= MAX_DELTA_POSITIONS:
+        _add_positions(bloom.set_positions())
+        return
+    redis = get_redis_connection("default")
+    redis.set(PROMOCODE_FILTER_TMP_KEY, bytes(bloom.bits))
+    redis.register_script(MERGE_SCRIPT)(
+        keys=[PROMOCODE_FILTER_KEY, PROMOCODE_FILTER_META_KEY, PROMOCODE_FILTER_TMP_KEY, PROMOCODE_FILTER_UPDATES_KEY],
+        args=[UPDATES_MAXLEN],
+    )
+
+
+def replace(bloom: BloomFilter) -> int:
+    """Заменяет фильтр в Redis целиком. Возвращает новую версию фильтра."""
+    redis = get_redis_connection("default")
+    redis.set(PROMOCODE_FILTER_TMP_KEY, bytes(bloom.bits))
+    return redis.register_script(REPLACE_SCRIPT)(
+        keys=[PROMOCODE_FILTER_KEY, PROMOCODE_FILTER_META_KEY, PROMOCODE_FILTER_TMP_KEY, PROMOCODE_FILTER_UPDATES_KEY],
+        args=[bloom.m, bloom.k],
+    )
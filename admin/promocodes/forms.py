@@ -0,0 +1,27 @@
+from django.contrib.admin.helpers import ActionForm
+from django import forms
+
+from users.models import Group
+
+
+class GenerateActionForm(ActionForm):
+    prefix = forms.CharField(label='Префикс кампании:', max_length=32, required=False)
+    count = forms.IntegerField(label='Количество:', min_value=1, required=False)
+    group = forms.ModelChoiceField(
+        queryset=Group.objects.all(),
+        label='Группа:',
+        required=False,
+        empty_label="Без группы"
+    )
+
+    class Media:
+        css = {
+            'all': ('admin/css/widgets.css',)
+        }
+
+
+class AccessImportForm(forms.Form):
+    file = forms.FileField(
+        label='CSV-файл:',
+        help_text='UUID или email пользователя в первой колонке, по одному на строку',
+    )
@@ -0,0 +1,293 @@
+"""
+Массовая генерация промокодов для маркетинговых кампаний.
+
+Код кампании - это префикс и тело фиксированной длины. Тело - образ порядкового
+номера кода в сети Фейстеля с ключом кампании, записанный в base32. Сеть Фейстеля
+биективна, поэтому коды внутри кампании не повторяются без проверок в базе,
+а без ключа номера кодов по ним не восстановить. Номера делятся на диапазоны,
+которые генерируются параллельно в отдельных процессах.
+
+Промокоды и доступы к ним записываются через COPY, все строки кампании
+сохраняются одной транзакцией. Админка только ставит кампанию в очередь
+(PromoCodeCampaign), генерирует её воркер run_campaign_jobs.
+"""
+import io
+import os
+import hashlib
+import datetime
+import multiprocessing
+from dataclasses import dataclass, replace
+from typing import Iterator, List, Optional, TextIO
+
+import sentry_sdk
+
+from django.db import IntegrityError, connection, transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from . import bloom
+from .models import PromoCode, PromoCodeCampaign, AvailableForUsers
+
+# 32 символа без легко путаемых I, O, 0 и 1
+ALPHABET = "ABCDEFGHJKLMNPQRSTUVWXYZ23456789"
+BITS_PER_CHAR = 5
+FEISTEL_ROUNDS = 4
+CHUNK_SIZE = 50_000
+
+
+@dataclass(frozen=True)
+class Campaign:
+    prefix: str
+    count: int
+    discount: float
+    discount_type: str
+    num_uses: int = 1
+    expiration_date: Optional[datetime.date] = None
+    body_length: int = 10
+    group_id: Optional[int] = None
+    key: bytes = b""
+
+
+class CampaignError(Exception):
+    pass
+
+
+def round_keys(key: bytes) -> List[int]:
+    digest = hashlib.blake2b(key, digest_size=4 * FEISTEL_ROUNDS).digest()
+    return [int.from_bytes(digest[i:i + 4], "big") for i in range(0, len(digest), 4)]
+
+
+def make_codes(prefix: str, body_length: int, key: bytes, start: int, stop: int) -> List[str]:
+    """Возвращает коды кампании с порядковыми номерами из [start, stop)."""
+    half_bits = body_length * BITS_PER_CHAR // 2
+    mask = (1 << half_bits) - 1
+    keys = round_keys(key)
+    alphabet = ALPHABET
+
+    codes = []
+    for number in range(start, stop):
+        left, right = number >> half_bits, number & mask
+        for k in keys:
+            x = (right ^ k) & 0xFFFFFFFF
+            x = (((x >> 16) ^ x) * 0x45D9F3B) & 0xFFFFFFFF
+            x = (((x >> 16) ^ x) * 0x45D9F3B) & 0xFFFFFFFF
+            left, right = right, left ^ (((x >> 16) ^ x) & mask)
+        value = (left << half_bits) | right
+        body = []
+        for _ in range(body_length):
+            body.append(alphabet[value & 31])
+            value >>= BITS_PER_CHAR
+        codes.append(prefix + "".join(body))
+    return codes
+
+
+def _make_chunk(args) -> List[str]:
+    return make_codes(*args)
+
+
+def generate_codes(campaign: Campaign, processes: Optional[int] = None) -> Iterator[List[str]]:
+    """
+    Генерирует коды кампании пачками по CHUNK_SIZE, распределяя пачки по процессам.
+    Пул процессов создаётся форком, поэтому генерация запускается из воркера
+    run_campaign_jobs и команды generate_promocodes, а не из запросов админки.
+    """
+    tasks = [
+        (campaign.prefix, campaign.body_length, campaign.key, start, min(start + CHUNK_SIZE, campaign.count))
+        for start in range(0, campaign.count, CHUNK_SIZE)
+    ]
+    if len(tasks) <= 1:
+        yield from map(_make_chunk, tasks)
+        return
+    with multiprocessing.get_context("fork").Pool(processes) as pool:
+        yield from pool.imap(_make_chunk, tasks)
+
+
+def validate(campaign: Campaign):
+    if not campaign.prefix or any(ch not in ALPHABET for ch in campaign.prefix):
+        raise CampaignError(f"Префикс может состоять только из символов {ALPHABET}")
+    # Каждая половина сети Фейстеля должна помещаться в 32 бита функции раунда
+    if campaign.body_length % 2 or not 4 <= campaign.body_length <= 12:
+        raise CampaignError("Длина кода без префикса должна быть чётной, от 4 до 12 символов")
+    if campaign.count > 1 << (campaign.body_length * BITS_PER_CHAR):
+        raise CampaignError("Количество кодов больше, чем помещается в коды такой длины")
+    max_length = PromoCode._meta.get_field("code").max_length
+    if len(campaign.prefix) + campaign.body_length > max_length:
+        raise CampaignError(f"Длина промокода больше {max_length} символов")
+    # Коды разных кампаний не пересекаются, только если ни один из префиксов
+    # не начинается с другого: проверяются обе стороны
+    prefixes = [campaign.prefix[:i] for i in range(1, len(campaign.prefix) + 1)]
+    conflict = (
+        PromoCodeCampaign.objects.filter(Q(prefix__startswith=campaign.prefix) | Q(prefix__in=prefixes))
+        .exclude(key=campaign.key)
+        .first()
+    )
+    if conflict is not None:
+        raise CampaignError(f"Префикс {campaign.prefix} пересекается с префиксом кампании {conflict.prefix}")
+    if PromoCode.objects.filter(code__startswith=campaign.prefix).exists():
+        raise CampaignError(f"Промокоды с префиксом {campaign.prefix} уже существуют")
+
+
+def _copy(cursor, table: str, columns: List[str], rows: Iterator[tuple]):
+    buffer = io.StringIO()
+    buffer.writelines("\t".join(map(str, row)) + "\n" for row in rows)
+    buffer.seek(0)
+    cursor.copy_expert(f"COPY {table} ({', '.join(columns)}) FROM STDIN", buffer)
+
+
+def _next_ids(cursor, table: str, count: int) -> List[int]:
+    cursor.execute(
+        "SELECT nextval(pg_get_serial_sequence(%s, 'id')) FROM generate_series(1, %s)",
+        [table, count],
+    )
+    return [row[0] for row in cursor.fetchall()]
+
+
+def create_campaign(campaign: Campaign, export: Optional[TextIO] = None, processes: Optional[int] = None) -> int:
+    """
+    Генерирует и сохраняет промокоды кампании, выдаёт к каждому отдельный доступ
+    (и группе campaign.group_id, если указана). Коды дополнительно пишутся
+    построчно в export. Возвращает количество созданных промокодов.
+    """
+    if not campaign.key:
+        campaign = replace(campaign, key=os.urandom(16))
+    validate(campaign)
+
+    promo_table = PromoCode._meta.db_table
+    access_table = AvailableForUsers._meta.db_table
+    group_through = AvailableForUsers.group.through._meta
+    promo_row = (
+        campaign.discount,
+        campaign.discount_type,
+        campaign.num_uses,
+        True,
+        datetime.date.today().isoformat(),
+        campaign.expiration_date.isoformat() if campaign.expiration_date else r"\N",
+        False,
+    )
+
+    # Коды кампании добавляются в фильтр одной операцией после сохранения
+    bloom_filter = bloom.current_filter()
+    created = 0
+    try:
+        with transaction.atomic(), connection.cursor() as cursor:
+            # Курсор psycopg2 под обёрткой Django нужен для copy_expert
+            raw = cursor.cursor
+            for codes in generate_codes(campaign, processes):
+                promo_ids = _next_ids(raw, promo_table, len(codes))
+                access_ids = _next_ids(raw, access_table, len(codes))
+                _copy(
+                    raw, promo_table,
+                    ["id", "code", "discount", "discount_type", "num_uses",
+                     "is_active", "creation_date", "expiration_date", "is_deleted"],
+                    ((promo_id, code) + promo_row for promo_id, code in zip(promo_ids, codes)),
+                )
+                _copy(raw, access_table, ["id", "promo_code_id"], zip(access_ids, promo_ids))
+                if campaign.group_id is not None:
+                    _copy(
+                        raw, group_through.db_table,
+                        [group_through.get_field("availableforusers").column, group_through.get_field("group").column],
+                        ((access_id, campaign.group_id) for access_id in access_ids),
+                    )
+                if export is not None:
+                    export.writelines(code + "\n" for code in codes)
+                if bloom_filter is not None:
+                    for code in codes:
+                        bloom_filter.add(code)
+                created += len(codes)
+            # Кампания попадает в реестр префиксов в той же транзакции, что и её коды
+            PromoCodeCampaign.objects.update_or_create(
+                key=campaign.key,
+                defaults=dict(
+                    _campaign_fields(campaign),
+                    status=PromoCodeCampaign.Status.DONE,
+                    created_count=created,
+                    finished_at=timezone.now(),
+                ),
+            )
+            if bloom_filter is not None:
+                transaction.on_commit(lambda: bloom.merge(bloom_filter))
+    except Exception as e:
+        sentry_sdk.capture_exception(e)
+        raise
+
+    sentry_sdk.capture_message(f"Создана кампания {campaign.prefix}: {created} промокод(ов)")
+    return created
+
+
+def _campaign_fields(campaign: Campaign) -> dict:
+    return {
+        "prefix": campaign.prefix,
+        "count": campaign.count,
+        "discount": campaign.discount,
+        "discount_type": campaign.discount_type,
+        "num_uses": campaign.num_uses,
+        "expiration_date": campaign.expiration_date,
+        "body_length": campaign.body_length,
+        "group_id": campaign.group_id,
+        "key": campaign.key,
+    }
+
+
+def _campaign_from_job(job: PromoCodeCampaign) -> Campaign:
+    return Campaign(
+        prefix=job.prefix,
+        count=job.count,
+        discount=job.discount,
+        discount_type=job.discount_type,
+        num_uses=job.num_uses,
+        expiration_date=job.expiration_date,
+        body_length=job.body_length,
+        group_id=job.group_id,
+        key=bytes(job.key),
+    )
+
+
+def enqueue_campaign(campaign: Campaign) -> PromoCodeCampaign:
+    """
+    Проверяет кампанию и ставит её в очередь воркера run_campaign_jobs:
+    генерация большой кампании не должна занимать запрос админки.
+    """
+    if not campaign.key:
+        campaign = replace(campaign, key=os.urandom(16))
+    validate(campaign)
+    try:
+        with transaction.atomic():
+            return PromoCodeCampaign.objects.create(**_campaign_fields(campaign))
+    except IntegrityError:
+        raise CampaignError(f"Кампания с префиксом {campaign.prefix} уже существует")
+
+
+def run_next_campaign(processes: Optional[int] = None) -> Optional[PromoCodeCampaign]:
+    """
+    Генерирует первую кампанию из очереди. Строка кампании заблокирована до конца
+    транзакции, поэтому воркеры не берут одну кампанию дважды, а кампания
+    упавшего воркера остаётся в очереди. Возвращает кампанию или None, если
+    очередь пуста.
+    """
+    with transaction.atomic():
+        job = (
+            PromoCodeCampaign.objects.select_for_update(skip_locked=True)
+            .filter(status=PromoCodeCampaign.Status.PENDING)
+            .order_by("id")
+            .first()
+        )
+        if job is None:
+            return None
+        try:
+            with transaction.atomic():
+                create_campaign(_campaign_from_job(job), processes=processes)
+        except Exception as e:
+            job.status = PromoCodeCampaign.Status.FAILED
+            job.error = str(e)
+            job.finished_at = timezone.now()
+            job.save(update_fields=["status", "error", "finished_at"])
+        else:
+            job.refresh_from_db()
+    return job
+
+
+def iter_campaign_codes(job: PromoCodeCampaign) -> Iterator[str]:
+    """Заново генерирует коды созданной кампании по её ключу для выгрузки."""
+    for start in range(0, job.count, CHUNK_SIZE):
+        codes = make_codes(job.prefix, job.body_length, bytes(job.key), start, min(start + CHUNK_SIZE, job.count))
+        yield "".join(code + "\n" for code in codes)
@@ -0,0 +1,38 @@
+import sys
+import datetime
+
+from django.core.management.base import BaseCommand
+
+from promocodes import purchase_export
+from promocodes.models import Purchase
+
+
+class Command(BaseCommand):
+    help = "Выгружает покупки в CSV или NDJSON (gzip) потоком через серверный курсор"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--format", choices=purchase_export.FORMATS, default="csv")
+        parser.add_argument("--since", type=datetime.date.fromisoformat, default=None, help="Дата покупки с")
+        parser.add_argument("--until", type=datetime.date.fromisoformat, default=None, help="Дата покупки по")
+        parser.add_argument("--output", default=None, help="Файл выгрузки, по умолчанию stdout")
+
+    def handle(self, *args, **options):
+        queryset = Purchase.objects.all()
+        if options["since"]:
+            queryset = queryset.filter(purchase_date__gte=options["since"])
+        if options["until"]:
+            queryset = queryset.filter(purchase_date__lte=options["until"])
+
+        binary = options["format"] == "ndjson"
+        if options["output"]:
+            output = open(options["output"], "wb") if binary else open(options["output"], "w", newline="")
+        else:
+            output = sys.stdout.buffer if binary else sys.stdout
+        try:
+            for chunk in purchase_export.export(queryset, options["format"]):
+                output.write(chunk)
+        finally:
+            if options["output"]:
+                output.close()
+            else:
+                output.flush()
@@ -0,0 +1,50 @@
+import time
+import datetime
+
+from django.core.management.base import BaseCommand, CommandError
+
+from promocodes.generator import Campaign, CampaignError, create_campaign
+from promocodes.models import PromoCode
+
+
+class Command(BaseCommand):
+    help = "Генерирует кампанию уникальных промокодов и сохраняет их через COPY"
+
+    def add_arguments(self, parser):
+        parser.add_argument("prefix", help="Префикс кодов кампании")
+        parser.add_argument("count", type=int, help="Количество промокодов")
+        parser.add_argument("--discount", type=float, required=True)
+        parser.add_argument(
+            "--discount-type", choices=PromoCode.DiscountType.values, default=PromoCode.DiscountType.FIXED
+        )
+        parser.add_argument("--num-uses", type=int, default=1)
+        parser.add_argument("--expiration-date", type=datetime.date.fromisoformat, default=None)
+        parser.add_argument("--length", type=int, default=10, help="Длина кода без префикса")
+        parser.add_argument("--group", type=int, default=None, help="Ид группы, которой выдаются промокоды")
+        parser.add_argument("--processes", type=int, default=None)
+        parser.add_argument("--output", default=None, help="Файл для выгрузки сгенерированных кодов")
+
+    def handle(self, *args, **options):
+        campaign = Campaign(
+            prefix=options["prefix"].upper(),
+            count=options["count"],
+            discount=options["discount"],
+            discount_type=options["discount_type"],
+            num_uses=options["num_uses"],
+            expiration_date=options["expiration_date"],
+            body_length=options["length"],
+            group_id=options["group"],
+        )
+        started = time.perf_counter()
+        export = open(options["output"], "w") if options["output"] else None
+        try:
+            created = create_campaign(campaign, export, options["processes"])
+        except CampaignError as e:
+            raise CommandError(str(e))
+        finally:
+            if export is not None:
+                export.close()
+        elapsed = time.perf_counter() - started
+        self.stdout.write(self.style.SUCCESS(
+            f"Создано {created} промокод(ов) за {elapsed:.1f} с ({created / elapsed * 60:,.0f} в минуту)"
+        ))
@@ -0,0 +1,37 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from promocodes.access_import import BATCH_SIZE, import_access
+from promocodes.models import PromoCode
+
+
+class Command(BaseCommand):
+    help = "Выдаёт промокод пользователям из CSV с UUID или email в первой колонке"
+
+    def add_arguments(self, parser):
+        parser.add_argument("code", help="Промокод")
+        parser.add_argument("path", help="CSV-файл с пользователями")
+        parser.add_argument("--batch-size", type=int, default=BATCH_SIZE)
+
+    def handle(self, *args, **options):
+        try:
+            promo_code = PromoCode.objects.get(code=options["code"], is_deleted=False)
+        except PromoCode.DoesNotExist:
+            raise CommandError(f"Промокод {options['code']} не найден")
+
+        started = time.perf_counter()
+
+        def progress(stats):
+            elapsed = time.perf_counter() - started
+            self.stdout.write(
+                f"Прочитано {stats.rows}, найдено {stats.resolved}, выдано {stats.granted} "
+                f"({stats.rows / elapsed:,.0f} строк/с)"
+            )
+
+        with open(options["path"], newline="", encoding="utf-8-sig") as file:
+            stats = import_access(promo_code, file, options["batch_size"], progress)
+        self.stdout.write(self.style.SUCCESS(
+            f"Доступ к {promo_code.code} выдан {stats.granted} пользователям: "
+            f"прочитано строк {stats.rows}, пропущено {stats.skipped}, найдено пользователей {stats.resolved}"
+        ))
@@ -0,0 +1,29 @@
+from django.core.management.base import BaseCommand
+
+from promocodes import bloom
+from promocodes.models import PromoCode
+
+
+class Command(BaseCommand):
+    help = "Перестраивает фильтр Блума по всем промокодам и публикует его в Redis"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--capacity", type=int, default=None,
+                            help="Ожидаемое количество промокодов, по умолчанию - вдвое больше текущего")
+        parser.add_argument("--error-rate", type=float, default=0.01)
+
+    def handle(self, *args, **options):
+        codes = PromoCode.objects.order_by("id").values_list("id", "code")
+        last_id = codes.last()[0] if codes.exists() else 0
+        capacity = options["capacity"] or max(2 * codes.count(), 1)
+        bloom_filter = bloom.BloomFilter.for_capacity(capacity, options["error_rate"])
+
+        for _, code in codes.filter(id__lte=last_id).iterator(chunk_size=10_000):
+            bloom_filter.add(code)
+        version = bloom.replace(bloom_filter)
+        # Коды, созданные во время перестроения, не попали в снимок
+        bloom.add_codes(code for _, code in codes.filter(id__gt=last_id))
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Фильтр версии {version}: {bloom_filter.m} бит, {bloom_filter.k} хеш-функций"
+        ))
@@ -0,0 +1,35 @@
+import time
+
+import sentry_sdk
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from promocodes.generator import run_next_campaign
+from promocodes.models import PromoCodeCampaign
+
+
+class Command(BaseCommand):
+    help = "Генерирует кампании промокодов, поставленные в очередь из админки"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--interval", type=float, default=5.0, help="Пауза между опросами пустой очереди, с")
+        parser.add_argument("--processes", type=int, default=None)
+        parser.add_argument("--once", action="store_true", help="Разобрать очередь и завершиться")
+
+    def handle(self, *args, **options):
+        while True:
+            close_old_connections()
+            try:
+                job = run_next_campaign(options["processes"])
+            except Exception as e:
+                sentry_sdk.capture_exception(e)
+                job = None
+            if job is not None:
+                if job.status == PromoCodeCampaign.Status.DONE:
+                    self.stdout.write(self.style.SUCCESS(f"Кампания {job.prefix}: {job.created_count} промокод(ов)"))
+                else:
+                    self.stderr.write(f"Кампания {job.prefix}: {job.error}")
+                continue
+            if options["once"]:
+                return
+            time.sleep(options["interval"])
@@ -0,0 +1,170 @@
+from django.db import migrations
+
+# Триггеры уровня оператора с таблицами переходов: одно уведомление на оператор,
+# в том числе на массовые queryset.update() и delete(), которые не вызывают save().
+# Полезная нагрузка NOTIFY ограничена 8000 байт, поэтому большой список строк
+# отправляется несколькими уведомлениями.
+#
+# Элемент уведомления о промокоде - [ид, код] или [ид, код, изменение num_uses]:
+# остаток использований в Redis не сбрасывается, а сдвигается на это изменение,
+# иначе потерялись бы использования, ещё не перенесённые в Postgres. Вставка
+# промокодов уведомлений не шлёт: новые коды ещё не закэшированы. Уведомление
+# получает каждый воркер лояльности, поэтому у него есть ид: по нему сдвиг
+# применяется ровно один раз.
+CHANNEL = "cache_invalidation"
+MAX_ITEMS_BYTES = 7800
+
+NOTIFY_FUNCTION = f"""
+CREATE OR REPLACE FUNCTION cache_invalidation_notify(entity text, items jsonb) RETURNS void AS $$
+DECLARE
+    chunk jsonb := '[]'::jsonb;
+    chunk_size int := 0;
+    item jsonb;
+BEGIN
+    -- Сервис лояльности сам переносит счётчики в promo_codes и не сбрасывает из-за этого кэши
+    IF items IS NULL OR current_setting('loyalty.cache_notify', true) = 'off' THEN
+        RETURN;
+    END IF;
+    FOR item IN SELECT value FROM jsonb_array_elements(items) LOOP
+        IF chunk_size > 0 AND chunk_size + octet_length(item::text) + 2 > {MAX_ITEMS_BYTES} THEN
+            PERFORM pg_notify('{CHANNEL}', jsonb_build_object('id', gen_random_uuid(), 'entity', entity, 'items', chunk)::text);
+            chunk := '[]'::jsonb;
+            chunk_size := 0;
+        END IF;
+        chunk := chunk || jsonb_build_array(item);
+        chunk_size := chunk_size + octet_length(item::text) + 2;
+    END LOOP;
+    IF chunk_size > 0 THEN
+        PERFORM pg_notify('{CHANNEL}', jsonb_build_object('id', gen_random_uuid(), 'entity', entity, 'items', chunk)::text);
+    END IF;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION promo_codes_notify() RETURNS trigger AS $$
+DECLARE
+    items jsonb;
+BEGIN
+    IF TG_OP = 'UPDATE' THEN
+        -- Переименованный код сбрасывается и под старым ключом
+        SELECT jsonb_agg(item) INTO items FROM (
+            SELECT jsonb_build_array(n.id, n.code, n.num_uses - o.num_uses) AS item
+            FROM old_rows AS o JOIN new_rows AS n ON n.id = o.id
+            UNION ALL
+            SELECT jsonb_build_array(o.id, o.code)
+            FROM old_rows AS o JOIN new_rows AS n ON n.id = o.id
+            WHERE o.code <> n.code
+        ) AS changed;
+    ELSE
+        SELECT jsonb_agg(jsonb_build_array(id, code)) INTO items FROM old_rows;
+    END IF;
+    PERFORM cache_invalidation_notify('promocode', items);
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION tariffs_notify() RETURNS trigger AS $$
+DECLARE
+    items jsonb;
+BEGIN
+    IF TG_OP = 'DELETE' THEN
+        SELECT jsonb_agg(id) INTO items FROM old_rows;
+    ELSE
+        SELECT jsonb_agg(id) INTO items FROM new_rows;
+    END IF;
+    PERFORM cache_invalidation_notify('tariff', items);
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION availables_notify() RETURNS trigger AS $$
+DECLARE
+    items jsonb;
+BEGIN
+    IF TG_OP = 'INSERT' THEN
+        SELECT jsonb_agg(DISTINCT jsonb_build_array(p.id, p.code)) INTO items
+        FROM new_rows AS r JOIN promo_codes AS p ON p.id = r.promo_code_id;
+    ELSIF TG_OP = 'UPDATE' THEN
+        SELECT jsonb_agg(DISTINCT jsonb_build_array(p.id, p.code)) INTO items
+        FROM (SELECT promo_code_id FROM old_rows UNION SELECT promo_code_id FROM new_rows) AS r
+        JOIN promo_codes AS p ON p.id = r.promo_code_id;
+    ELSE
+        SELECT jsonb_agg(DISTINCT jsonb_build_array(p.id, p.code)) INTO items
+        FROM old_rows AS r JOIN promo_codes AS p ON p.id = r.promo_code_id;
+    END IF;
+    PERFORM cache_invalidation_notify('promocode', items);
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION availables_members_notify() RETURNS trigger AS $$
+DECLARE
+    items jsonb;
+BEGIN
+    IF TG_OP = 'DELETE' THEN
+        SELECT jsonb_agg(DISTINCT jsonb_build_array(p.id, p.code)) INTO items
+        FROM old_rows AS r
+        JOIN availables AS a ON a.id = r.availableforusers_id
+        JOIN promo_codes AS p ON p.id = a.promo_code_id;
+    ELSE
+        SELECT jsonb_agg(DISTINCT jsonb_build_array(p.id, p.code)) INTO items
+        FROM new_rows AS r
+        JOIN availables AS a ON a.id = r.availableforusers_id
+        JOIN promo_codes AS p ON p.id = a.promo_code_id;
+    END IF;
+    PERFORM cache_invalidation_notify('promocode', items);
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+"""
+
+DROP_FUNCTIONS = """
+DROP FUNCTION IF EXISTS availables_members_notify();
+DROP FUNCTION IF EXISTS availables_notify();
+DROP FUNCTION IF EXISTS tariffs_notify();
+DROP FUNCTION IF EXISTS promo_codes_notify();
+DROP FUNCTION IF EXISTS cache_invalidation_notify(text, jsonb);
+"""
+
+# Таблицы переходов нельзя объявить в одном триггере на несколько событий
+REFERENCING = {
+    "INSERT": "REFERENCING NEW TABLE AS new_rows",
+    "UPDATE": "REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows",
+    "DELETE": "REFERENCING OLD TABLE AS old_rows",
+}
+
+TRIGGERS = {
+    "promo_codes": ("promo_codes_notify", ("UPDATE", "DELETE")),
+    "tariffs": ("tariffs_notify", ("INSERT", "UPDATE", "DELETE")),
+    "availables": ("availables_notify", ("INSERT", "UPDATE", "DELETE")),
+    "availables_user": ("availables_members_notify", ("INSERT", "UPDATE", "DELETE")),
+    "availables_group": ("availables_members_notify", ("INSERT", "UPDATE", "DELETE")),
+}
+
+
+def create_triggers():
+    return "\n".join(
+        f"CREATE TRIGGER {table}_{event.lower()}_notify AFTER {event} ON {table} "
+        f"{REFERENCING[event]} FOR EACH STATEMENT EXECUTE FUNCTION {function}();"
+        for table, (function, events) in TRIGGERS.items()
+        for event in events
+    )
+
+
+def drop_triggers():
+    return "\n".join(
+        f"DROP TRIGGER IF EXISTS {table}_{event.lower()}_notify ON {table};"
+        for table, (_, events) in TRIGGERS.items()
+        for event in events
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('promocodes', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.RunSQL(NOTIFY_FUNCTION, reverse_sql=DROP_FUNCTIONS),
+        migrations.RunSQL(create_triggers(), reverse_sql=drop_triggers()),
+    ]
@@ -0,0 +1,278 @@
+from django.db import migrations, models
+
+# Счётчики для списков админки поддерживаются триггерами уровня оператора:
+# покупки пишет сервис лояльности пачками, доступы выдаются массово при
+# генерации кампаний, поэтому пересчёт идёт один раз на оператор, а не на строку.
+# Значения счётчиков меняют только эти триггеры: обновление строки целиком
+# из админки или другого сервиса сохраняет текущее значение.
+
+# Пары (пользователь, промокод), которые дают строки таблицы переходов {rows},
+# и параметр promo_code_granted, исключающий эти строки
+AVAILABLE_PAIRS = {
+    "availables_user": (
+        "SELECT DISTINCT r.user_id, a.promo_code_id FROM {rows} AS r "
+        "JOIN availables AS a ON a.id = r.availableforusers_id",
+        "skip_users",
+    ),
+    "availables_group": (
+        "SELECT DISTINCT ug.user_id, a.promo_code_id FROM {rows} AS r "
+        "JOIN user_group AS ug ON ug.group_id = r.group_id "
+        "JOIN availables AS a ON a.id = r.availableforusers_id",
+        "skip_groups",
+    ),
+    "user_group": (
+        "SELECT DISTINCT r.user_id, a.promo_code_id FROM {rows} AS r "
+        "JOIN availables_group AS ag ON ag.group_id = r.group_id "
+        "JOIN availables AS a ON a.id = ag.availableforusers_id",
+        "skip_members",
+    ),
+    "availables": (
+        "SELECT DISTINCT g.user_id, r.promo_code_id FROM {rows} AS r "
+        "JOIN (SELECT availableforusers_id, user_id FROM availables_user "
+        "UNION ALL SELECT ag.availableforusers_id, ug.user_id FROM availables_group AS ag "
+        "JOIN user_group AS ug ON ug.group_id = ag.group_id) AS g ON g.availableforusers_id = r.id",
+        "skip_availables",
+    ),
+}
+
+
+def available_count_function(table: str) -> str:
+    """
+    Счётчик доступных промокодов сдвигается на пары, которые оператор сделал
+    доступными или недоступными. Пара, которую выдаёт и другой доступ (например,
+    через вторую группу пользователя), счётчик не меняет.
+    """
+    pairs, skip = AVAILABLE_PAIRS[table]
+    new_pairs, old_pairs = pairs.format(rows="new_rows"), pairs.format(rows="old_rows")
+    return f"""
+CREATE OR REPLACE FUNCTION {table}_count() RETURNS trigger AS $$
+BEGIN
+    IF TG_OP IN ('DELETE', 'UPDATE') THEN
+        PERFORM shift_available_count(array(
+            SELECT p.user_id FROM ({old_pairs}) AS p
+            WHERE NOT promo_code_granted(p.user_id, p.promo_code_id)
+        ), -1);
+    END IF;
+    IF TG_OP = 'INSERT' THEN
+        PERFORM shift_available_count(array(
+            SELECT p.user_id FROM ({new_pairs}) AS p
+            WHERE NOT promo_code_granted(p.user_id, p.promo_code_id, {skip} => array(SELECT id FROM new_rows))
+        ), 1);
+    ELSIF TG_OP = 'UPDATE' THEN
+        PERFORM shift_available_count(array(
+            SELECT p.user_id FROM (
+                SELECT n.user_id, n.promo_code_id FROM ({new_pairs}) AS n
+                WHERE NOT promo_code_granted(n.user_id, n.promo_code_id, {skip} => array(SELECT id FROM new_rows))
+                EXCEPT
+                {old_pairs}
+            ) AS p
+        ), 1);
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+"""
+
+
+COUNTER_FUNCTIONS = """
+CREATE OR REPLACE FUNCTION purchases_count() RETURNS trigger AS $$
+BEGIN
+    IF TG_OP IN ('INSERT', 'UPDATE') THEN
+        UPDATE promo_codes AS p SET purchase_count = p.purchase_count + d.n
+        FROM (SELECT promo_code_id, count(*) AS n FROM new_rows GROUP BY promo_code_id) AS d
+        WHERE p.id = d.promo_code_id;
+        UPDATE "user" AS u SET purchase_count = u.purchase_count + d.n
+        FROM (SELECT user_id, count(*) AS n FROM new_rows GROUP BY user_id) AS d
+        WHERE u.uuid = d.user_id;
+    END IF;
+    IF TG_OP IN ('DELETE', 'UPDATE') THEN
+        UPDATE promo_codes AS p SET purchase_count = greatest(p.purchase_count - d.n, 0)
+        FROM (SELECT promo_code_id, count(*) AS n FROM old_rows GROUP BY promo_code_id) AS d
+        WHERE p.id = d.promo_code_id;
+        UPDATE "user" AS u SET purchase_count = greatest(u.purchase_count - d.n, 0)
+        FROM (SELECT user_id, count(*) AS n FROM old_rows GROUP BY user_id) AS d
+        WHERE u.uuid = d.user_id;
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Выдан ли промокод пользователю лично или через группу без учёта строк с
+-- перечисленными ид: так триггер видит доступы, какими они были до оператора
+CREATE OR REPLACE FUNCTION promo_code_granted(
+    granted_user uuid,
+    granted_promo_code bigint,
+    skip_availables bigint[] DEFAULT '{}',
+    skip_users bigint[] DEFAULT '{}',
+    skip_groups bigint[] DEFAULT '{}',
+    skip_members bigint[] DEFAULT '{}'
+) RETURNS boolean AS $$
+    SELECT EXISTS (
+        SELECT 1 FROM availables_user AS au
+        JOIN availables AS a ON a.id = au.availableforusers_id
+        WHERE au.user_id = granted_user AND a.promo_code_id = granted_promo_code
+          AND au.id <> ALL(skip_users) AND a.id <> ALL(skip_availables)
+    ) OR EXISTS (
+        SELECT 1 FROM user_group AS ug
+        JOIN availables_group AS ag ON ag.group_id = ug.group_id
+        JOIN availables AS a ON a.id = ag.availableforusers_id
+        WHERE ug.user_id = granted_user AND a.promo_code_id = granted_promo_code
+          AND ug.id <> ALL(skip_members) AND ag.id <> ALL(skip_groups) AND a.id <> ALL(skip_availables)
+    )
+$$ LANGUAGE sql STABLE;
+
+-- Сдвигает счётчик каждого пользователя на delta за каждое его вхождение в user_ids
+CREATE OR REPLACE FUNCTION shift_available_count(user_ids uuid[], delta int) RETURNS void AS $$
+    UPDATE "user" AS u SET available_count = greatest(u.available_count + delta * d.n, 0)
+    FROM (SELECT user_id, count(*) AS n FROM unnest(user_ids) AS ids(user_id) GROUP BY user_id) AS d
+    WHERE u.uuid = d.user_id;
+$$ LANGUAGE sql;
+""" + "".join(available_count_function(table) for table in AVAILABLE_PAIRS) + """
+CREATE OR REPLACE FUNCTION promo_codes_keep_counters() RETURNS trigger AS $$
+BEGIN
+    -- Глубина 1 - обновление пришло не из триггера счётчиков
+    IF pg_trigger_depth() = 1 THEN
+        NEW.purchase_count := OLD.purchase_count;
+    END IF;
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION user_keep_counters() RETURNS trigger AS $$
+BEGIN
+    IF pg_trigger_depth() = 1 THEN
+        NEW.purchase_count := OLD.purchase_count;
+        NEW.available_count := OLD.available_count;
+    END IF;
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Изменение только счётчиков не затрагивает закэшированные поля промокода
+CREATE OR REPLACE FUNCTION promo_codes_notify() RETURNS trigger AS $$
+DECLARE
+    items jsonb;
+BEGIN
+    IF TG_OP = 'UPDATE' THEN
+        WITH changed AS (
+            SELECT n.id, n.code, o.code AS old_code, n.num_uses - o.num_uses AS num_uses_delta
+            FROM old_rows AS o
+            JOIN new_rows AS n ON n.id = o.id
+            WHERE (o.code, o.discount, o.discount_type, o.num_uses, o.is_active, o.expiration_date, o.is_deleted)
+                IS DISTINCT FROM
+                (n.code, n.discount, n.discount_type, n.num_uses, n.is_active, n.expiration_date, n.is_deleted)
+        )
+        -- Переименованный код сбрасывается и под старым ключом
+        SELECT jsonb_agg(item) INTO items FROM (
+            SELECT jsonb_build_array(id, code, num_uses_delta) AS item FROM changed
+            UNION ALL
+            SELECT jsonb_build_array(id, old_code) FROM changed WHERE old_code <> code
+        ) AS changed_items;
+    ELSE
+        SELECT jsonb_agg(jsonb_build_array(id, code)) INTO items FROM old_rows;
+    END IF;
+    PERFORM cache_invalidation_notify('promocode', items);
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+"""
+
+DROP_FUNCTIONS = """
+DROP FUNCTION IF EXISTS user_keep_counters();
+DROP FUNCTION IF EXISTS promo_codes_keep_counters();
+DROP FUNCTION IF EXISTS availables_count();
+DROP FUNCTION IF EXISTS user_group_count();
+DROP FUNCTION IF EXISTS availables_group_count();
+DROP FUNCTION IF EXISTS availables_user_count();
+DROP FUNCTION IF EXISTS shift_available_count(uuid[], int);
+DROP FUNCTION IF EXISTS promo_code_granted(uuid, bigint, bigint[], bigint[], bigint[], bigint[]);
+DROP FUNCTION IF EXISTS purchases_count();
+"""
+
+BACKFILL = """
+ALTER TABLE promo_codes ALTER COLUMN purchase_count SET DEFAULT 0;
+UPDATE promo_codes AS p SET purchase_count = d.n
+FROM (SELECT promo_code_id, count(*) AS n FROM purchases GROUP BY promo_code_id) AS d
+WHERE p.id = d.promo_code_id;
+UPDATE "user" AS u SET purchase_count = d.n
+FROM (SELECT user_id, count(*) AS n FROM purchases GROUP BY user_id) AS d
+WHERE u.uuid = d.user_id;
+UPDATE "user" AS u SET available_count = d.n
+FROM (
+    SELECT g.user_id, count(DISTINCT a.promo_code_id) AS n
+    FROM (
+        SELECT availableforusers_id, user_id FROM availables_user
+        UNION ALL
+        SELECT ag.availableforusers_id, ug.user_id
+        FROM availables_group AS ag
+        JOIN user_group AS ug ON ug.group_id = ag.group_id
+    ) AS g
+    JOIN availables AS a ON a.id = g.availableforusers_id
+    GROUP BY g.user_id
+) AS d
+WHERE u.uuid = d.user_id;
+"""
+
+# Таблицы переходов нельзя объявить в одном триггере на несколько событий
+REFERENCING = {
+    "INSERT": "REFERENCING NEW TABLE AS new_rows",
+    "UPDATE": "REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows",
+    "DELETE": "REFERENCING OLD TABLE AS old_rows",
+}
+
+TRIGGERS = {
+    "purchases": ("purchases_count", ("INSERT", "UPDATE", "DELETE")),
+    "availables_user": ("availables_user_count", ("INSERT", "UPDATE", "DELETE")),
+    "availables_group": ("availables_group_count", ("INSERT", "UPDATE", "DELETE")),
+    "user_group": ("user_group_count", ("INSERT", "UPDATE", "DELETE")),
+    "availables": ("availables_count", ("UPDATE",)),
+}
+
+GUARDS = {
+    "promo_codes": "promo_codes_keep_counters",
+    '"user"': "user_keep_counters",
+}
+
+
+def create_triggers():
+    triggers = [
+        f"CREATE TRIGGER {table}_{event.lower()}_count AFTER {event} ON {table} "
+        f"{REFERENCING[event]} FOR EACH STATEMENT EXECUTE FUNCTION {function}();"
+        for table, (function, events) in TRIGGERS.items()
+        for event in events
+    ]
+    triggers += [
+        f"CREATE TRIGGER {function} BEFORE UPDATE ON {table} FOR EACH ROW EXECUTE FUNCTION {function}();"
+        for table, function in GUARDS.items()
+    ]
+    return "\n".join(triggers)
+
+
+def drop_triggers():
+    triggers = [
+        f"DROP TRIGGER IF EXISTS {table}_{event.lower()}_count ON {table};"
+        for table, (_, events) in TRIGGERS.items()
+        for event in events
+    ]
+    triggers += [f"DROP TRIGGER IF EXISTS {function} ON {table};" for table, function in GUARDS.items()]
+    return "\n".join(triggers)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0002_user_counters'),
+        ('promocodes', '0002_cache_invalidation_triggers'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='promocode',
+            name='purchase_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Использован, раз'),
+        ),
+        migrations.RunSQL(COUNTER_FUNCTIONS, reverse_sql=DROP_FUNCTIONS),
+        # Счётчики заполняются до того, как их начнут защищать триггеры
+        migrations.RunSQL(BACKFILL, reverse_sql=migrations.RunSQL.noop),
+        migrations.RunSQL(create_triggers(), reverse_sql=drop_triggers()),
+    ]
@@ -0,0 +1,40 @@
+# Generated by Django 4.1.7 on 2026-10-18 03:15
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0002_user_counters'),
+        ('promocodes', '0003_counters'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PromoCodeCampaign',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('prefix', models.CharField(max_length=32, unique=True, verbose_name='Префикс')),
+                ('count', models.PositiveIntegerField(verbose_name='Количество промокодов')),
+                ('discount', models.FloatField(verbose_name='Размер скидки')),
+                ('discount_type', models.CharField(choices=[('fixed', 'Fixed'), ('percentage', 'Percentage'), ('trial', 'Trial')], max_length=15, verbose_name='Тип скидки')),
+                ('num_uses', models.PositiveIntegerField(default=1, verbose_name='Доступное количество использований')),
+                ('expiration_date', models.DateField(blank=True, null=True, verbose_name='Срок действия')),
+                ('body_length', models.PositiveSmallIntegerField(default=10, verbose_name='Длина кода без префикса')),
+                ('key', models.BinaryField()),
+                ('status', models.CharField(choices=[('pending', 'В очереди'), ('done', 'Создана'), ('failed', 'Ошибка')], default='pending', max_length=15, verbose_name='Статус')),
+                ('created_count', models.PositiveIntegerField(default=0, verbose_name='Создано промокодов')),
+                ('error', models.TextField(blank=True, default='', verbose_name='Ошибка')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='Поставлена в очередь')),
+                ('finished_at', models.DateTimeField(blank=True, null=True, verbose_name='Завершена')),
+                ('group', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to='users.group', verbose_name='Группа пользователей')),
+            ],
+            options={
+                'verbose_name': 'Кампания',
+                'verbose_name_plural': 'Кампании',
+                'db_table': 'promo_code_campaigns',
+            },
+        ),
+    ]
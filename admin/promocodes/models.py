@@ -2,8 +2,10 @@ import sentry_sdk
 import textwrap
 import datetime
 
-from django.db import models
-from django.core.cache import cache
+from django.db import connection, models, transaction
+from django.db.models import Exists, F, OuterRef
+
+from . import bloom
 
 
 class PromoCode(models.Model):
@@ -29,6 +31,10 @@ class PromoCode(models.Model):
         verbose_name="Срок действия", default=None, null=True, blank=True
     )
     is_deleted = models.BooleanField(default=False)
+    # Поддерживается триггерами на purchases (миграция 0003_counters)
+    purchase_count = models.PositiveIntegerField(
+        verbose_name="Использован, раз", default=0, editable=False
+    )
 
     class Meta:
         db_table = "promo_codes"
@@ -38,8 +44,18 @@ class PromoCode(models.Model):
     def __str__(self):
         return self.code
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Код из базы: переименованный код тоже должен попасть в фильтр loyalty
+        if "code" in field_names:
+            instance._loaded_code = values[field_names.index("code")]
+        return instance
+
     def save(self, *args, **kwargs):
-        if self.pk is None:  # Создание нового промокода
+        created = self.pk is None
+        code_changed = self.code != getattr(self, "_loaded_code", None)
+        if created:  # Создание нового промокода
             sentry_sdk.capture_message(f'Создан промокод: {self.code}')
         else:  # Обновление существующего
             if self.is_deleted:
@@ -48,12 +64,55 @@ class PromoCode(models.Model):
                 sentry_sdk.capture_message(f'Деактивирован промокод: {self.code}')
         super(PromoCode, self).save(*args, **kwargs)
 
-        # Кеширование
-        if self.is_deleted or not self.is_active:
-            cache.delete(f"promocode:{self.id}")
-        else:
-            exp_time = (self.expiration_date - datetime.datetime.now().date()).total_seconds()
-            cache.set(f"promocode:{self.code}", self.id, exp_time)
+        # Кэши loyalty сбрасываются по уведомлениям триггеров promo_codes
+        # (миграция 0002_cache_invalidation_triggers), в том числе при массовых изменениях
+        if code_changed:
+            # Новый или переименованный код должен пройти фильтр несуществующих кодов в loyalty
+            code = self.code
+            transaction.on_commit(lambda: bloom.add_codes([code]))
+            self._loaded_code = code
+
+
+class PromoCodeCampaign(models.Model):
+    """
+    Кампания промокодов: реестр префиксов кампаний и задание на генерацию,
+    которое выполняет команда run_campaign_jobs вне запросов админки.
+    """
+
+    class Status(models.TextChoices):
+        PENDING = "pending", "В очереди"
+        DONE = "done", "Создана"
+        FAILED = "failed", "Ошибка"
+
+    prefix = models.CharField(verbose_name="Префикс", max_length=32, unique=True)
+    count = models.PositiveIntegerField(verbose_name="Количество промокодов")
+    discount = models.FloatField(verbose_name="Размер скидки")
+    discount_type = models.CharField(
+        verbose_name="Тип скидки", max_length=15, choices=PromoCode.DiscountType.choices
+    )
+    num_uses = models.PositiveIntegerField(verbose_name="Доступное количество использований", default=1)
+    expiration_date = models.DateField(verbose_name="Срок действия", null=True, blank=True)
+    body_length = models.PositiveSmallIntegerField(verbose_name="Длина кода без префикса", default=10)
+    group = models.ForeignKey(
+        "users.Group", verbose_name="Группа пользователей", null=True, blank=True, on_delete=models.SET_NULL
+    )
+    # Ключ сети Фейстеля: по нему коды кампании выгружаются заново, без хранения
+    key = models.BinaryField(editable=False)
+    status = models.CharField(
+        verbose_name="Статус", max_length=15, choices=Status.choices, default=Status.PENDING
+    )
+    created_count = models.PositiveIntegerField(verbose_name="Создано промокодов", default=0)
+    error = models.TextField(verbose_name="Ошибка", blank=True, default="")
+    created_at = models.DateTimeField(verbose_name="Поставлена в очередь", auto_now_add=True)
+    finished_at = models.DateTimeField(verbose_name="Завершена", null=True, blank=True)
+
+    class Meta:
+        db_table = "promo_code_campaigns"
+        verbose_name = "Кампания"
+        verbose_name_plural = "Кампании"
+
+    def __str__(self):
+        return self.prefix
 
 
 class Tariff(models.Model):
@@ -132,3 +191,41 @@ class AvailableForUsers(models.Model):
                     группы - { ", ".join([str(group) for group in self.group.all()])}
                 ''')
         )
+
+    @classmethod
+    def for_promo_code(cls, promo_code: PromoCode) -> "AvailableForUsers":
+        """Возвращает доступ, к которому добавляются новые пользователи промокода."""
+        available = cls.objects.filter(promo_code=promo_code).order_by("id").first()
+        if available is None:
+            available = cls.objects.create(promo_code=promo_code)
+        return available
+
+    @classmethod
+    def grant(cls, promo_code: PromoCode, users: models.QuerySet) -> int:
+        """
+        Выдаёт промокод пользователям из выборки, у которых ещё нет к нему доступа
+        ни лично, ни через группу. Доступы добавляются одним INSERT ... SELECT,
+        num_uses промокода растёт на число получивших доступ.
+        Возвращает количество пользователей, получивших доступ.
+        """
+        users = users.exclude(
+            Exists(cls.user.through.objects.filter(
+                availableforusers__promo_code=promo_code, user=OuterRef("pk")
+            ))
+        ).exclude(
+            Exists(cls.group.through.objects.filter(
+                availableforusers__promo_code=promo_code, group__user=OuterRef("pk")
+            ))
+        )
+        available = cls.for_promo_code(promo_code)
+        sql, params = users.order_by().values("pk").distinct().query.sql_with_params()
+        with transaction.atomic(), connection.cursor() as cursor:
+            cursor.execute(
+                f"INSERT INTO {cls.user.through._meta.db_table} (availableforusers_id, user_id) "
+                f"SELECT %s, selected.pk FROM ({sql}) AS selected(pk) ON CONFLICT DO NOTHING",
+                [available.id, *params],
+            )
+            granted = cursor.rowcount
+            if granted:
+                PromoCode.objects.filter(pk=promo_code.pk).update(num_uses=F("num_uses") + granted)
+        return granted
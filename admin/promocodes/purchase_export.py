@@ -0,0 +1,92 @@
+"""
+Потоковая выгрузка покупок в CSV или NDJSON со сжатием gzip.
+
+Покупки читаются одним запросом с пользователем, тарифом и промокодом через
+серверный курсор Postgres (QuerySet.iterator), строки форматируются и отдаются
+кусками по мере чтения, поэтому память не зависит от количества покупок.
+"""
+import csv
+import json
+import zlib
+from typing import Iterable, Iterator, Optional
+
+from django.db.models import QuerySet
+
+from .models import Purchase
+
+# Сколько строк читается из серверного курсора и форматируется за раз
+CHUNK_SIZE = 5000
+
+COLUMNS = {
+    "id": "id",
+    "purchase_date": "purchase_date",
+    "user_uuid": "user__uuid",
+    "user_email": "user__email",
+    "tariff_id": "tariff_id",
+    "tariff_name": "tariff__name",
+    "promo_code": "promo_code__code",
+    "discount_type": "promo_code__discount_type",
+    "discount": "promo_code__discount",
+    "total_price": "total_price",
+}
+
+FORMATS = {
+    "csv": ("text/csv; charset=utf-8", "csv"),
+    "ndjson": ("application/gzip", "ndjson.gz"),
+}
+
+
+def iter_purchases(queryset: Optional[QuerySet] = None) -> Iterator[tuple]:
+    queryset = Purchase.objects.all() if queryset is None else queryset
+    return (
+        queryset.order_by("id")
+        .values_list(*COLUMNS.values())
+        .iterator(chunk_size=CHUNK_SIZE)
+    )
+
+
+def _chunks(rows: Iterable[tuple]) -> Iterator[list]:
+    chunk = []
+    for row in rows:
+        chunk.append(row)
+        if len(chunk) == CHUNK_SIZE:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+class _Lines:
+    """Буфер для csv.writer, который возвращает записанную строку."""
+
+    def write(self, value: str) -> str:
+        return value
+
+
+def iter_csv(rows: Iterable[tuple]) -> Iterator[str]:
+    writer = csv.writer(_Lines())
+    yield writer.writerow(COLUMNS.keys())
+    for chunk in _chunks(rows):
+        yield "".join(writer.writerow(row) for row in chunk)
+
+
+def iter_ndjson_gzip(rows: Iterable[tuple]) -> Iterator[bytes]:
+    keys = list(COLUMNS)
+    # wbits=31 - поток в формате gzip
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31)
+    for chunk in _chunks(rows):
+        lines = "".join(
+            json.dumps(dict(zip(keys, row)), ensure_ascii=False, default=str) + "\n" for row in chunk
+        )
+        data = compressor.compress(lines.encode())
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+def export(queryset: Optional[QuerySet] = None, format: str = "csv") -> Iterator:
+    """Возвращает итератор кусков выгрузки в формате csv (str) или ndjson (bytes, gzip)."""
+    rows = iter_purchases(queryset)
+    if format == "ndjson":
+        return iter_ndjson_gzip(rows)
+    return iter_csv(rows)
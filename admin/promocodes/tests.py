@@ -1,9 +1,24 @@
+import io
+import gzip
+import json
 import uuid
+from unittest import mock
 
-from django.test import TestCase
+from django.contrib.auth.models import User as AdminUser
+from django.db import connection
+from django.db.models import F
+from django.test import SimpleTestCase, TestCase, TransactionTestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
 from django.utils import timezone
 
-from .models import PromoCode, Tariff, Purchase, AvailableForUsers
+from .models import PromoCode, PromoCodeCampaign, Tariff, Purchase, AvailableForUsers
+from . import purchase_export
+from .access_import import import_access
+from .bloom import BloomFilter
+from .generator import (
+    Campaign, CampaignError, create_campaign, enqueue_campaign, iter_campaign_codes, make_codes, run_next_campaign,
+)
 from users.models import User, Group
 
 
@@ -31,6 +46,25 @@ class PromoCodeModelTest(TestCase):
     def test_str_method(self):
         self.assertEqual(str(self.promo_code), "TEST2024")
 
+    def test_code_added_to_filter(self):
+        with mock.patch("promocodes.models.bloom.add_codes") as add_codes:
+            with self.captureOnCommitCallbacks(execute=True):
+                promo_code = PromoCode.objects.create(code="NEW2024", discount=5.0)
+            add_codes.assert_called_once_with(["NEW2024"])
+
+            add_codes.reset_mock()
+            promo_code = PromoCode.objects.get(pk=promo_code.pk)
+            with self.captureOnCommitCallbacks(execute=True):
+                promo_code.discount = 7.0
+                promo_code.save()
+            add_codes.assert_not_called()
+
+            # Переименованный код тоже должен пройти фильтр в loyalty
+            with self.captureOnCommitCallbacks(execute=True):
+                promo_code.code = "RENAMED2024"
+                promo_code.save()
+            add_codes.assert_called_once_with(["RENAMED2024"])
+
     def test_promo_code_delete(self):
         self.assertFalse(self.promo_code.is_deleted)
         self.promo_code.is_deleted = True
@@ -81,6 +115,16 @@ class PurchaseModelTest(TestCase):
             total_price=26.99  # Price after discount
         )
 
+    def test_export(self):
+        lines = "".join(purchase_export.export()).splitlines()
+        self.assertEqual(lines[0], ",".join(purchase_export.COLUMNS))
+        self.assertEqual(len(lines), 2)
+        self.assertIn("testuser@example.com,", lines[1])
+
+        data = gzip.decompress(b"".join(purchase_export.export(format="ndjson")))
+        row = json.loads(data.splitlines()[0])
+        self.assertEqual((row["promo_code"], row["total_price"]), ("TEST2024", 26.99))
+
     def test_purchase_creation(self):
         self.assertEqual(self.purchase.user, self.user)
         self.assertEqual(self.purchase.tariff, self.tariff)
@@ -113,3 +157,255 @@ class AvailableForUsersModelTest(TestCase):
 
     def test_str_method(self):
         self.assertEqual(str(self.available.promo_code), "TEST2024")
+
+
+class CountersTest(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create(email="testuser@example.com")
+        self.group = Group.objects.create(name="Test Group", description="A test group")
+        self.tariff = Tariff.objects.create(name="Basic Plan", price=29.99, description="A basic plan for users.")
+        self.promo_code = PromoCode.objects.create(code="TEST2024", discount=10.0)
+
+    def test_purchase_count(self):
+        Purchase.objects.bulk_create([
+            Purchase(user=self.user, tariff=self.tariff, promo_code=self.promo_code, total_price=26.99)
+            for _ in range(3)
+        ])
+        self.promo_code.refresh_from_db()
+        self.user.refresh_from_db()
+        self.assertEqual(self.promo_code.purchase_count, 3)
+        self.assertEqual(self.user.purchase_count, 3)
+
+        # Сохранение промокода из админки не затирает счётчик
+        self.promo_code.purchase_count = 0
+        self.promo_code.save()
+        self.promo_code.refresh_from_db()
+        self.assertEqual(self.promo_code.purchase_count, 3)
+
+    def test_available_count(self):
+        other = PromoCode.objects.create(code="OTHER2024", discount=5.0)
+        direct = AvailableForUsers.objects.create(promo_code=self.promo_code)
+        direct.user.add(self.user)
+        by_group = AvailableForUsers.objects.create(promo_code=self.promo_code)
+        by_group.group.add(self.group)
+        AvailableForUsers.objects.create(promo_code=other).group.add(self.group)
+        self.user.group.add(self.group)
+        self.user.refresh_from_db()
+        self.assertEqual(self.user.available_count, 2)
+
+        self.user.group.remove(self.group)
+        self.user.refresh_from_db()
+        self.assertEqual(self.user.available_count, 1)
+
+    def test_available_count_duplicates(self):
+        second = Group.objects.create(name="Second Group", description="Another test group")
+        available = AvailableForUsers.objects.create(promo_code=self.promo_code)
+        available.group.add(self.group, second)
+        available.user.add(self.user)
+        self.user.group.add(self.group, second)
+        self.user.refresh_from_db()
+        self.assertEqual(self.user.available_count, 1)
+
+        # Промокод остаётся доступным, пока его выдаёт хотя бы один доступ
+        available.user.remove(self.user)
+        self.user.group.remove(self.group)
+        self.user.refresh_from_db()
+        self.assertEqual(self.user.available_count, 1)
+
+        available.group.remove(second)
+        self.user.refresh_from_db()
+        self.assertEqual(self.user.available_count, 0)
+
+
+class InvalidationNotifyTest(TransactionTestCase):
+
+    def notifications(self):
+        connection.connection.poll()
+        payloads = [json.loads(notify.payload) for notify in connection.connection.notifies]
+        connection.connection.notifies.clear()
+        return payloads
+
+    def test_large_update_is_split(self):
+        with connection.cursor() as cursor:
+            cursor.execute("LISTEN cache_invalidation")
+        PromoCode.objects.bulk_create([PromoCode(code=f"NOTIFY{i:05d}" + "X" * 60, discount=1.0) for i in range(500)])
+        # Новые промокоды ещё не закэшированы
+        self.assertEqual(self.notifications(), [])
+
+        PromoCode.objects.filter(code__startswith="NOTIFY").update(num_uses=F("num_uses") + 2)
+        payloads = self.notifications()
+        self.assertGreater(len(payloads), 1)
+        self.assertTrue(all(len(json.dumps(payload)) < 8000 for payload in payloads))
+        items = [item for payload in payloads for item in payload["items"]]
+        self.assertEqual(len(items), 500)
+        self.assertTrue(all(item[2] == 2 for item in items))
+        # Сдвиг применяется один раз на уведомление, поэтому ид у каждого свой
+        self.assertEqual(len({payload["id"] for payload in payloads}), len(payloads))
+
+
+class GrantTest(TestCase):
+
+    def setUp(self):
+        self.group = Group.objects.create(name="Test Group", description="A test group")
+        self.promo_code = PromoCode.objects.create(code="TEST2024", discount=10.0)
+        self.users = [User.objects.create(email=f"user{i}@example.com") for i in range(5)]
+        self.users[0].group.add(self.group)
+        AvailableForUsers.objects.create(promo_code=self.promo_code).group.add(self.group)
+
+    def test_grant(self):
+        # Первый пользователь уже получил промокод через группу
+        self.assertEqual(AvailableForUsers.grant(self.promo_code, User.objects.all()), 4)
+        self.assertEqual(AvailableForUsers.grant(self.promo_code, User.objects.all()), 0)
+        self.assertEqual(
+            set(AvailableForUsers.objects.filter(promo_code=self.promo_code).values_list("user", flat=True))
+            - {None},
+            {user.uuid for user in self.users[1:]},
+        )
+
+
+class AccessImportTest(TestCase):
+
+    def setUp(self):
+        self.promo_code = PromoCode.objects.create(code="TEST2024", discount=10.0)
+        self.users = [User.objects.create(email=f"user{i}@example.com") for i in range(5)]
+
+    def test_import_access(self):
+        rows = ["user", str(self.users[0].uuid), "user1@example.com", str(uuid.uuid4()),
+                "missing@example.com", "user1@example.com"]
+        rows += [user.email for user in self.users[2:]]
+        progress = []
+        stats = import_access(self.promo_code, io.StringIO("\n".join(rows)), batch_size=3,
+                              progress=lambda stats: progress.append(stats.rows))
+        self.assertEqual((stats.rows, stats.skipped, stats.granted), (9, 1, 5))
+        self.assertEqual(progress, [3, 6, 9])
+        self.assertEqual(self.promo_code.availableforusers_set.get().user.count(), 5)
+
+        # Повторный импорт того же файла не выдаёт доступы второй раз
+        stats = import_access(self.promo_code, io.StringIO("\n".join(rows)))
+        self.assertEqual(stats.granted, 0)
+
+    def test_import_access_like_grant(self):
+        group = Group.objects.create(name="Test Group", description="A test group")
+        self.users[0].group.add(group)
+        AvailableForUsers.objects.create(promo_code=self.promo_code).group.add(group)
+
+        rows = [user.email for user in self.users]
+        stats = import_access(self.promo_code, io.StringIO("\n".join(rows)))
+        # Пользователь с доступом через группу пропускается, как в AvailableForUsers.grant
+        self.assertEqual((stats.resolved, stats.granted), (5, 4))
+        self.promo_code.refresh_from_db()
+        self.assertEqual(self.promo_code.num_uses, 1 + 4)
+
+
+class ChangelistQueriesTest(TestCase):
+
+    def setUp(self):
+        admin_user = AdminUser.objects.create_superuser("admin", "admin@example.com", "password")
+        self.client.force_login(admin_user)
+        self.tariff = Tariff.objects.create(name="Basic Plan", price=29.99, description="A basic plan for users.")
+        self.group = Group.objects.create(name="Test Group", description="A test group")
+
+    def add_rows(self, count):
+        for _ in range(count):
+            user = User.objects.create(email=f"{uuid.uuid4().hex}@example.com")
+            user.group.add(self.group)
+            promo_code = PromoCode.objects.create(
+                code=uuid.uuid4().hex, expiration_date=timezone.now() + timezone.timedelta(days=30)
+            )
+            Purchase.objects.create(user=user, tariff=self.tariff, promo_code=promo_code, total_price=10)
+            available = AvailableForUsers.objects.create(promo_code=promo_code)
+            available.user.add(user)
+            available.group.add(self.group)
+
+    def count_queries(self, url):
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return len(context)
+
+    def test_query_count_does_not_depend_on_page_size(self):
+        urls = [
+            reverse(f"admin:{model}_changelist")
+            for model in ("promocodes_promocode", "promocodes_purchase",
+                          "promocodes_availableforusers", "users_user")
+        ]
+        self.add_rows(2)
+        small = [self.count_queries(url) for url in urls]
+        self.add_rows(8)
+        self.assertEqual([self.count_queries(url) for url in urls], small)
+
+
+class GeneratorTest(SimpleTestCase):
+
+    def test_codes_are_unique(self):
+        codes = make_codes("A", 4, b"key", 0, 1 << 20)
+        self.assertEqual(len(set(codes)), 1 << 20)
+
+    def test_codes_depend_on_key(self):
+        self.assertNotEqual(make_codes("A", 10, b"one", 0, 100), make_codes("A", 10, b"two", 0, 100))
+
+    def test_ranges_are_consistent(self):
+        codes = make_codes("SUMMER", 10, b"key", 0, 1000)
+        self.assertEqual(codes[500:], make_codes("SUMMER", 10, b"key", 500, 1000))
+        self.assertTrue(all(code.startswith("SUMMER") and len(code) == 16 for code in codes))
+
+
+class CreateCampaignTest(TestCase):
+
+    def setUp(self):
+        self.group = Group.objects.create(name="Test Group", description="A test group")
+
+    def test_create_campaign(self):
+        export = io.StringIO()
+        created = create_campaign(
+            Campaign(prefix="CAMP", count=100, discount=15, discount_type=PromoCode.DiscountType.PERCENTAGE,
+                     group_id=self.group.id),
+            export=export,
+        )
+        codes = export.getvalue().split()
+        self.assertEqual(created, 100)
+        self.assertEqual(PromoCode.objects.filter(code__in=codes, discount=15).count(), 100)
+        self.assertEqual(AvailableForUsers.objects.filter(promo_code__code__in=codes, group=self.group).count(), 100)
+
+    def test_prefix_must_be_new(self):
+        PromoCode.objects.create(code="CAMP1", discount=10.0)
+        with self.assertRaises(CampaignError):
+            create_campaign(Campaign(prefix="CAMP", count=10, discount=10, discount_type="fixed"))
+
+    def test_prefix_must_not_extend_campaign_prefix(self):
+        create_campaign(Campaign(prefix="CAMP", count=10, discount=10, discount_type="fixed"))
+        with self.assertRaises(CampaignError):
+            create_campaign(Campaign(prefix="CAMPX", count=10, discount=10, discount_type="fixed"))
+        with self.assertRaises(CampaignError):
+            create_campaign(Campaign(prefix="CAM", count=10, discount=10, discount_type="fixed"))
+
+    def test_enqueued_campaign_is_created_by_worker(self):
+        job = enqueue_campaign(Campaign(prefix="QUEUE", count=50, discount=10, discount_type="fixed"))
+        self.assertEqual(job.status, PromoCodeCampaign.Status.PENDING)
+        self.assertFalse(PromoCode.objects.filter(code__startswith="QUEUE").exists())
+
+        self.assertEqual(run_next_campaign().pk, job.pk)
+        job.refresh_from_db()
+        self.assertEqual(job.status, PromoCodeCampaign.Status.DONE)
+        self.assertEqual(job.created_count, 50)
+        codes = "".join(iter_campaign_codes(job)).split()
+        self.assertEqual(PromoCode.objects.filter(code__in=codes).count(), 50)
+        self.assertIsNone(run_next_campaign())
+
+
+class BloomFilterTest(SimpleTestCase):
+
+    def test_no_false_negatives(self):
+        bloom = BloomFilter.for_capacity(10_000, 0.01)
+        codes = make_codes("BLOOM", 10, b"key", 0, 10_000)
+        for code in codes:
+            bloom.add(code)
+        self.assertTrue(all(code in bloom for code in codes))
+
+    def test_false_positive_rate(self):
+        bloom = BloomFilter.for_capacity(10_000, 0.01)
+        for code in make_codes("BLOOM", 10, b"key", 0, 10_000):
+            bloom.add(code)
+        false_positives = sum(code in bloom for code in make_codes("OTHER", 10, b"key", 0, 10_000))
+        self.assertLess(false_positives, 200)
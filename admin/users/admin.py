@@ -1,9 +1,8 @@
 import sentry_sdk
 
 from django.contrib import admin, messages
-from django.db.models import Count, Q
 
-from promocodes.models import PromoCode, Purchase, AvailableForUsers
+from promocodes.models import PromoCode, AvailableForUsers
 from . import models
 from .forms import XForm
 
@@ -46,63 +45,39 @@ class User(admin.ModelAdmin):
     list_display = (
         "email",
         "get_group",
-        "get_purchases",
-        "get_availables"
+        "purchase_count",
+        "available_count"
     )
     readonly_fields = ("email",)
 
     def get_queryset(self, request):
         qs = super().get_queryset(request)
         qs = qs.filter(is_active=True)  # Только активные пользователи
-        return qs
+        # Счётчики покупок и доступных промокодов хранятся в самой таблице пользователей
+        return qs.prefetch_related("group")
 
     def get_group(self, obj: models.User):
         return ", ".join([str(group) for group in obj.group.all()])
     get_group.short_description = "Группы"
 
-    def get_purchases(self, obj):
-        return Purchase.objects.filter(user=obj).count()
-    get_purchases.short_description = "Количество использованных промокодов"
-
-    def get_availables(self, obj: models.User):
-        total_count = AvailableForUsers.objects.filter(
-            Q(user=obj) | Q(group__in=obj.group.all())
-        ).values('promo_code').annotate(count=Count('promo_code')).count()
-
-        return total_count
-    get_availables.short_description = "Количество доступных промокодов"
-
     @admin.action(description="Применить промокод")
     def apply_promocode_selected(self, request, queryset):
         try:
             promo_code_id = request.POST.get('promo_code')
             promo_code = PromoCode.objects.get(id=promo_code_id)
             tariff_id = request.POST.get('tariff')
-            count_users = 0
-            for obj in queryset:
-                if promo_code.num_uses > 0:
-                    promo_code.num_uses += 1
-                    promo_code.save()
-                    if not AvailableForUsers.objects.filter(
-                        Q(user=obj, promo_code=promo_code) |
-                        Q(group__in=obj.group.all(), promo_code=promo_code)
-                    ).values('promo_code').annotate(count=Count('promo_code')).count():
-                        avu, _ = AvailableForUsers.objects.get_or_create(promo_code=promo_code)
-                        avu.user.add(obj)
-                    count_users += 1
-                    sentry_sdk.capture_message(f'Применен промокод: {promo_code.code}. Пользователь - {obj.email}')
-                    mess = f"/apply_promocode?promocode_str={promo_code}&tariff={tariff_id}"
-                    type_mess = messages.SUCCESS
-                else:
-                    if count_users:
-                        mess = f"/apply_promocode?promocode_str={promo_code}&tariff={tariff_id} -----> Применено промокодов: {count_users}"
-
-                        type_mess = messages.WARNING
-                    else:
-                        mess = "Количество допустимых применений промокода равно 0"
-                        type_mess = messages.ERROR
-                    break
-            self.message_user(request, mess, type_mess)
+            if promo_code.num_uses <= 0:
+                self.message_user(request, "Количество допустимых применений промокода равно 0", messages.ERROR)
+                return
+            # Доступ выдаётся одним запросом и увеличивает num_uses промокода,
+            # кэши loyalty сбрасывает триггер на таблице доступов
+            count_users = AvailableForUsers.grant(promo_code, queryset)
+            sentry_sdk.capture_message(f'Применен промокод: {promo_code.code}. Пользователей - {count_users}')
+            self.message_user(
+                request,
+                f"/apply_promocode?promocode_str={promo_code}&tariff={tariff_id} -----> Применено промокодов: {count_users}",
+                messages.SUCCESS,
+            )
         except Exception as e:
             sentry_sdk.capture_exception(e)
             self.message_user(
@@ -112,11 +87,10 @@ class User(admin.ModelAdmin):
     @admin.action(description="Удалить")
     def delete_selected(self, request, queryset):
         try:
-            for obj in queryset:
-                obj.is_active = False
-                obj.save()
+            count = queryset.update(is_active=False)
+            sentry_sdk.capture_message(f'Удалено пользователей: {count}')
             self.message_user(
-                request, f"{len(queryset)} пользователь(ей) удалено", messages.SUCCESS
+                request, f"{count} пользователь(ей) удалено", messages.SUCCESS
             )
         except Exception as e:
             sentry_sdk.capture_exception(e)
@@ -0,0 +1,27 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='user',
+            name='purchase_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Количество использованных промокодов'),
+        ),
+        migrations.AddField(
+            model_name='user',
+            name='available_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Количество доступных промокодов'),
+        ),
+        # Пользователей создают и другие сервисы, им нужно значение по умолчанию в самой базе
+        migrations.RunSQL(
+            'ALTER TABLE "user" ALTER COLUMN purchase_count SET DEFAULT 0, '
+            'ALTER COLUMN available_count SET DEFAULT 0;',
+            reverse_sql=migrations.RunSQL.noop,
+        ),
+    ]
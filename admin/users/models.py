@@ -34,6 +34,13 @@ class User(models.Model):
         verbose_name="Группы",
         blank=True)
     is_active = models.BooleanField(default=True)
+    # Поддерживаются триггерами на покупках и доступах (миграция promocodes.0003_counters)
+    purchase_count = models.PositiveIntegerField(
+        verbose_name="Количество использованных промокодов", default=0, editable=False
+    )
+    available_count = models.PositiveIntegerField(
+        verbose_name="Количество доступных промокодов", default=0, editable=False
+    )
 
     class Meta:
         db_table = "user"
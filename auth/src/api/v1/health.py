@@ -0,0 +1,15 @@
+from fastapi import APIRouter
+
+from services.password_hasher import password_hasher
+from services.login_audit import login_audit
+
+router = APIRouter()
+
+
+@router.get("/health",
+            summary="Состояние сервиса",
+            description="Загрузка пула хеширования паролей и очередь записи истории авторизаций воркера",
+            response_description="Очереди и статистика хеширования паролей и записи истории авторизаций",
+            tags=["Сервис"])
+async def health() -> dict:
+    return {"status": "ok", "password_hasher": password_hasher.stats(), "login_audit": login_audit.stats()}
@@ -0,0 +1,29 @@
+from fastapi import APIRouter, Response
+
+from services.jwt_keys import key_ring
+from services.rbac import rbac_snapshot
+
+router = APIRouter()
+
+
+@router.get("/jwks.json",
+            summary="Открытые ключи подписи токенов",
+            description="JWKS для локальной проверки токенов другими сервисами",
+            response_description="Набор открытых ключей RS256 с идентификаторами kid",
+            tags=["Сервис"])
+async def jwks() -> Response:
+    return Response(
+        content=key_ring.jwks,
+        media_type="application/json",
+        headers={"Cache-Control": "public, max-age=300"},
+    )
+
+
+@router.get("/permissions.json",
+            summary="Реестр битов разрешений",
+            description="Номера битов разрешений в маске perm access токена",
+            response_description="Версия реестра и номера битов по именам разрешений",
+            tags=["Сервис"])
+async def permission_registry() -> dict:
+    await rbac_snapshot.ensure_loaded()
+    return {"version": rbac_snapshot.registry_version, "permissions": rbac_snapshot.permission_bits}
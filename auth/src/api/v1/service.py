@@ -4,18 +4,30 @@ import sentry_sdk
 from api.v1.schemas.auth import TokenParams
 from pydantic import BaseModel, Field
 from functools import wraps
-from typing import Union
+from typing import Optional, Union
 
 from services.role import RoleService
 from services.permission import PermissionService
-from services.utils import decode_jwt, check_date_and_type_token
+from services.utils import decode_jwt, check_date_and_type_token, ACCESS_TOKEN_TYPE
 from services.user import UserService, get_user_service
+from models.auth import AccessClaims
 from models.value_objects import Role_names
 
 
 class PaginationParams(BaseModel):
     page_number: int = Field(1, ge=1)
     page_size: int = Field(1, ge=1)
+    # Курсор из заголовка X-Next-Cursor предыдущей страницы, вместо page_number
+    cursor: Optional[str] = None
+
+
+class AuthContext(BaseModel):
+    """Токены из cookie и claims access токена, проверенного один раз за запрос."""
+
+    access_token: str
+    refresh_token: str
+    payload: dict
+    claims: AccessClaims
 
 
 def get_tokens_from_cookie(request: Request) -> TokenParams:
@@ -32,46 +44,55 @@ def get_tokens_from_cookie(request: Request) -> TokenParams:
         )
 
 
-async def check_jwt(request: Request, service: UserService = Depends(get_user_service)):
+def get_auth_context(request: Request) -> AuthContext:
+    """
+    Контекст авторизации запроса. Подпись access токена проверяется при первом
+    обращении, дальше зависимости и сервисы берут контекст из request.state.
+    """
+    context = getattr(request.state, "auth", None)
+    if context is None:
+        tokens = get_tokens_from_cookie(request)
+        payload = decode_jwt(jwt_token=tokens.access_token)
+        context = AuthContext(
+            access_token=tokens.access_token,
+            refresh_token=tokens.refresh_token,
+            payload=payload,
+            claims=AccessClaims(**payload),
+        )
+        request.state.auth = context
+    return context
+
+
+async def check_jwt(request: Request, service: UserService = Depends(get_user_service)) -> AuthContext:
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
     )
     try:
-        tokens = get_tokens_from_cookie(request)
-        payload = decode_jwt(jwt_token=tokens.access_token)
-        if check_date_and_type_token(payload, "access"):
+        context = get_auth_context(request)
+        if check_date_and_type_token(context.payload, ACCESS_TOKEN_TYPE):
             # проверка access токена в блэк листе redis
-            if not await service.get_from_black_list(tokens.access_token):
-                return payload
+            if not await service.get_from_black_list(context.access_token, context.payload):
+                return context
         raise credentials_exception
     except Exception as e:
         sentry_sdk.capture_exception(e)
         raise credentials_exception from e
 
 
-async def is_admin(payload: dict) -> bool:
-    """Проверка, является ли пользователь администратором, используя расшифрованный payload."""
-    user_is_admin = payload.get("is_admin")
-    return user_is_admin
+async def is_admin(claims: AccessClaims) -> bool:
+    """Проверка, является ли пользователь администратором, по claims токена."""
+    return claims.is_admin
 
 
-async def is_superuser(payload: dict) -> bool:
-    """Проверка, является ли пользователь суперпользователем, используя расшифрованный payload."""
-    user_is_superuser = payload.get("is_superuser")
-    return user_is_superuser
+async def is_superuser(claims: AccessClaims) -> bool:
+    """Проверка, является ли пользователь суперпользователем, по claims токена."""
+    return claims.is_superuser
 
 
-async def has_permission(access_token: str) -> bool:
+async def has_permission(claims: AccessClaims) -> bool:
     """Проверка разрешений пользователя на основе токена."""
-    try:
-        payload = decode_jwt(jwt_token=access_token)
-        if await is_admin(payload):
-            return True
-        return False
-    except Exception as e:
-        sentry_sdk.capture_exception(e)
-        return False
+    return await is_admin(claims)
 
 
 def allow_this_user(function):
@@ -83,14 +104,13 @@ def allow_this_user(function):
         )
         user_id = kwargs.get("user_id", None)
         try:
-            tokens = get_tokens_from_cookie(request)
-            payload = decode_jwt(jwt_token=tokens.access_token)
-            check_superuser = await is_superuser(payload)
+            claims = get_auth_context(request).claims
+            check_superuser = await is_superuser(claims)
 
             if check_superuser:
                 return await function(*args, **kwargs)
 
-            has_perm = await has_permission(tokens.access_token)
+            has_perm = await has_permission(claims)
             if has_perm:
                 if user_id:
                     user_role = await service.get_user_role(user_id)
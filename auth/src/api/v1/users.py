@@ -16,7 +16,7 @@ from api.v1.schemas.roles import PermissionsParams
 from services.user import UserService, get_user_service
 from services.auth import AuthService, get_auth_service
 from services.broker_service import BrokerService, get_broker_service
-from .service import get_tokens_from_cookie, PaginationParams
+from .service import get_auth_context, PaginationParams
 from models.broker import EventType, UserResponce
 
 router = APIRouter()
@@ -125,9 +125,9 @@ async def change_user_info(
     user_service: UserService = Depends(get_user_service),
 ) -> UserSchema:
     try:
-        tokens = get_tokens_from_cookie(request)
+        auth = get_auth_context(request)
         change_user = await user_service.change_user_info(
-            tokens.access_token, user_params
+            auth.access_token, user_params, auth.payload
         )
         return UserSchema(
             uuid=str(change_user.id),
@@ -163,12 +163,12 @@ async def delete_user(
     broker_service: BrokerService = Depends(get_broker_service)
 ) -> bool:
     try:
-        tokens = get_tokens_from_cookie(request)
+        auth = get_auth_context(request)
         user_params = {'first_name': None, 'last_name': None, 'active': False}
-        change_user = await user_service.change_user_info(tokens.access_token, user_params)
+        change_user = await user_service.change_user_info(auth.access_token, user_params, auth.payload)
         user_responce = UserResponce(uuid=str(change_user.id), email=change_user.email, is_active=False)
         await user_service.logout(
-            access_token=tokens.access_token, refresh_token=tokens.refresh_token
+            access_token=auth.access_token, refresh_token=auth.refresh_token, payload=auth.payload
         )
         await broker_service.put_one_message_to_queue(event=EventType.delete, user=user_responce)
         return True
@@ -194,9 +194,9 @@ async def logout(
     request: Request, user_service: UserService = Depends(get_user_service)
 ) -> bool:
     try:
-        tokens = get_tokens_from_cookie(request)
+        auth = get_auth_context(request)
         return await user_service.logout(
-            access_token=tokens.access_token, refresh_token=tokens.refresh_token
+            access_token=auth.access_token, refresh_token=auth.refresh_token, payload=auth.payload
         )
     except Exception as e:
         sentry_sdk.capture_exception(e)
@@ -221,9 +221,9 @@ async def refresh_token(
     request: Request, user_service: UserService = Depends(get_user_service)
 ) -> TokenSchema:
     try:
-        tokens = get_tokens_from_cookie(request)
+        auth = get_auth_context(request)
         new_tokens = await user_service.refresh_access_token(
-            tokens.access_token, tokens.refresh_token
+            auth.access_token, auth.refresh_token, auth.payload
         )
         response = Response()
         response.set_cookie("access_token", new_tokens.access_token)
@@ -243,23 +243,38 @@ async def refresh_token(
     response_model=list[AuthenticationSchema],
     status_code=status.HTTP_200_OK,
     summary="История авторизаций",
-    description="Запрос истории авторизаций пользователя",
+    description="Запрос истории авторизаций пользователя от новых к старым. "
+                "Курсор следующей страницы возвращается в заголовке X-Next-Cursor. "
+                "Вход появляется в истории после записи журнала, обычно в пределах секунды",
     response_description="Ид, ид пользователя, юзер агент, дата аутентификации",
     tags=["Пользователи"],
     dependencies=[Depends(check_jwt)],
 )
 async def get_login_history(
     request: Request,
+    response: Response,
     auth_service: Annotated[AuthService, Depends(get_auth_service)],
     pagination_params: Annotated[PaginationParams, Depends()],
 ) -> list[AuthenticationSchema]:
     try:
-        tokens = get_tokens_from_cookie(request)
-        auth_data = await auth_service.login_history(
-            tokens.access_token,
-            pagination_params.page_size,
-            pagination_params.page_number,
-        )
+        auth = get_auth_context(request)
+        if pagination_params.cursor or pagination_params.page_number == 1:
+            auth_data, next_cursor = await auth_service.login_history_page(
+                auth.access_token,
+                pagination_params.page_size,
+                pagination_params.cursor,
+                auth.payload,
+            )
+            if next_cursor:
+                response.headers["X-Next-Cursor"] = next_cursor
+        else:
+            # Переход по номеру страницы оставлен для старых клиентов
+            auth_data = await auth_service.login_history(
+                auth.access_token,
+                pagination_params.page_size,
+                pagination_params.page_number,
+                auth.payload,
+            )
 
         list_auth_scheme = []
         for item in auth_data:
@@ -271,6 +286,8 @@ async def get_login_history(
             )
             list_auth_scheme.append(auth_scheme)
         return list_auth_scheme
+    except HTTPException:
+        raise
     except Exception as e:
         sentry_sdk.capture_exception(e)
         raise HTTPException(
@@ -296,9 +313,9 @@ async def check_permission(
     user_service: UserService = Depends(get_user_service),
 ) -> bool:
     try:
-        tokens = get_tokens_from_cookie(request)
+        auth = get_auth_context(request)
         return await user_service.check_permissions(
-            tokens.access_token, permission_params.name
+            auth.access_token, permission_params.name, auth.payload
         )
     except Exception as e:
         sentry_sdk.capture_exception(e)
@@ -1,4 +1,5 @@
 import os
+from typing import Optional
 
 from pydantic import BaseModel
 from pydantic_settings import BaseSettings
@@ -7,8 +8,10 @@ from fastapi.security import OAuth2PasswordBearer
 
 
 class AuthJWT(BaseModel):
-    secret_key: str = "secret-key"
-    algorithm: str = "HS256"
+    # Каталог с закрытыми ключами подписи <kid>.pem и ключ, которым подписываются новые токены
+    keys_dir: str = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "keys")
+    active_kid: Optional[str] = None
+    algorithm: str = "RS256"
     access_token_expire_minutes: int = 20 * 60
     refresh_token_expire_minutes: int = 30 * 24 * 60 * 60  # 30 дней
 
@@ -33,6 +36,25 @@ class Settings(BaseSettings):
     # Настройки jwt
     auth_jwt: AuthJWT = AuthJWT()
     pwd_context: CryptContext = CryptContext(schemes=["bcrypt"], deprecated="auto")
+    # Пул процессов для bcrypt на каждый воркер и число задач, одновременно переданных в пул
+    password_hash_processes: int = 1
+    password_hash_max_in_flight: int = 4
+    # Локальная копия чёрного списка токенов: сколько секунд без чтения потока
+    # отзывов ей можно доверять и сколько событий хранится в потоке
+    revocation_max_staleness: float = 5.0
+    revocation_stream_max_len: int = 100_000
+    # Снимок ролей и разрешений: период сверки версии в Redis и полной перезагрузки
+    rbac_refresh_interval: float = 1.0
+    rbac_max_age: float = 60.0
+    # Месячные разделы истории авторизаций: на сколько месяцев вперёд создаются
+    # и сколько месяцев хранятся присоединёнными (None - не отсоединять)
+    login_history_partitions_ahead: int = 2
+    login_history_retention_months: Optional[int] = None
+    login_history_maintenance_interval: float = 6 * 60 * 60
+    # Отложенная запись истории авторизаций: период и размер пачки, предел очереди воркера
+    login_audit_flush_interval: float = 1.0
+    login_audit_batch_size: int = 500
+    login_audit_max_queue: int = 100_000
     oauth2_scheme: OAuth2PasswordBearer = OAuth2PasswordBearer(tokenUrl="token")
 
     # Настройки rabbit
@@ -15,19 +15,31 @@ from aio_pika import connect_robust
 from aio_pika.exceptions import AMQPConnectionError
 from backoff import on_exception, expo
 
-from api.v1 import users, roles, permissions
+from api.v1 import users, roles, permissions, health, jwks
 from db import postgres_db
 from db import redis_db
 from core.config import settings
 from api.v1.service import check_jwt
 from services.broker_service import broker_service
+from services.jwt_keys import key_ring
+from services.password_hasher import password_hasher
+from services.revocation import revocation_list
+from services.rbac import rbac_snapshot
+from services.login_history_partitions import login_history_partitions
+from services.login_audit import login_audit
 from models.broker import EventType
 
 
 @on_exception(expo, (AMQPConnectionError, ConnectionError), max_tries=10)
 @asynccontextmanager
 async def lifespan(app: FastAPI):
+    key_ring.load()
     redis_db.redis = Redis(host=settings.redis_host, port=settings.redis_port)
+    password_hasher.start()
+    revocation_list.start(redis_db.redis)
+    rbac_snapshot.start(redis_db.redis)
+    login_history_partitions.start()
+    login_audit.start()
     broker_service.connection = await connect_robust(settings.rabbit_connection)
     broker_service.channel = await broker_service.connection.channel()
     broker_service.exchange = await broker_service.channel.declare_exchange(settings.rabbit_exchange, durable=True)
@@ -35,6 +47,11 @@ async def lifespan(app: FastAPI):
         queue = await broker_service.channel.declare_queue(name=queue_name.value, durable=True)
         await queue.bind(broker_service.exchange)
     yield
+    await login_audit.stop()
+    password_hasher.stop()
+    await revocation_list.stop()
+    await rbac_snapshot.stop()
+    await login_history_partitions.stop()
     await redis_db.redis.close()
     await broker_service.channel.close()
     await broker_service.connection.close()
@@ -81,6 +98,8 @@ class StandaloneApplication(gunicorn.app.base.BaseApplication):
 
 
 app.include_router(users.router, prefix="/auth/api/v1/users")
+app.include_router(health.router, prefix="/auth/api/v1")
+app.include_router(jwks.router, prefix="/auth/api/v1")
 app.include_router(
     roles.router, prefix="/auth/api/v1/roles", dependencies=[Depends(check_jwt)]
 )
@@ -125,7 +144,7 @@ async def create_superuser(email, password):
         # Создаем суперпользователя
         superuser_data = {
             "email": email,
-            "password": password,
+            "password": await password_hasher.hash(password),
             "is_staff": True,
             "active": True,
             "is_superuser": True,
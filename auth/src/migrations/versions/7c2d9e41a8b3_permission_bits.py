@@ -0,0 +1,32 @@
+"""permission bits
+
+Revision ID: 7c2d9e41a8b3
+Revises: e00a5d5cfe7b
+Create Date: 2026-10-18 12:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision: str = '7c2d9e41a8b3'
+down_revision: Union[str, None] = 'e00a5d5cfe7b'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # Номер бита разрешения в маске токена: выдаётся последовательностью и не переиспользуется
+    op.execute(sa.schema.CreateSequence(sa.Sequence('permissions_bit_seq', start=0, minvalue=0)))
+    op.add_column('permissions', sa.Column(
+        'bit', sa.Integer(), server_default=sa.text("nextval('permissions_bit_seq')"), nullable=False
+    ))
+    op.create_unique_constraint('permissions_bit_key', 'permissions', ['bit'])
+
+
+def downgrade() -> None:
+    op.drop_constraint('permissions_bit_key', 'permissions', type_='unique')
+    op.drop_column('permissions', 'bit')
+    op.execute(sa.schema.DropSequence(sa.Sequence('permissions_bit_seq')))
@@ -0,0 +1,122 @@
+"""partition authentication by month
+
+Revision ID: b5e8f3a1c6d2
+Revises: 7c2d9e41a8b3
+Create Date: 2026-10-18 13:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision: str = 'b5e8f3a1c6d2'
+down_revision: Union[str, None] = '7c2d9e41a8b3'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+# Раздел месяца создаётся отдельной таблицей, в неё переносятся строки этого
+# месяца из раздела по умолчанию, и только потом она присоединяется
+CREATE_PARTITION_FUNCTION = """
+CREATE OR REPLACE FUNCTION authentication_create_partition(month_start date) RETURNS void AS $$
+DECLARE
+    partition_name text := format('authentication_%s', to_char(month_start, 'YYYY_MM'));
+    lower_bound timestamp := date_trunc('month', month_start);
+    upper_bound timestamp := date_trunc('month', month_start) + interval '1 month';
+BEGIN
+    PERFORM pg_advisory_xact_lock(hashtext('authentication_partitions'));
+    IF to_regclass(partition_name) IS NOT NULL THEN
+        RETURN;
+    END IF;
+    EXECUTE format('CREATE TABLE %I (LIKE authentication INCLUDING DEFAULTS INCLUDING CONSTRAINTS)', partition_name);
+    EXECUTE format(
+        'WITH moved AS (DELETE FROM authentication_default WHERE date_auth >= %L AND date_auth < %L RETURNING *) '
+        'INSERT INTO %I SELECT * FROM moved',
+        lower_bound, upper_bound, partition_name
+    );
+    EXECUTE format(
+        'ALTER TABLE authentication ATTACH PARTITION %I FOR VALUES FROM (%L) TO (%L)',
+        partition_name, lower_bound, upper_bound
+    );
+END;
+$$ LANGUAGE plpgsql;
+"""
+
+# Отсоединение раздела меняет только каталог; таблица остаётся для архива или удаления.
+# В Postgres 13 нет DETACH CONCURRENTLY: обычный DETACH берёт ACCESS EXCLUSIVE на
+# authentication до конца транзакции, поэтому её держат короткой и с lock_timeout
+DETACH_PARTITIONS_FUNCTION = """
+CREATE OR REPLACE FUNCTION authentication_detach_partitions(older_than date) RETURNS SETOF text AS $$
+DECLARE
+    detached record;
+BEGIN
+    PERFORM pg_advisory_xact_lock(hashtext('authentication_partitions'));
+    FOR detached IN
+        SELECT child.relname
+        FROM pg_inherits
+        JOIN pg_class child ON child.oid = pg_inherits.inhrelid
+        WHERE pg_inherits.inhparent = 'authentication'::regclass
+          AND child.relname ~ '^authentication_[0-9]{4}_[0-9]{2}$'
+          AND to_date(substring(child.relname from 16), 'YYYY_MM') + interval '1 month' <= older_than
+        ORDER BY child.relname
+    LOOP
+        EXECUTE format('ALTER TABLE authentication DETACH PARTITION %I', detached.relname);
+        RETURN NEXT detached.relname;
+    END LOOP;
+END;
+$$ LANGUAGE plpgsql;
+"""
+
+
+def upgrade() -> None:
+    op.execute("ALTER TABLE authentication RENAME TO authentication_old")
+    op.execute("ALTER INDEX authentication_pkey RENAME TO authentication_old_pkey")
+    op.execute("""
+        CREATE TABLE authentication (
+            id uuid NOT NULL,
+            user_id uuid NOT NULL REFERENCES users (id) ON DELETE CASCADE,
+            user_agent varchar(255) NOT NULL,
+            date_auth timestamp NOT NULL,
+            CONSTRAINT authentication_pkey PRIMARY KEY (id, date_auth)
+        ) PARTITION BY RANGE (date_auth)
+    """)
+    # История пользователя читается от новых записей к старым по ключу (date_auth, id)
+    op.execute("CREATE INDEX authentication_user_id_date_auth_idx ON authentication (user_id, date_auth, id)")
+    op.execute("CREATE TABLE authentication_default PARTITION OF authentication DEFAULT")
+    op.execute(CREATE_PARTITION_FUNCTION)
+    op.execute(DETACH_PARTITIONS_FUNCTION)
+    op.execute("""
+        SELECT authentication_create_partition(month_start::date)
+        FROM generate_series(
+            date_trunc('month', LEAST((SELECT min(date_auth) FROM authentication_old), now())),
+            date_trunc('month', now()) + interval '2 months',
+            interval '1 month'
+        ) AS month_start
+    """)
+    op.execute("""
+        INSERT INTO authentication (id, user_id, user_agent, date_auth)
+        SELECT id, user_id, user_agent, date_auth FROM authentication_old
+    """)
+    op.execute("DROP TABLE authentication_old")
+
+
+def downgrade() -> None:
+    op.execute("ALTER TABLE authentication RENAME TO authentication_partitioned")
+    op.execute("ALTER INDEX authentication_pkey RENAME TO authentication_partitioned_pkey")
+    op.execute("""
+        CREATE TABLE authentication (
+            id uuid NOT NULL,
+            user_id uuid NOT NULL REFERENCES users (id) ON DELETE CASCADE,
+            user_agent varchar(255) NOT NULL,
+            date_auth timestamp NOT NULL,
+            CONSTRAINT authentication_pkey PRIMARY KEY (id)
+        )
+    """)
+    op.execute("""
+        INSERT INTO authentication (id, user_id, user_agent, date_auth)
+        SELECT id, user_id, user_agent, date_auth FROM authentication_partitioned
+    """)
+    op.execute("DROP TABLE authentication_partitioned")
+    op.execute("DROP FUNCTION authentication_detach_partitions(date)")
+    op.execute("DROP FUNCTION authentication_create_partition(date)")
@@ -1,4 +1,5 @@
 from datetime import datetime, timezone
+from typing import Optional
 
 from pydantic import BaseModel
 
@@ -20,3 +21,19 @@ class Tokens(BaseModel):
     access_token: str
     refresh_token: str
     token_type: str = "Bearer"
+
+
+class AccessClaims(BaseModel):
+    """Модель claims проверенного access токена."""
+
+    sub: str
+    self_uuid: str
+    type: str
+    exp: float
+    iat: float
+    role_id: Optional[str] = None
+    is_admin: bool = False
+    is_superuser: bool = False
+    # Маска разрешений (hex) и версия реестра битов
+    perm: Optional[str] = None
+    pv: int = 0
@@ -2,12 +2,12 @@
 import uuid
 from datetime import datetime
 
-from sqlalchemy import Boolean, DateTime, String, ForeignKey
+from sqlalchemy import Boolean, DateTime, Integer, Sequence, String, ForeignKey
 from sqlalchemy.dialects.postgresql import UUID
 from sqlalchemy.orm import Mapped, mapped_column, relationship
 
 from db.postgres_db import Base
-from services.utils import hash_password, validate_password
+from services.password_hasher import password_hasher
 
 
 class Roles(Base):
@@ -30,6 +30,10 @@ class Permissions(Base):
         UUID(as_uuid=True), primary_key=True, default=uuid.uuid4
     )
     name: Mapped[str] = mapped_column(String, nullable=False, unique=True)
+    # Номер бита разрешения в маске access токена, не переиспользуется после удаления
+    bit: Mapped[int] = mapped_column(
+        Integer, Sequence("permissions_bit_seq", start=0, minvalue=0), nullable=False, unique=True
+    )
     role_id: Mapped[int] = mapped_column(
         ForeignKey("roles.id", ondelete="CASCADE"), default=None, nullable=True
     )
@@ -69,34 +73,35 @@ class User(Base):
         is_staff: bool = False,
         is_superuser: bool = False,
     ) -> None:
+        # Пароль передаётся уже захешированным через password_hasher
         self.email = email
-        self.password = hash_password(password)
+        self.password = password
         self.first_name = first_name
         self.last_name = last_name
         self.active = active
         self.is_staff = is_staff
         self.is_superuser = is_superuser
 
-    def check_password(self, password: str) -> bool:
-        return validate_password(self.password, password)
+    async def check_password(self, password: str) -> bool:
+        return await password_hasher.verify(password, self.password)
 
     def __repr__(self) -> str:
         return f"<User {self.email}>"
 
 
 class Authentication(Base):
+    # Таблица секционирована по месяцам date_auth, поэтому он входит в первичный ключ
     __tablename__ = "authentication"
 
     id: Mapped[UUID] = mapped_column(
         UUID(as_uuid=True),
         primary_key=True,
         default=uuid.uuid4,
-        unique=True,
         nullable=False,
     )
     user_id: Mapped[UUID] = mapped_column(ForeignKey("users.id", ondelete="CASCADE"))
     user_agent: Mapped[str] = mapped_column(String(255), nullable=False)
-    date_auth: Mapped[DateTime] = mapped_column(DateTime, default=datetime.now)
+    date_auth: Mapped[DateTime] = mapped_column(DateTime, primary_key=True, default=datetime.now)
 
     def __repr__(self) -> str:
         return f"<Authentication {self.id}>"
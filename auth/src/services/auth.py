@@ -1,15 +1,33 @@
+import base64
+import uuid
+from datetime import datetime
 from fastapi import Depends, HTTPException, status
 from functools import lru_cache
+from typing import Optional, Tuple
 from sqlalchemy.ext.asyncio import AsyncSession
 import sentry_sdk  # Импортируем Sentry SDK
 
 from models.entity import Authentication
 from .base_service import BaseService
+from .login_audit import login_audit
 from .utils import decode_jwt
 from db.postgres_db import get_session
 from db.redis_db import RedisCache, get_redis
 
 
+def encode_cursor(auth: Authentication) -> str:
+    """Курсор следующей страницы истории: ключ (date_auth, id) последней записи."""
+    return base64.urlsafe_b64encode(f"{auth.date_auth.isoformat()}|{auth.id}".encode()).decode()
+
+
+def decode_cursor(cursor: str) -> tuple:
+    try:
+        date_auth, auth_id = base64.urlsafe_b64decode(cursor.encode()).decode().split("|")
+        return datetime.fromisoformat(date_auth), uuid.UUID(auth_id)
+    except ValueError:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="invalid cursor")
+
+
 class AuthService(BaseService):
     def __init__(self, cache: RedisCache, storage: AsyncSession):
         super().__init__(cache, storage)
@@ -17,17 +35,17 @@ class AuthService(BaseService):
 
     async def new_auth(self, auth_params) -> None:
         try:
-            # добавление в бд pg данных об аутентификации модель Authentication
-            await self.create_new_instance(auth_params)
+            # запись об аутентификации попадает в Postgres пачкой после ответа на вход
+            login_audit.submit(auth_params.user_id, auth_params.user_agent)
         except Exception as e:
             sentry_sdk.capture_exception(e)
             raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="Internal server error")
 
     async def login_history(
-        self, access_token: str, limit: int = 10, page_number: int = 1
+        self, access_token: str, limit: int = 10, page_number: int = 1, payload: Optional[dict] = None
     ) -> list[Authentication]:
         try:
-            payload = decode_jwt(jwt_token=access_token)
+            payload = payload or decode_jwt(jwt_token=access_token)
             user_uuid = payload.get("sub")
             # получить историю авторизаций по id_user_history модель Authentication
             auths_list = await self.get_login_history(
@@ -45,6 +63,27 @@ class AuthService(BaseService):
             sentry_sdk.capture_exception(e)
             raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="Internal server error")
 
+    async def login_history_page(
+        self, access_token: str, limit: int = 10, cursor: Optional[str] = None, payload: Optional[dict] = None
+    ) -> Tuple[list[Authentication], Optional[str]]:
+        """Страница истории авторизаций по курсору и курсор следующей страницы."""
+        try:
+            payload = payload or decode_jwt(jwt_token=access_token)
+            after = decode_cursor(cursor) if cursor else None
+            auths_list = await self.get_login_history_after(payload.get("sub"), limit=limit, after=after)
+            if auths_list is None:
+                raise HTTPException(
+                    status_code=status.HTTP_404_NOT_FOUND, detail="user not found"
+                )
+            next_cursor = encode_cursor(auths_list[-1]) if len(auths_list) == limit else None
+            return auths_list, next_cursor
+        except HTTPException as e:
+            sentry_sdk.capture_exception(e)
+            raise
+        except Exception as e:
+            sentry_sdk.capture_exception(e)
+            raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="Internal server error")
+
 
 @lru_cache()
 def get_auth_service(
@@ -1,11 +1,13 @@
 import json
+import time
 from abc import ABC
 
+from sqlalchemy import tuple_
 from sqlalchemy.future import select
 from sqlalchemy.orm import selectinload
 from sqlalchemy.exc import DBAPIError
 from fastapi.encoders import jsonable_encoder
-from typing import Union
+from typing import Optional, Union
 import backoff
 import sentry_sdk
 from redis.exceptions import ConnectionError as conn_err_redis
@@ -16,6 +18,8 @@ from db.postgres_db import AsyncSession
 from models.entity import User, Authentication, Roles, Permissions
 from core.config import settings
 from services.utils import decode_jwt
+from services.rbac import rbac_snapshot
+from services.revocation import revocation_list
 
 
 class AbstractBaseService(ABC):
@@ -141,6 +145,7 @@ class BaseService(AbstractBaseService):
         stmt = (
             select(self.model)
             .filter(self.model.user_id == user_uuid)
+            .order_by(self.model.date_auth.desc(), self.model.id.desc())
             .offset(offset)
             .limit(limit)
         )
@@ -152,6 +157,27 @@ class BaseService(AbstractBaseService):
             sentry_sdk.capture_exception(e)
             return []
 
+    @backoff.on_exception(backoff.expo, conn_err_pg, max_tries=5)
+    async def get_login_history_after(self, user_uuid: str, limit: int = 10, after: Optional[tuple] = None):
+        """
+        Страница истории от новых записей к старым по ключу (date_auth, id):
+        after - ключ последней записи предыдущей страницы.
+        """
+        user = await self.storage.get(User, user_uuid)
+        if user is None:
+            return None
+
+        stmt = select(self.model).filter(self.model.user_id == user_uuid)
+        if after is not None:
+            stmt = stmt.filter(tuple_(self.model.date_auth, self.model.id) < tuple_(*after))
+        stmt = stmt.order_by(self.model.date_auth.desc(), self.model.id.desc()).limit(limit)
+        try:
+            result = await self.storage.execute(stmt)
+            return result.scalars().all()
+        except Exception as e:
+            sentry_sdk.capture_exception(e)
+            return []
+
     @backoff.on_exception(backoff.expo, conn_err_pg, max_tries=5)
     async def permission_to_role(self, permissions_id: str, role_id: str):
         try:
@@ -163,6 +189,7 @@ class BaseService(AbstractBaseService):
                 await self.storage.commit()
                 await self.storage.refresh(permissions)
                 await self.storage.refresh(role)
+                await rbac_snapshot.changed()
                 return role
             else:
                 return None
@@ -179,6 +206,7 @@ class BaseService(AbstractBaseService):
                 if permissions.role_id == role.id:
                     permissions.role = None
                     await self.storage.commit()
+                    await rbac_snapshot.changed()
                     return True
                 else:
                     return False
@@ -198,6 +226,7 @@ class BaseService(AbstractBaseService):
                 self.storage.add(user)
                 await self.storage.commit()
                 await self.storage.refresh(user)
+                await rbac_snapshot.changed(user.id, role.id)
                 return user
             else:
                 return None
@@ -236,6 +265,7 @@ class BaseService(AbstractBaseService):
                 self.storage.add(user)
                 await self.storage.commit()
                 await self.storage.refresh(user)
+                await rbac_snapshot.changed(user.id, None)
                 return True
             else:
                 return False
@@ -308,17 +338,19 @@ class BaseService(AbstractBaseService):
         key = "white_list:" + payload.get("self_uuid")
         await self._delete_from_cache(key)
 
-    async def add_to_black_list(self, token, token_type):
-        payload = decode_jwt(jwt_token=token)
+    async def add_to_black_list(self, token, token_type, payload: Optional[dict] = None):
+        payload = payload or decode_jwt(jwt_token=token)
         key = "black_list:" + payload.get("self_uuid")
-        expire = (
-            settings.auth_jwt.refresh_token_expire_minutes
-            if token_type == "refresh"
-            else settings.auth_jwt.access_token_expire_minutes
-        )
+        # Токен остаётся в чёрном списке до истечения его собственного срока действия
+        expire = max(int(payload.get("exp") - time.time()), 1)
         await self._put_to_cache(key, token, expire)
-
-    async def get_from_black_list(self, token):
-        payload = decode_jwt(jwt_token=token)
+        await revocation_list.revoke(payload.get("self_uuid"), payload.get("exp"))
+
+    async def get_from_black_list(self, token, payload: Optional[dict] = None):
+        payload = payload or decode_jwt(jwt_token=token)
+        # Неотозванный токен проверяется по локальной копии чёрного списка без Redis
+        revoked = revocation_list.is_revoked(payload.get("self_uuid"))
+        if revoked is not None:
+            return revoked
         key = "black_list:" + payload.get("self_uuid")
         return await self._get_from_cache(key)
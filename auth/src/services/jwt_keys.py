@@ -0,0 +1,90 @@
+import json
+import os
+from typing import Dict, Optional
+
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import rsa
+from jwt.algorithms import RSAAlgorithm
+
+from core.config import settings
+
+
+class KeyRing:
+    """
+    Ключи подписи токенов RS256.
+
+    Каждый ключ - PEM-файл <kid>.pem в каталоге keys_dir. Токены подписываются
+    ключом active_kid (по умолчанию - самым новым файлом), а в JWKS публикуются
+    открытые ключи всех файлов каталога. Ротация: положить новый ключ, сделать
+    его активным и перезапустить воркеры; старый ключ удаляется из каталога
+    после истечения выданных им токенов.
+    """
+
+    def __init__(self, keys_dir: str, active_kid: Optional[str] = None):
+        self.keys_dir = keys_dir
+        self.active_kid = active_kid
+        self.private_keys: Dict[str, rsa.RSAPrivateKey] = {}
+        self.public_keys: Dict[str, rsa.RSAPublicKey] = {}
+        self._jwks: Optional[bytes] = None
+
+    def load(self):
+        self.ensure_key()
+        files = sorted(
+            (name for name in os.listdir(self.keys_dir) if name.endswith(".pem")),
+            key=lambda name: os.path.getmtime(os.path.join(self.keys_dir, name)),
+        )
+        for name in files:
+            with open(os.path.join(self.keys_dir, name), "rb") as file:
+                key = serialization.load_pem_private_key(file.read(), password=None)
+            kid = name[:-len(".pem")]
+            self.private_keys[kid] = key
+            self.public_keys[kid] = key.public_key()
+        if self.active_kid is None or self.active_kid not in self.private_keys:
+            self.active_kid = files[-1][:-len(".pem")]
+        keys = []
+        for kid, public_key in self.public_keys.items():
+            jwk = json.loads(RSAAlgorithm.to_jwk(public_key))
+            jwk.update(kid=kid, use="sig", alg=settings.auth_jwt.algorithm)
+            keys.append(jwk)
+        self._jwks = json.dumps({"keys": keys}).encode()
+
+    def ensure_key(self):
+        """Создаёт первый ключ, если каталог пуст. Ключ создаёт один воркер, остальные читают его."""
+        os.makedirs(self.keys_dir, exist_ok=True)
+        if any(name.endswith(".pem") for name in os.listdir(self.keys_dir)):
+            return
+        key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+        pem = key.private_bytes(
+            serialization.Encoding.PEM, serialization.PrivateFormat.PKCS8, serialization.NoEncryption()
+        )
+        # Файл появляется под своим именем только целиком записанным
+        tmp_path = os.path.join(self.keys_dir, f"initial.{os.getpid()}.tmp")
+        fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        with os.fdopen(fd, "wb") as file:
+            file.write(pem)
+        try:
+            os.link(tmp_path, os.path.join(self.keys_dir, "initial.pem"))
+        except FileExistsError:
+            pass
+        finally:
+            os.unlink(tmp_path)
+
+    @property
+    def signing_key(self) -> rsa.RSAPrivateKey:
+        if not self.private_keys:
+            self.load()
+        return self.private_keys[self.active_kid]
+
+    def public_key(self, kid: Optional[str]) -> Optional[rsa.RSAPublicKey]:
+        if not self.public_keys:
+            self.load()
+        return self.public_keys.get(kid)
+
+    @property
+    def jwks(self) -> bytes:
+        if self._jwks is None:
+            self.load()
+        return self._jwks
+
+
+key_ring = KeyRing(settings.auth_jwt.keys_dir, settings.auth_jwt.active_kid)
@@ -0,0 +1,153 @@
+import asyncio
+import time
+import uuid
+from collections import deque
+from datetime import datetime
+from typing import Deque, List, Optional
+
+import sentry_sdk
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.exc import DataError, IntegrityError
+
+from core.config import settings
+from db.postgres_db import async_session
+from models.entity import Authentication
+
+USER_AGENT_MAX_LENGTH = Authentication.__table__.c.user_agent.type.length
+
+# Ошибки из-за содержимого записей: повтор пачки их не исправит
+BAD_RECORD_ERRORS = (DataError, IntegrityError)
+
+
+class LoginAuditWriter:
+    """
+    Записи о входах пользователей копятся в очереди воркера и пишутся в
+    authentication одним INSERT на пачку: по накоплении batch_size записей или
+    раз в interval секунд, поэтому вход не ждёт коммита в Postgres.
+
+    Пачка, которую не удалось записать, возвращается в начало очереди и
+    повторяется; повторная запись уже сохранённой пачки пропускается по
+    первичному ключу. Пачка, отвергнутая из-за содержимого записей (например,
+    пользователь уже удалён), делится пополам, пока плохие записи не будут
+    найдены; они откладываются в dead и не повторяются. В очереди хранится не
+    больше max_queue записей, при переполнении отбрасываются самые старые.
+    При остановке воркера очередь записывается полностью; при аварийном
+    завершении процесса незаписанные записи теряются.
+
+    История входов согласована в конечном счёте: вход виден в ней после
+    записи пачки, то есть не позже чем через interval.
+    """
+
+    def __init__(self, interval: float, batch_size: int, max_queue: int):
+        self.interval = interval
+        self.batch_size = batch_size
+        self.max_queue = max_queue
+        self._queue: Deque[dict] = deque()
+        self.dead: Deque[dict] = deque(maxlen=max_queue)
+        self._wakeup: Optional[asyncio.Event] = None
+        self._task: asyncio.Task = None
+        self.written = 0
+        self.dropped = 0
+        self.rejected = 0
+        self.failed_flushes = 0
+        self.last_flush_ms: Optional[float] = None
+
+    def start(self):
+        self._wakeup = asyncio.Event()
+        self._task = asyncio.create_task(self.run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+        # Записываем всю очередь перед остановкой воркера
+        try:
+            await self.drain()
+        except Exception as e:
+            sentry_sdk.capture_exception(e)
+
+    async def drain(self):
+        while self._queue:
+            await self.flush()
+
+    def submit(self, user_id, user_agent: str):
+        self._queue.append({
+            "id": uuid.uuid4(),
+            "user_id": user_id,
+            "user_agent": user_agent[:USER_AGENT_MAX_LENGTH],
+            "date_auth": datetime.now(),
+        })
+        if len(self._queue) > self.max_queue:
+            self._queue.popleft()
+            self.dropped += 1
+        if len(self._queue) >= self.batch_size and self._wakeup is not None:
+            self._wakeup.set()
+
+    async def run(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), self.interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            try:
+                while await self.flush() == self.batch_size:
+                    pass
+            except Exception as e:
+                self.failed_flushes += 1
+                sentry_sdk.capture_exception(e)
+
+    async def flush(self) -> int:
+        batch: List[dict] = []
+        while self._queue and len(batch) < self.batch_size:
+            batch.append(self._queue.popleft())
+        if not batch:
+            return 0
+        started = time.monotonic()
+        try:
+            rejected = await self.write(batch)
+        except BaseException:
+            # В том числе при отмене задачи: пачка будет записана при остановке
+            self._queue.extendleft(reversed(batch))
+            raise
+        self.written += len(batch) - rejected
+        self.last_flush_ms = round((time.monotonic() - started) * 1000, 2)
+        return len(batch)
+
+    async def write(self, batch: List[dict]) -> int:
+        """Записывает пачку и возвращает количество отложенных в dead записей."""
+        try:
+            async with async_session() as session:
+                await session.execute(
+                    insert(Authentication.__table__).values(batch).on_conflict_do_nothing()
+                )
+                await session.commit()
+            return 0
+        except BAD_RECORD_ERRORS as e:
+            if len(batch) == 1:
+                self.dead.append(batch[0])
+                self.rejected += 1
+                sentry_sdk.capture_exception(e)
+                return 1
+        middle = len(batch) // 2
+        return await self.write(batch[:middle]) + await self.write(batch[middle:])
+
+    def stats(self) -> dict:
+        return {
+            "queued": len(self._queue),
+            "written": self.written,
+            "dropped": self.dropped,
+            "rejected": self.rejected,
+            "failed_flushes": self.failed_flushes,
+            "last_flush_ms": self.last_flush_ms,
+        }
+
+
+login_audit = LoginAuditWriter(
+    interval=settings.login_audit_flush_interval,
+    batch_size=settings.login_audit_batch_size,
+    max_queue=settings.login_audit_max_queue,
+)
@@ -0,0 +1,84 @@
+import asyncio
+from datetime import date
+from typing import Optional
+
+import sentry_sdk
+from sqlalchemy import text
+
+from core.config import settings
+from db.postgres_db import async_session
+
+# DETACH ждёт блокировку не дольше этого: иначе очередь за ней остановит записи и чтения
+DETACH_LOCK_TIMEOUT = "5s"
+
+
+def add_months(month: date, months: int) -> date:
+    index = month.year * 12 + month.month - 1 + months
+    return date(index // 12, index % 12 + 1, 1)
+
+
+class LoginHistoryPartitions:
+    """
+    Обслуживание месячных разделов таблицы authentication.
+
+    Разделы создаются на months_ahead месяцев вперёд, чтобы записи не попадали
+    в раздел по умолчанию. При заданном retention_months разделы старше этого
+    срока отсоединяются: это изменение каталога без перезаписи данных, таблица
+    раздела остаётся для архивирования или удаления.
+
+    В Postgres 13 нет DETACH PARTITION CONCURRENTLY, поэтому отсоединение берёт
+    ACCESS EXCLUSIVE на authentication до коммита: записи и чтения истории
+    ждут его завершения. Отсоединение идёт отдельной короткой транзакцией
+    с lock_timeout; если блокировку не дали, оно повторится в следующем цикле.
+    """
+
+    def __init__(self, interval: float, months_ahead: int, retention_months: Optional[int]):
+        self.interval = interval
+        self.months_ahead = months_ahead
+        self.retention_months = retention_months
+        self._task: asyncio.Task = None
+
+    def start(self):
+        self._task = asyncio.create_task(self.run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+
+    async def run(self):
+        while True:
+            try:
+                await self.maintain()
+            except Exception as e:
+                sentry_sdk.capture_exception(e)
+            await asyncio.sleep(self.interval)
+
+    async def maintain(self):
+        current = date.today().replace(day=1)
+        async with async_session() as session:
+            for months in range(self.months_ahead + 1):
+                await session.execute(
+                    text("SELECT authentication_create_partition(:month)"),
+                    {"month": add_months(current, months)},
+                )
+            await session.commit()
+            if self.retention_months is not None:
+                await session.execute(text(f"SET LOCAL lock_timeout = '{DETACH_LOCK_TIMEOUT}'"))
+                result = await session.execute(
+                    text("SELECT authentication_detach_partitions(:older_than)"),
+                    {"older_than": add_months(current, -self.retention_months)},
+                )
+                for (partition,) in result:
+                    sentry_sdk.capture_message(f"Отсоединён раздел истории авторизаций {partition}")
+            await session.commit()
+
+
+login_history_partitions = LoginHistoryPartitions(
+    interval=settings.login_history_maintenance_interval,
+    months_ahead=settings.login_history_partitions_ahead,
+    retention_months=settings.login_history_retention_months,
+)
@@ -0,0 +1,97 @@
+import asyncio
+import multiprocessing
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Optional
+
+from fastapi import HTTPException, status
+import sentry_sdk
+
+from core.config import settings
+
+
+def _hash(password: str) -> str:
+    return settings.pwd_context.hash(password)
+
+
+def _verify(password: str, hashed_password: str) -> Optional[bool]:
+    try:
+        return settings.pwd_context.verify(password, hashed_password)
+    except ValueError:
+        # Хеш в базе повреждён или в неизвестном формате
+        return None
+
+
+class PasswordHasher:
+    """
+    Хеширует и проверяет пароли bcrypt в пуле процессов, не блокируя цикл событий.
+
+    В пул одновременно передаётся не больше max_in_flight задач, остальные ждут
+    своей очереди в воркере. Без запущенного пула (например, в CLI) вызовы
+    выполняются в потоке.
+    """
+
+    def __init__(self, processes: int, max_in_flight: int):
+        self.processes = processes
+        self.max_in_flight = max_in_flight
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self._slots: Optional[asyncio.Semaphore] = None
+        self.waiting = 0
+        self.in_flight = 0
+        self.completed = 0
+        self.busy_seconds = 0.0
+
+    def start(self):
+        # spawn: дочерние процессы не наследуют цикл событий и соединения воркера
+        self._pool = ProcessPoolExecutor(self.processes, mp_context=multiprocessing.get_context("spawn"))
+        self._slots = asyncio.Semaphore(self.max_in_flight)
+
+    def stop(self):
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+
+    async def _run(self, func, *args):
+        if self._pool is None:
+            return await asyncio.to_thread(func, *args)
+        self.waiting += 1
+        try:
+            await self._slots.acquire()
+        finally:
+            self.waiting -= 1
+        self.in_flight += 1
+        started = time.monotonic()
+        try:
+            return await asyncio.get_running_loop().run_in_executor(self._pool, func, *args)
+        finally:
+            self._slots.release()
+            self.in_flight -= 1
+            self.completed += 1
+            self.busy_seconds += time.monotonic() - started
+
+    async def hash(self, password: str) -> str:
+        return await self._run(_hash, password)
+
+    async def verify(self, password: str, hashed_password: str) -> bool:
+        result = await self._run(_verify, password, hashed_password)
+        if result is None:
+            sentry_sdk.capture_exception(Exception("Incorrect password"))
+            raise HTTPException(
+                status_code=status.HTTP_403_FORBIDDEN, detail="Incorrect password"
+            )
+        return result
+
+    def stats(self) -> dict:
+        return {
+            "processes": self.processes,
+            "waiting": self.waiting,
+            "in_flight": self.in_flight,
+            "completed": self.completed,
+            "avg_ms": round(self.busy_seconds / self.completed * 1000, 2) if self.completed else None,
+        }
+
+
+password_hasher = PasswordHasher(
+    processes=settings.password_hash_processes,
+    max_in_flight=settings.password_hash_max_in_flight,
+)
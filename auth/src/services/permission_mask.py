@@ -0,0 +1,23 @@
+from typing import Iterable, Optional
+
+# Claims access токена: маска разрешений (hex) и версия реестра битов
+PERMISSIONS_CLAIM = "perm"
+PERMISSIONS_VERSION_CLAIM = "pv"
+
+
+def permissions_mask(bits: Iterable[int]) -> int:
+    mask = 0
+    for bit in bits:
+        mask |= 1 << bit
+    return mask
+
+
+def encode_mask(mask: int) -> str:
+    return format(mask, "x")
+
+
+def has_permission_bit(encoded_mask: Optional[str], bit: Optional[int]) -> bool:
+    """Проверка бита разрешения в маске из access токена."""
+    if not encoded_mask or bit is None:
+        return False
+    return (int(encoded_mask, 16) >> bit) & 1 == 1
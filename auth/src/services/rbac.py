@@ -0,0 +1,168 @@
+import asyncio
+import time
+from typing import Dict, FrozenSet, Optional
+
+import sentry_sdk
+from redis.asyncio import Redis
+from sqlalchemy.future import select
+
+from core.config import settings
+from db.postgres_db import async_session
+from models.entity import Permissions, Roles
+from services.permission_mask import permissions_mask
+
+# Версия ролевой модели и роли пользователей, изменённые после выдачи их токенов
+RBAC_VERSION_KEY = "rbac:version"
+RBAC_USER_ROLES_KEY = "rbac:user_roles"
+RBAC_USER_ROLES_CHANGED_KEY = "rbac:user_roles:changed"
+
+# Удаляет смены ролей старше ARGV[1] атомарно, не задевая записанные заново
+PRUNE_USER_ROLES_SCRIPT = """
+local expired = redis.call('ZRANGEBYSCORE', KEYS[2], '-inf', ARGV[1])
+for _, user_id in ipairs(expired) do
+    redis.call('HDEL', KEYS[1], user_id)
+end
+redis.call('ZREMRANGEBYSCORE', KEYS[2], '-inf', ARGV[1])
+return #expired
+"""
+
+
+class RBACSnapshot:
+    """
+    Снимок ролевой модели в памяти воркера: роль -> frozenset имён разрешений
+    и битовая маска разрешений для access токена.
+
+    Проверка разрешения берёт role_id из access токена и не обращается к базе.
+    Изменения ролей и разрешений увеличивают версию в Redis. Проверка сверяет
+    её одним GET и при расхождении перечитывает снимок до ответа; фоновая
+    задача делает то же раз в interval, а без изменений - не реже раза в max_age. Смена роли пользователя сохраняется в Redis на время жизни
+    access токена: токены, выданные до смены, несут старый role_id.
+
+    Реестр битов разрешений версионируется номером старшего бита плюс один:
+    биты не переиспользуются, поэтому маска токена с версией v читается любым
+    реестром версии не меньше v.
+    """
+
+    def __init__(self, interval: float, max_age: float, user_role_ttl: float):
+        self.interval = interval
+        self.max_age = max_age
+        self.user_role_ttl = user_role_ttl
+        self.redis: Optional[Redis] = None
+        self.version: Optional[int] = None
+        self.role_permissions: Dict[str, FrozenSet[str]] = {}
+        self.role_masks: Dict[str, int] = {}
+        self.permission_bits: Dict[str, int] = {}
+        self.registry_version = 0
+        self.user_roles: Dict[str, str] = {}
+        self._loaded_at: Optional[float] = None
+        self._lock = asyncio.Lock()
+        self._task: asyncio.Task = None
+
+    def start(self, redis: Redis):
+        self.redis = redis
+        self._task = asyncio.create_task(self.run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+
+    async def run(self):
+        while True:
+            try:
+                await self.refresh()
+            except Exception as e:
+                sentry_sdk.capture_exception(e)
+            await asyncio.sleep(self.interval)
+
+    async def refresh(self):
+        async with self._lock:
+            # Версия читается до загрузки: изменения во время загрузки вызовут следующую
+            version = int(await self.redis.get(RBAC_VERSION_KEY) or 0)
+            if (
+                self._loaded_at is not None
+                and version == self.version
+                and time.monotonic() - self._loaded_at < self.max_age
+            ):
+                return
+            await self.load(version)
+
+    async def load(self, version: int):
+        async with async_session() as session:
+            roles = (await session.execute(select(Roles.id))).scalars().all()
+            rows = (await session.execute(select(Permissions.role_id, Permissions.name, Permissions.bit))).all()
+        role_permissions = {str(role_id): set() for role_id in roles}
+        permission_bits = {}
+        for role_id, name, bit in rows:
+            permission_bits[name] = bit
+            if role_id is not None:
+                role_permissions.setdefault(str(role_id), set()).add(name)
+        user_roles = await self.redis.hgetall(RBAC_USER_ROLES_KEY)
+
+        self.role_permissions = {role_id: frozenset(names) for role_id, names in role_permissions.items()}
+        self.role_masks = {
+            role_id: permissions_mask(permission_bits[name] for name in names)
+            for role_id, names in role_permissions.items()
+        }
+        self.permission_bits = permission_bits
+        self.registry_version = max(permission_bits.values(), default=-1) + 1
+        self.user_roles = {user_id.decode(): role_id.decode() for user_id, role_id in user_roles.items()}
+        self.version = version
+        self._loaded_at = time.monotonic()
+
+    async def ensure_loaded(self):
+        if self._loaded_at is None:
+            await self.refresh()
+
+    async def ensure_current(self):
+        try:
+            version = int(await self.redis.get(RBAC_VERSION_KEY) or 0)
+        except Exception as e:
+            # Без Redis отвечаем по последнему снимку
+            if self._loaded_at is None:
+                raise
+            sentry_sdk.capture_exception(e)
+            return
+        if self._loaded_at is None or version != self.version:
+            await self.refresh()
+
+    async def permissions(self, user_id: Optional[str], role_id: Optional[str]) -> FrozenSet[str]:
+        """Разрешения пользователя по claims токена с учётом смены его роли."""
+        await self.ensure_current()
+        role_id = self.user_roles.get(user_id, role_id)
+        return self.role_permissions.get(role_id or "", frozenset())
+
+    async def changed(self, user_id: Optional[str] = None, role_id: Optional[str] = None):
+        """
+        Сообщает воркерам об изменении ролевой модели; с user_id - о смене роли
+        пользователя (role_id=None - роль снята).
+        """
+        try:
+            now = time.time()
+            async with self.redis.pipeline(transaction=True) as pipe:
+                if user_id is not None:
+                    pipe.hset(RBAC_USER_ROLES_KEY, str(user_id), str(role_id or ""))
+                    pipe.zadd(RBAC_USER_ROLES_CHANGED_KEY, {str(user_id): now})
+                pipe.incr(RBAC_VERSION_KEY)
+                await pipe.execute()
+            # Смены ролей старше срока жизни access токена уже есть во всех токенах
+            await self.redis.eval(
+                PRUNE_USER_ROLES_SCRIPT,
+                2,
+                RBAC_USER_ROLES_KEY,
+                RBAC_USER_ROLES_CHANGED_KEY,
+                now - self.user_role_ttl,
+            )
+            await self.refresh()
+        except Exception as e:
+            sentry_sdk.capture_exception(e)
+
+
+rbac_snapshot = RBACSnapshot(
+    interval=settings.rbac_refresh_interval,
+    max_age=settings.rbac_max_age,
+    user_role_ttl=settings.auth_jwt.access_token_expire_minutes * 60,
+)
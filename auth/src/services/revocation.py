@@ -0,0 +1,122 @@
+import asyncio
+import time
+from typing import Dict, Optional
+
+import sentry_sdk
+from redis.asyncio import Redis
+
+from core.config import settings
+
+# Отозванные токены: ZSET self_uuid -> момент истечения токена и поток событий отзыва
+REVOKED_INDEX_KEY = "black_list:index"
+REVOKED_STREAM_KEY = "black_list:stream"
+
+
+class RevocationList:
+    """
+    Локальная копия чёрного списка токенов воркера.
+
+    При старте воркер загружает отозванные и ещё не истёкшие токены из индекса
+    в Redis, а затем читает поток событий отзыва, поэтому проверка токена, который
+    не отзывался, обходится без обращения к Redis. После разрыва чтение потока
+    продолжается с последнего прочитанного события, а если эти события уже
+    вытеснены из потока, копия загружается заново. Пока копия не загружена или
+    поток давно не читался, is_revoked возвращает None, и проверка идёт в Redis.
+    """
+
+    def __init__(self, max_staleness: float, stream_max_len: int, block_ms: int = 1000):
+        self.max_staleness = max_staleness
+        self.stream_max_len = stream_max_len
+        self.block_ms = block_ms
+        self.redis: Optional[Redis] = None
+        self._revoked: Dict[str, float] = {}
+        self._last_id: Optional[bytes] = None
+        self._synced_at = 0.0
+        self._task: asyncio.Task = None
+
+    def start(self, redis: Redis):
+        self.redis = redis
+        self._task = asyncio.create_task(self.run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+
+    async def run(self):
+        while True:
+            try:
+                if self._last_id is None or await self._missed_events():
+                    await self.load()
+                await self.follow()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                sentry_sdk.capture_exception(e)
+                await asyncio.sleep(1)
+
+    async def load(self):
+        """Загружает все отозванные и не истёкшие токены из индекса."""
+        # Позиция в потоке запоминается до чтения индекса, чтобы не пропустить отзывы
+        last = await self.redis.xrevrange(REVOKED_STREAM_KEY, count=1)
+        last_id = last[0][0] if last else b"0-0"
+        now = time.time()
+        revoked = await self.redis.zrangebyscore(REVOKED_INDEX_KEY, now, "+inf", withscores=True)
+        self._revoked = {self_uuid.decode(): exp for self_uuid, exp in revoked}
+        self._last_id = last_id
+        self._synced_at = time.monotonic()
+
+    async def _missed_events(self) -> bool:
+        """Проверяет, вытеснены ли из потока события, которые воркер ещё не прочитал."""
+        first = await self.redis.xrange(REVOKED_STREAM_KEY, count=1)
+        return bool(first) and _stream_id(first[0][0]) > _stream_id(self._last_id)
+
+    async def follow(self):
+        while True:
+            response = await self.redis.xread({REVOKED_STREAM_KEY: self._last_id}, block=self.block_ms)
+            self._synced_at = time.monotonic()
+            for _, events in response:
+                for event_id, fields in events:
+                    self._revoked[fields[b"self_uuid"].decode()] = float(fields[b"exp"])
+                    self._last_id = event_id
+            self._expire()
+
+    def _expire(self):
+        now = time.time()
+        for self_uuid in [self_uuid for self_uuid, exp in self._revoked.items() if exp < now]:
+            del self._revoked[self_uuid]
+
+    async def revoke(self, self_uuid: str, exp: float):
+        """Отзывает токен: запись в индекс и событие для остальных воркеров."""
+        self._revoked[self_uuid] = exp
+        async with self.redis.pipeline(transaction=True) as pipe:
+            pipe.zadd(REVOKED_INDEX_KEY, {self_uuid: exp})
+            pipe.zremrangebyscore(REVOKED_INDEX_KEY, "-inf", time.time())
+            pipe.xadd(
+                REVOKED_STREAM_KEY,
+                {"self_uuid": self_uuid, "exp": exp},
+                maxlen=self.stream_max_len,
+                approximate=True,
+            )
+            await pipe.execute()
+
+    def is_revoked(self, self_uuid: str) -> Optional[bool]:
+        """True или False по локальной копии, None - если копии нельзя доверять."""
+        if self._last_id is None or time.monotonic() - self._synced_at > self.max_staleness:
+            return None
+        exp = self._revoked.get(self_uuid)
+        return exp is not None and exp >= time.time()
+
+
+def _stream_id(event_id: bytes):
+    ms, seq = event_id.split(b"-")
+    return int(ms), int(seq)
+
+
+revocation_list = RevocationList(
+    max_staleness=settings.revocation_max_staleness,
+    stream_max_len=settings.revocation_stream_max_len,
+)
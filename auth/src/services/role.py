@@ -6,6 +6,7 @@ from fastapi import Depends
 import sentry_sdk
 
 from .base_service import BaseService
+from .rbac import rbac_snapshot
 from core.constains import DEFAULT_ROLE_DATA
 from models.entity import Roles
 from models.user import User
@@ -37,14 +38,18 @@ class RoleService(BaseService):
     async def create(self, role_data: dict) -> Roles:
         """Создание роли."""
         try:
-            return await self.create_new_instance(role_data)
+            role = await self.create_new_instance(role_data)
+            await rbac_snapshot.changed()
+            return role
         except Exception as e:
             sentry_sdk.capture_exception(e)
             return None
 
     async def update(self, role_id: str, update_data: dict) -> Roles:
         try:
-            return await self.change_instance_data(role_id, update_data)
+            role = await self.change_instance_data(role_id, update_data)
+            await rbac_snapshot.changed()
+            return role
         except Exception as e:
             sentry_sdk.capture_exception(e)
             return None
@@ -52,7 +57,9 @@ class RoleService(BaseService):
     async def delete(self, role_id: str) -> Roles:
         """Удаление роли."""
         try:
-            return await self.del_instance_by_id(role_id)
+            role = await self.del_instance_by_id(role_id)
+            await rbac_snapshot.changed()
+            return role
         except Exception as e:
             sentry_sdk.capture_exception(e)
             return None
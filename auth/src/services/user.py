@@ -1,10 +1,14 @@
 from fastapi import Depends, HTTPException, status
+from fastapi.encoders import jsonable_encoder
 from functools import lru_cache
+from typing import Optional
 from sqlalchemy.ext.asyncio import AsyncSession
 import sentry_sdk
 
 from models.entity import User
 from .base_service import BaseService
+from .password_hasher import password_hasher
+from .rbac import rbac_snapshot
 from models.auth import Tokens
 from .utils import (
     create_refresh_token,
@@ -34,7 +38,7 @@ class UserService(BaseService):
                 raise HTTPException(
                     status_code=status.HTTP_404_NOT_FOUND, detail="invalid email"
                 )
-            if not user.check_password(user_password):  # если пароль не совпадает
+            if not await user.check_password(user_password):  # если пароль не совпадает
                 raise HTTPException(
                     status_code=status.HTTP_403_FORBIDDEN, detail="uncorrect password"
                 )
@@ -50,14 +54,18 @@ class UserService(BaseService):
                 detail="Internal server error",
             )
 
-    async def change_user_info(self, access_token: str, user_data: dict) -> User:
+    async def change_user_info(self, access_token: str, user_data: dict, payload: Optional[dict] = None) -> User:
         try:
-            payload = self.token_decode(access_token)
+            payload = payload or self.token_decode(access_token)
             user_uuid = payload.get("sub")
 
             if check_date_and_type_token(payload, ACCESS_TOKEN_TYPE):
                 # проверка access токена в блэк листе redis
-                if not await self.get_from_black_list(access_token):
+                if not await self.get_from_black_list(access_token, payload):
+                    if not isinstance(user_data, dict):
+                        user_data = jsonable_encoder(user_data)
+                    if user_data.get("password"):
+                        user_data["password"] = await password_hasher.hash(user_data["password"])
                     user = await self.change_instance_data(user_uuid, user_data)
                     if user is None:  # если в бд пг не нашли такой uuid
                         raise HTTPException(
@@ -78,6 +86,8 @@ class UserService(BaseService):
 
     async def create_user(self, user_params) -> User:
         try:
+            user_params = jsonable_encoder(user_params)
+            user_params["password"] = await password_hasher.hash(user_params["password"])
             user = await self.create_new_instance(user_params)
             return user
         except Exception as e:
@@ -91,6 +101,7 @@ class UserService(BaseService):
         try:
             user = await self.get_validate_user(user_email, user_password)
             user_role = user.role.type if user.role else None
+            await rbac_snapshot.ensure_loaded()
             access_token = create_access_token(user, user_role)
             refresh_token = create_refresh_token(user)
 
@@ -104,9 +115,9 @@ class UserService(BaseService):
                 detail="Internal server error",
             )
 
-    async def logout(self, access_token: str, refresh_token: str) -> bool:
+    async def logout(self, access_token: str, refresh_token: str, payload: Optional[dict] = None) -> bool:
         try:
-            await self.add_to_black_list(access_token, ACCESS_TOKEN_TYPE)
+            await self.add_to_black_list(access_token, ACCESS_TOKEN_TYPE, payload)
             await self.del_from_white_list(refresh_token)
             return True
         except Exception as e:
@@ -117,7 +128,7 @@ class UserService(BaseService):
             )
 
     async def refresh_access_token(
-        self, access_token: str, refresh_token: str
+        self, access_token: str, refresh_token: str, access_payload: Optional[dict] = None
     ) -> Tokens:
         try:
             # Декодирование refresh-токена
@@ -130,10 +141,11 @@ class UserService(BaseService):
                 if await self.get_from_white_list(refresh_token):
                     # наити пользователя по user_uuid, вернуть (модель User)
                     user = await self.get_instance_by_id(user_uuid)
+                    await rbac_snapshot.ensure_loaded()
                     new_access_token = create_access_token(user, user.role)
                     new_refresh_token = create_refresh_token(user)
                     # добавить старый access токен в блэк-лист redis
-                    await self.add_to_black_list(access_token, ACCESS_TOKEN_TYPE)
+                    await self.add_to_black_list(access_token, ACCESS_TOKEN_TYPE, access_payload)
                     # удалить старый refresh токен из вайт-листа redis
                     await self.del_from_white_list(refresh_token)
                     # добавить новый refresh токен в вайт-лист redis
@@ -153,27 +165,13 @@ class UserService(BaseService):
             )
 
     async def check_permissions(
-        self, access_token: str, required_permissions: str
+        self, access_token: str, required_permissions: str, payload: Optional[dict] = None
     ) -> bool:
-        """Проверка прав доступа у пользователя."""
+        """Проверка прав доступа у пользователя по снимку ролей, без запросов к базе."""
         try:
-            payload = self.token_decode(access_token)
-            user_uuid = payload.get("sub")
-            user = await self.get_instance_by_id(user_uuid)
-            if user is None:
-                raise HTTPException(
-                    status_code=status.HTTP_401_UNAUTHORIZED,
-                    detail="user not found",
-                )
-            try:
-                user_role = await self.get_user_role(user_uuid)
-                user_permissions = [perm.name for perm in user_role.permissions]
-
-                if required_permissions not in user_permissions:
-                    return False
-                return True
-            except AttributeError:
-                return False
+            payload = payload or self.token_decode(access_token)
+            user_permissions = await rbac_snapshot.permissions(payload.get("sub"), payload.get("role_id"))
+            return required_permissions in user_permissions
         except Exception as e:
             sentry_sdk.capture_exception(e)
             raise HTTPException(
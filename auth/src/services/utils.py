@@ -6,6 +6,9 @@ from fastapi import HTTPException, status
 import sentry_sdk  # Импортируем Sentry SDK
 
 from core.config import settings
+from services.jwt_keys import key_ring
+from services.permission_mask import PERMISSIONS_CLAIM, PERMISSIONS_VERSION_CLAIM, encode_mask
+from services.rbac import rbac_snapshot
 from models.value_objects import Role_names
 
 ACCESS_TOKEN_TYPE = "access"
@@ -26,13 +29,17 @@ def create_jwt(token_type: str, token_data: dict, expire_minutes: int) -> str:
 
 
 def create_access_token(user, user_role: Role_names = Role_names.user):
-    # в теле токена хранится UUID пользователя, его роли и UUID самого токена
+    # в теле токена хранится UUID пользователя, его роли и UUID самого токена,
+    # маска разрешений роли и версия реестра битов (снимок ролей уже загружен)
+    role_id = str(user.role_id) if user.role_id else None
     payload = {
         "sub": str(user.id),  # userid
-        "role_id": str(user.role_id) if user.role_id else None,
+        "role_id": role_id,
         "self_uuid": str(uuid.uuid4()),
         "is_admin": user_role == Role_names.admin,
         "is_superuser": user.is_superuser,
+        PERMISSIONS_CLAIM: encode_mask(rbac_snapshot.role_masks.get(role_id, 0)),
+        PERMISSIONS_VERSION_CLAIM: rbac_snapshot.registry_version,
     }
     return create_jwt(
         ACCESS_TOKEN_TYPE, payload, settings.auth_jwt.access_token_expire_minutes
@@ -48,19 +55,20 @@ def create_refresh_token(user):
 
 def encode_jwt(
     payload: dict,
-    private_key: str = settings.auth_jwt.secret_key,
     algorithm: str = settings.auth_jwt.algorithm,
 ):
-    return jwt.encode(payload, private_key, algorithm)
+    return jwt.encode(payload, key_ring.signing_key, algorithm, headers={"kid": key_ring.active_kid})
 
 
 def decode_jwt(
     jwt_token: str,
-    private_key: str = settings.auth_jwt.secret_key,
     algorithm: str = settings.auth_jwt.algorithm,
 ):
     try:
-        decoded = jwt.decode(jwt_token, private_key, algorithms=[algorithm])
+        public_key = key_ring.public_key(jwt.get_unverified_header(jwt_token).get("kid"))
+        if public_key is None:
+            raise jwt.exceptions.InvalidSignatureError("Unknown signing key")
+        decoded = jwt.decode(jwt_token, public_key, algorithms=[algorithm])
     except jwt.exceptions.DecodeError:
         sentry_sdk.capture_exception(Exception("Invalid authentication credentials"))
         raise HTTPException(
@@ -86,23 +94,6 @@ def decode_jwt(
     return decoded
 
 
-def hash_password(
-    password: str,
-) -> bytes:
-    hash_pass = settings.pwd_context.hash(password)
-    return hash_pass
-
-
-def validate_password(hashed_password: bytes, password: str) -> bool:
-    try:
-        return settings.pwd_context.verify(password, hashed_password)
-    except ValueError:
-        sentry_sdk.capture_exception(Exception("Incorrect password"))
-        raise HTTPException(
-            status_code=status.HTTP_403_FORBIDDEN, detail="Incorrect password"
-        )
-
-
 def check_date_and_type_token(payload: dict, type_token_need: str) -> bool:
     try:
         type_token = payload.get("type")
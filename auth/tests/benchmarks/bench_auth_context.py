@@ -0,0 +1,75 @@
+"""
+Бенчмарк проверки access токена за один запрос к /roles от администратора.
+
+Раньше токен из cookie заново проверялся и разбирался в check_jwt, в
+allow_this_user, в has_permission и в сервисе (change_user_info) - четыре
+проверки подписи на запрос. Теперь get_auth_context проверяет токен один раз
+и сохраняет контекст в request.state. Ключ подписи создаётся во временном
+каталоге, Redis и база не нужны.
+
+Запуск (из каталога auth/src, с заполненным .env):
+    python ../tests/benchmarks/bench_auth_context.py --requests 2000
+"""
+import argparse
+import sys
+import tempfile
+import time
+import uuid
+from pathlib import Path
+
+from starlette.requests import Request
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[2] / "src"))
+
+from services.jwt_keys import key_ring  # noqa: E402
+from services.utils import create_access_token, create_refresh_token, decode_jwt  # noqa: E402
+from api.v1.service import get_auth_context  # noqa: E402
+from models.value_objects import Role_names  # noqa: E402
+
+# check_jwt, allow_this_user, has_permission и сервис
+DECODES_PER_REQUEST = 4
+
+
+class BenchUser:
+    id = uuid.uuid4()
+    role_id = uuid.uuid4()
+    is_superuser = False
+
+
+def make_request(access_token: str, refresh_token: str) -> Request:
+    cookie = f"access_token={access_token}; refresh_token={refresh_token}"
+    return Request({"type": "http", "headers": [(b"cookie", cookie.encode())]})
+
+
+def before(access_token: str, refresh_token: str):
+    make_request(access_token, refresh_token).cookies
+    for _ in range(DECODES_PER_REQUEST):
+        decode_jwt(jwt_token=access_token)
+
+
+def after(access_token: str, refresh_token: str):
+    request = make_request(access_token, refresh_token)
+    for _ in range(DECODES_PER_REQUEST):
+        get_auth_context(request).claims
+
+
+def measure(func, requests: int, *tokens) -> float:
+    started = time.perf_counter()
+    for _ in range(requests):
+        func(*tokens)
+    return (time.perf_counter() - started) / requests * 1e6
+
+
+def main(args):
+    key_ring.keys_dir = tempfile.mkdtemp()
+    access_token = create_access_token(BenchUser, Role_names.admin)
+    refresh_token = create_refresh_token(BenchUser)
+    for name, func in (("before", before), ("after", after)):
+        func(access_token, refresh_token)
+        print(f"{name}: {measure(func, args.requests, access_token, refresh_token):.1f} us/request")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=2000)
+    main(parser.parse_args())
@@ -0,0 +1,80 @@
+"""
+Бенчмарк входа под нагрузкой: задержка цикла событий во время шторма логинов.
+
+Пока идёт заданное число одновременных проверок пароля bcrypt, фоновая задача
+каждые 10 мс измеряет, на сколько опаздывает её пробуждение, - так же опаздывают
+ответы всех остальных эндпоинтов воркера. Сравниваются проверка в цикле событий
+(как было) и пул процессов services.password_hasher.
+
+Запуск (из каталога auth/src, с заполненным .env):
+    python ../tests/benchmarks/bench_login.py --logins 200 --processes 2
+"""
+import argparse
+import asyncio
+import statistics
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[2] / "src"))
+
+from core.config import settings  # noqa: E402
+from services.password_hasher import PasswordHasher  # noqa: E402
+
+PROBE_INTERVAL = 0.01
+
+
+async def probe(lags: list, done: asyncio.Event):
+    while not done.is_set():
+        started = time.perf_counter()
+        await asyncio.sleep(PROBE_INTERVAL)
+        lags.append((time.perf_counter() - started - PROBE_INTERVAL) * 1000)
+
+
+async def storm(verify, logins: int, hashed: str):
+    lags = []
+    done = asyncio.Event()
+    prober = asyncio.create_task(probe(lags, done))
+    started = time.perf_counter()
+    await asyncio.gather(*(verify("password", hashed) for _ in range(logins)))
+    elapsed = time.perf_counter() - started
+    done.set()
+    await prober
+    return logins / elapsed, lags
+
+
+async def blocking_verify(password: str, hashed: str) -> bool:
+    return settings.pwd_context.verify(password, hashed)
+
+
+def report(name: str, throughput: float, lags: list):
+    lags = sorted(lags) or [0.0]
+    p99 = lags[min(len(lags) - 1, int(len(lags) * 0.99))]
+    print(
+        f"{name:<14} {throughput:8.1f} логинов/с   задержка цикла: "
+        f"медиана {statistics.median(lags):7.1f} мс, p99 {p99:7.1f} мс, макс {lags[-1]:7.1f} мс"
+    )
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--logins", type=int, default=100)
+    parser.add_argument("--processes", type=int, default=settings.password_hash_processes)
+    parser.add_argument("--max-in-flight", type=int, default=settings.password_hash_max_in_flight)
+    args = parser.parse_args()
+
+    hashed = settings.pwd_context.hash("password")
+    report("в цикле", *await storm(blocking_verify, args.logins, hashed))
+
+    hasher = PasswordHasher(args.processes, args.max_in_flight)
+    hasher.start()
+    try:
+        # Прогрев: запуск процессов пула не входит в измерение
+        await asyncio.gather(*(hasher.verify("password", hashed) for _ in range(args.processes)))
+        report("пул процессов", *await storm(hasher.verify, args.logins, hashed))
+    finally:
+        hasher.stop()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -1,3 +1,4 @@
+import asyncio
 from http import HTTPStatus
 import uuid
 
@@ -171,10 +172,15 @@ async def test_login_history(make_post_request):
         "access_token": pytest.access_token,
         "refresh_token": pytest.refresh_token,
     }
-    response = await make_post_request(url, query_data, cookie=cookies)
-    body = await response.json()
+    # вход попадает в историю после записи журнала входов, не сразу
+    for _ in range(20):
+        response = await make_post_request(url, query_data, cookie=cookies)
+        body = await response.json()
+        assert response.status == HTTPStatus.OK
+        if body:
+            break
+        await asyncio.sleep(0.5)
 
-    assert response.status == HTTPStatus.OK
     assert len(body) == 1
 
 
@@ -0,0 +1,26 @@
+from http import HTTPStatus
+
+from fastapi import APIRouter
+from fastapi.responses import ORJSONResponse
+
+from db import tiered_cache
+from services.warmup import cache_warmer
+
+router = APIRouter()
+
+
+@router.get("/health",
+            summary="Готовность сервиса",
+            description="Готов ли воркер принимать трафик: 503, пока не завершён прогрев кэшей",
+            response_description="Статус прогрева и статистика кэшей",
+            tags=["Сервис"])
+async def health() -> ORJSONResponse:
+    cache = tiered_cache.tiered_cache
+    return ORJSONResponse(
+        status_code=HTTPStatus.OK if cache_warmer.ready else HTTPStatus.SERVICE_UNAVAILABLE,
+        content={
+            "status": "ok" if cache_warmer.ready else "warming",
+            "warmup": cache_warmer.stats,
+            "cache": cache.stats() if cache is not None else None,
+        },
+    )
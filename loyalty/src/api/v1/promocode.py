@@ -1,7 +1,7 @@
 import sentry_sdk
 
 from http import HTTPStatus
-from typing import Annotated, List
+from typing import Annotated, List, Optional
 from fastapi import APIRouter, Depends, HTTPException
 from pydantic import BaseModel, Field
 from datetime import datetime
@@ -20,11 +20,42 @@ class ApplyPromocodeRequest(BaseModel):
 
 
 class PromocodeResponse(BaseModel):
-    discount_type: str
+    discount_type: Optional[str]
     discount_value: float
     final_amount: float
 
 
+def check_promocode_status(promocode) -> None:
+    """Преобразует причину отказа в применении промокода в HTTP-ошибку."""
+    # вообще у нас python 3.9 версии используется, в котором не доступен match-case, но хорошо
+    match promocode:
+        case 'not found':
+            raise HTTPException(
+                status_code=HTTPStatus.NOT_FOUND,
+                detail="Promocode not found or expired"
+            )
+        case 'User not found':
+            raise HTTPException(
+                status_code=HTTPStatus.NOT_FOUND,
+                detail="User not found"
+            )
+        case 'not access':
+            raise HTTPException(
+                status_code=HTTPStatus.FORBIDDEN,
+                detail="You have not access to this promocode"
+            )
+        case 'expired':
+            raise HTTPException(
+                status_code=HTTPStatus.BAD_REQUEST,
+                detail="Promocode expired"
+            )
+        case 'exhausted':
+            raise HTTPException(
+                status_code=HTTPStatus.CONFLICT,
+                detail="Promocode usage limit reached"
+            )
+
+
 @router.post("/apply_promocode",
              response_model=PromocodeResponse,
              summary="Применить промокод",
@@ -38,35 +69,14 @@ async def apply_promocode(
     purchase_service: PurchaseService = Depends(get_purchase_service)
 ) -> PromocodeResponse:
     try:
-        tariff: Tariff = await purchase_service.get_instance_by_id(apply.tariff_id)
+        tariff: Tariff = await purchase_service.get_tariff(apply.tariff_id)
 
         if not tariff:
             raise HTTPException(status_code=HTTPStatus.NOT_FOUND, detail="Tariff not found")
 
         promocode = await promo_code_service.get_valid_promocode(apply.promocode, user["sub"])
-        # вообще у нас python 3.9 версии используется, в котором не доступен match-case, но хорошо
-        match promocode:
-            case 'not found':
-                raise HTTPException(
-                    status_code=HTTPStatus.NOT_FOUND,
-                    detail="Promocode not found or expired"
-                )
-            case 'User not found':
-                raise HTTPException(
-                    status_code=HTTPStatus.NOT_FOUND,
-                    detail="User not found"
-                )
-            case 'not access':
-                raise HTTPException(
-                    status_code=HTTPStatus.FORBIDDEN,
-                    detail="You have not access to this promocode"
-                )
-            case 'expired':
-                raise HTTPException(
-                    status_code=HTTPStatus.BAD_REQUEST,
-                    detail="Promocode expired"
-                )
-        final_amount = await purchase_service.calculate_final_amount(tariff.price, promocode)
+        check_promocode_status(promocode)
+        final_amount = purchase_service.calculate_final_amount(tariff.price, promocode)
 
         return PromocodeResponse(
             discount_type=promocode.discount_type,
@@ -101,6 +111,40 @@ async def get_active_promocodes(
     return result
 
 
+class QuoteOfferResponse(BaseModel):
+    code: str
+    discount_type: str
+    discount_value: float
+    final_amount: float
+
+
+class TariffQuoteResponse(BaseModel):
+    tariff_id: int
+    name: str
+    price: float
+    offers: List[QuoteOfferResponse]
+
+
+@router.get("/quote_tariffs",
+            response_model=List[TariffQuoteResponse],
+            summary="Рассчитать стоимость всех тарифов",
+            description="Рассчитать стоимость всех тарифов без промокода и с каждым активным промокодом пользователя",
+            response_description="Список тарифов со стоимостью для каждого доступного промокода",
+            tags=["Промокоды"])
+async def quote_tariffs(
+    user: Annotated[dict, Depends(security_jwt)],
+    purchase_service: PurchaseService = Depends(get_purchase_service),
+) -> List[TariffQuoteResponse]:
+    try:
+        result = await purchase_service.quote_tariffs(user["sub"])
+        if result is None:
+            raise HTTPException(status_code=HTTPStatus.NOT_FOUND, detail="User not found")
+        return result
+    except Exception as e:
+        sentry_sdk.capture_exception(e)
+        raise e
+
+
 @router.post("/use_promocode",
              response_model=PromocodeResponse,
              summary="Покупка с промокодом",
@@ -114,6 +158,7 @@ async def use_promocode(
 ) -> PromocodeResponse:
     try:
         result = await purchase_service.use_promocode(user["sub"], apply.promocode, apply.tariff_id)
+        check_promocode_status(result)
         if not result:
             raise HTTPException(status_code=HTTPStatus.NOT_FOUND, detail="Tariff not found")
         return PromocodeResponse(
@@ -126,9 +171,71 @@ async def use_promocode(
         raise e
 
 
+class ReservePromocodeResponse(PromocodeResponse):
+    reservation_id: str
+    expires_at: datetime
+
+
+@router.post("/reserve_promocode",
+             response_model=ReservePromocodeResponse,
+             summary="Забронировать промокод",
+             description="Забронировать использование промокода до оплаты. "
+                         "Бронь нужно подтвердить через /commit_promocode, иначе она истечёт",
+             response_description="Идентификатор брони, срок её действия и итоговая стоимость",
+             tags=["Промокоды"])
+async def reserve_promocode(
+    user: Annotated[dict, Depends(security_jwt)],
+    apply: Annotated[ApplyPromocodeRequest, Depends()],
+    purchase_service: PurchaseService = Depends(get_purchase_service)
+) -> ReservePromocodeResponse:
+    try:
+        result = await purchase_service.reserve_promocode(user["sub"], apply.promocode, apply.tariff_id)
+        check_promocode_status(result)
+        if not result:
+            raise HTTPException(status_code=HTTPStatus.NOT_FOUND, detail="Tariff not found")
+        return ReservePromocodeResponse(**result)
+    except Exception as e:
+        sentry_sdk.capture_exception(e)
+        raise e
+
+
+class CommitPromocodeRequest(BaseModel):
+    reservation_id: str
+
+
+class CommitPromocodeResponse(BaseModel):
+    promo_code_id: int
+    tariff_id: int
+    final_amount: float
+
+
+@router.post("/commit_promocode",
+             response_model=CommitPromocodeResponse,
+             summary="Подтвердить бронь промокода",
+             description="Подтвердить бронь после успешной оплаты и сделать запись о покупке",
+             response_description="Промокод, тариф и итоговая стоимость",
+             tags=["Промокоды"])
+async def commit_promocode(
+    user: Annotated[dict, Depends(security_jwt)],
+    commit: Annotated[CommitPromocodeRequest, Depends()],
+    purchase_service: PurchaseService = Depends(get_purchase_service)
+) -> CommitPromocodeResponse:
+    try:
+        result = await purchase_service.commit_reservation(commit.reservation_id, user["sub"])
+        if result == 'expired':
+            raise HTTPException(status_code=HTTPStatus.GONE, detail="Reservation expired")
+        if not result:
+            raise HTTPException(status_code=HTTPStatus.NOT_FOUND, detail="Reservation not found")
+        return CommitPromocodeResponse(**result)
+    except Exception as e:
+        sentry_sdk.capture_exception(e)
+        raise e
+
+
 class CancelPromocodeRequest(BaseModel):
-    promocode: int
-    purchase_id: int
+    promocode: Optional[int] = None
+    purchase_id: Optional[int] = None
+    reservation_id: Optional[str] = Field(None, description="Ид брони промокода")
 
 
 @router.post("/cancel_use_promocode",
@@ -143,11 +250,18 @@ async def cancel_use_promocode(
     purchase_service: PurchaseService = Depends(get_purchase_service),
 ) -> PromocodeResponse:
     try:
+        if cancel.reservation_id:
+            # Бронь снимается только в Redis, в Postgres её ещё нет
+            final_amount = await purchase_service.cancel_reservation(cancel.reservation_id, user["sub"])
+            if final_amount is None:
+                raise HTTPException(status_code=HTTPStatus.NOT_FOUND, detail="Reservation not found")
+            return PromocodeResponse(discount_type=None, discount_value=0, final_amount=final_amount)
+
         purchase = await purchase_service.get_purchase(cancel.purchase_id, user["sub"])
         if not purchase:
             raise HTTPException(status_code=HTTPStatus.NOT_FOUND, detail="Data purchase not found")
         # Обновляем стоимость покупки на стандартную
-        final_amount = await purchase_service.cancel_purchase(purchase.id)
+        final_amount = await purchase_service.cancel_purchase(purchase.id, user["sub"])
         if not final_amount:
             raise HTTPException(status_code=HTTPStatus.NOT_FOUND, detail="Data purchase not found")
 
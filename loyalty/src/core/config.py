@@ -7,10 +7,8 @@ from fastapi.security import OAuth2PasswordBearer
 
 
 class AuthJWT(BaseModel):
-    secret_key: str = "secret-key"
-    algorithm: str = "HS256"
-    access_token_expire_minutes: int = 20 * 60
-    refresh_token_expire_minutes: int = 30 * 24 * 60 * 60  # 30 дней
+    # Алгоритмы подписи, с которыми принимаются токены сервиса авторизации
+    algorithms: list = ["RS256"]
 
 
 class Settings(BaseSettings):
@@ -26,8 +24,52 @@ class Settings(BaseSettings):
     redis_host: str
     redis_port: int
 
+    # Перенос счётчиков использований промокодов из Redis в Postgres
+    usage_reconcile_interval: float = 5.0
+    usage_reconcile_batch_size: int = 500
+
+    # Брони промокодов и запись подтверждённых покупок в Postgres
+    promocode_hold_ttl: int = 15 * 60
+    purchase_flush_interval: float = 1.0
+    purchase_flush_batch_size: int = 1000
+
+    # Период проверки новой версии фильтра существующих промокодов
+    promocode_filter_refresh_interval: float = 1.0
+
+    # Время кэширования сущностей, в секундах
+    entity_cache_ttl: int = 5 * 60
+    user_cache_ttl: int = 60
+    # Защита от лавины промахов: блокировка загрузки между воркерами и ранний пересчёт
+    cache_lock_ttl_ms: int = 3000
+    cache_lock_poll_interval: float = 0.05
+    cache_early_refresh_beta: float = 1.0
+    # Пауза перед переподключением к каналу уведомлений об изменениях в Postgres
+    cache_invalidation_reconnect_interval: float = 1.0
+
+    # Прогрев кэшей при старте воркера
+    warmup_concurrency: int = 4
+    warmup_batch_size: int = 500
+    warmup_max_promocodes: int = 10_000
+    warmup_timeout: float = 60.0
+
+    # Время кэширования отказов в применении промокода, в секундах
+    negative_cache_ttl: dict = {
+        'not found': 60,
+        'User not found': 5,
+        'not access': 30,
+        'expired': 300,
+    }
+
     # Настройки jwt
     auth_jwt: AuthJWT = AuthJWT()
+    # Открытые ключи сервиса авторизации: период обновления и пауза между
+    # внеочередными загрузками при токене с неизвестным ключом
+    auth_jwks_url: str = "http://auth_service:8000/auth/api/v1/jwks.json"
+    jwks_refresh_interval: float = 5 * 60
+    jwks_min_refetch_interval: float = 10.0
+    # Реестр битов разрешений в маске access токена
+    auth_permissions_url: str = "http://auth_service:8000/auth/api/v1/permissions.json"
+    permission_registry_refresh_interval: float = 5 * 60
     pwd_context: CryptContext = CryptContext(schemes=["bcrypt"], deprecated="auto")
     oauth2_scheme: OAuth2PasswordBearer = OAuth2PasswordBearer(tokenUrl="token")
 
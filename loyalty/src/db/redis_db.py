@@ -1,15 +1,275 @@
-from typing import Union, Optional, List
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+from typing import Union, Optional, List, Tuple
 
 import backoff
 from redis.asyncio import Redis
 from redis.exceptions import ConnectionError as conn_err_redis
 
+from models import cache as cache_codec
+from models.promocode import PromoCode
 from .cache import Cache
 
+PROMOCODE_USAGE_DIRTY_KEY = "promocode_usage:dirty"
+PROMOCODE_USAGE_LOCK_KEY = "promocode_usage:lock"
+PROMOCODE_HOLDS_KEY = "promocode_holds"
+PENDING_PURCHASES_KEY = "purchases:pending"
+PENDING_PURCHASES_LOCK_KEY = "purchases:pending:lock"
+DEAD_PURCHASES_KEY = "purchases:dead"
+PROMOCODE_FILTER_KEY = "promocodes:bloom"
+PROMOCODE_FILTER_META_KEY = "promocodes:bloom:meta"
+PROMOCODE_FILTER_UPDATES_KEY = "promocodes:bloom:updates"
+PROMOCODE_NEGATIVE_KEY = "promocode_negative:{code}"
+# Множество доступов промокода: u:<ид пользователя>, g:<ид группы> и метка загрузки
+PROMOCODE_ACCESS_KEY = "promocode_access:{promocode_id}"
+PROMOCODE_ACCESS_LOADED = "*"
+PROMOCODE_ACCESS_BATCH_SIZE = 10_000
+# Индекс активных промокодов: ZSET код -> момент истечения и хеш код -> запись кэша
+ACTIVE_PROMOCODES_KEY = "promocodes:active"
+ACTIVE_PROMOCODES_DATA_KEY = "promocodes:active:data"
+# Метка применённого изменения num_uses из уведомления об инвалидации
+PROMOCODE_REMAINING_APPLIED_KEY = "promocode_remaining:applied:{notification_id}"
+PROMOCODE_REMAINING_APPLIED_TTL = 24 * 60 * 60
+
+# Атомарно списывает одно использование промокода. Остаток хранится в Redis и при
+# первом обращении инициализируется значением num_uses из Postgres за вычетом
+# использований, ещё не перенесённых в Postgres.
+_CONSUME_USAGE = """
+local remaining = redis.call('GET', KEYS[1])
+if not remaining then
+    remaining = tonumber(ARGV[1]) - tonumber(redis.call('GET', KEYS[2]) or '0')
+    redis.call('SET', KEYS[1], remaining)
+end
+if tonumber(remaining) <= 0 then
+    return -1
+end
+redis.call('INCR', KEYS[2])
+redis.call('SADD', KEYS[3], ARGV[2])
+remaining = redis.call('DECR', KEYS[1])
+"""
+
+CONSUME_USAGE_SCRIPT = _CONSUME_USAGE + "return remaining\n"
+
+# Списывает использование и создаёт бронь. Срок брони хранится в ZSET, просроченные
+# брони снимает RELEASE_EXPIRED_HOLDS_SCRIPT, возвращая использование в остаток.
+RESERVE_USAGE_SCRIPT = _CONSUME_USAGE + """
+redis.call('HSET', KEYS[4], 'promocode_id', ARGV[2], 'user_id', ARGV[4], 'tariff_id', ARGV[5],
+           'price', ARGV[6], 'total_price', ARGV[7])
+redis.call('ZADD', KEYS[5], ARGV[3], ARGV[8])
+return remaining
+"""
+
+_RELEASE_HOLD_USAGE = """
+local function release_usage(remaining_key, usage_key, dirty_key, promocode_id)
+    if redis.call('EXISTS', remaining_key) == 1 then
+        redis.call('INCR', remaining_key)
+    end
+    redis.call('DECR', usage_key)
+    redis.call('SADD', dirty_key, promocode_id)
+end
+"""
+
+# Подтверждает бронь: удаляет её и ставит покупку в очередь на запись в Postgres.
+# Возвращает поля брони, 0 - если брони нет, -1 - если срок брони истёк.
+COMMIT_HOLD_SCRIPT = """
+local expires_at = redis.call('ZSCORE', KEYS[2], ARGV[1])
+if not expires_at or redis.call('HGET', KEYS[1], 'user_id') ~= ARGV[2] then
+    return 0
+end
+if tonumber(expires_at) < tonumber(ARGV[3]) then
+    return -1
+end
+local hold = redis.call('HGETALL', KEYS[1])
+local purchase = {purchase_date = tonumber(ARGV[3])}
+for i = 1, #hold, 2 do
+    purchase[hold[i]] = hold[i + 1]
+end
+redis.call('RPUSH', KEYS[3], cjson.encode(purchase))
+redis.call('ZREM', KEYS[2], ARGV[1])
+redis.call('DEL', KEYS[1])
+return hold
+"""
+
+# Отменяет бронь и возвращает использование в остаток промокода. Ид промокода
+# читается из брони до вызова, чтобы передать его ключи в KEYS; скрипт сверяет его.
+RELEASE_HOLD_SCRIPT = _RELEASE_HOLD_USAGE + """
+if not redis.call('ZSCORE', KEYS[2], ARGV[1])
+    or redis.call('HGET', KEYS[1], 'user_id') ~= ARGV[2]
+    or redis.call('HGET', KEYS[1], 'promocode_id') ~= ARGV[3] then
+    return 0
+end
+local hold = redis.call('HGETALL', KEYS[1])
+release_usage(KEYS[3], KEYS[4], KEYS[5], ARGV[3])
+redis.call('ZREM', KEYS[2], ARGV[1])
+redis.call('DEL', KEYS[1])
+return hold
+"""
+
+# Снимает просроченные брони, возвращая использования в остаток. Брони выбираются
+# до вызова: на каждую KEYS содержит бронь, остаток и счётчик использований, ARGV -
+# ид брони и промокода. Бронь, уже подтверждённая или отменённая, пропускается.
+RELEASE_EXPIRED_HOLDS_SCRIPT = _RELEASE_HOLD_USAGE + """
+local released = 0
+for i = 0, (#KEYS - 2) / 3 - 1 do
+    local hold_key = KEYS[3 + i * 3]
+    local hold_id, promocode_id = ARGV[2 + i * 2], ARGV[3 + i * 2]
+    local expires_at = redis.call('ZSCORE', KEYS[1], hold_id)
+    if expires_at and tonumber(expires_at) <= tonumber(ARGV[1]) then
+        if redis.call('HGET', hold_key, 'promocode_id') == promocode_id then
+            release_usage(KEYS[4 + i * 3], KEYS[5 + i * 3], KEYS[2], promocode_id)
+        end
+        redis.call('DEL', hold_key)
+        redis.call('ZREM', KEYS[1], hold_id)
+        released = released + 1
+    end
+end
+return released
+"""
+
+RELEASE_USAGE_SCRIPT = """
+if redis.call('EXISTS', KEYS[1]) == 1 then
+    redis.call('INCR', KEYS[1])
+end
+redis.call('DECR', KEYS[2])
+redis.call('SADD', KEYS[3], ARGV[1])
+return 1
+"""
+
+# Читает накопленные изменения счётчиков KEYS[2..] промокодов ARGV для переноса в
+# Postgres, не обнуляя их: счётчики уменьшаются на перенесённое только после
+# коммита, ACK_USAGE_SCRIPT. Промокоды с нулевым счётчиком сразу убираются из
+# множества изменённых KEYS[1].
+READ_USAGE_SCRIPT = """
+local result = {}
+for i = 1, #ARGV do
+    local delta = tonumber(redis.call('GET', KEYS[i + 1]) or '0')
+    if delta ~= 0 then
+        table.insert(result, ARGV[i])
+        table.insert(result, delta)
+    else
+        redis.call('SREM', KEYS[1], ARGV[i])
+    end
+end
+return result
+"""
+
+# Вычитает перенесённые в Postgres изменения из счётчиков KEYS[2..]; использования,
+# накопленные за время переноса, остаются в счётчике до следующего переноса
+ACK_USAGE_SCRIPT = """
+for i = 1, #ARGV, 2 do
+    if redis.call('DECRBY', KEYS[(i + 1) / 2 + 1], ARGV[i + 1]) == 0 then
+        redis.call('SREM', KEYS[1], ARGV[i])
+    end
+end
+return 1
+"""
+
+# Сдвигает инициализированные остатки KEYS[2..] на изменение num_uses в Postgres.
+# Уведомление получает каждый воркер, сдвиг делает только первый из них: метка
+# KEYS[1] ставится по ид уведомления и живёт ARGV[1] секунд.
+ADJUST_REMAINING_SCRIPT = """
+if not redis.call('SET', KEYS[1], 1, 'NX', 'EX', ARGV[1]) then
+    return 0
+end
+for i = 2, #KEYS do
+    if redis.call('EXISTS', KEYS[i]) == 1 then
+        redis.call('INCRBY', KEYS[i], ARGV[i])
+    end
+end
+return 1
+"""
+
+# Снимает блокировку, только если она всё ещё принадлежит захватившему её воркеру
+UNLOCK_SCRIPT = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('DEL', KEYS[1])
+end
+return 0
+"""
+
+# Запоминает отказ в применении промокода пользователю. Хеш по коду живёт не меньше,
+# чем самая долгая запись в нём, срок каждой записи хранится вместе с причиной.
+SET_NEGATIVE_SCRIPT = """
+redis.call('HSET', KEYS[1], ARGV[1], ARGV[2] .. '|' .. ARGV[3])
+if redis.call('TTL', KEYS[1]) < tonumber(ARGV[4]) then
+    redis.call('EXPIRE', KEYS[1], ARGV[4])
+end
+return 1
+"""
+
+TRIM_ACTIVE_SCRIPT = """
+local expired = redis.call('ZRANGEBYSCORE', KEYS[1], '-inf', ARGV[1], 'LIMIT', 0, ARGV[2])
+if #expired > 0 then
+    redis.call('ZREM', KEYS[1], unpack(expired))
+    redis.call('HDEL', KEYS[2], unpack(expired))
+end
+return #expired
+"""
+
+
+# Страница индекса активных промокодов после ключа (срок, код). Коды с равным
+# сроком упорядочены в ZSET побайтово; если код-ключ уже удалён из индекса,
+# начало страницы ищется двоичным поиском среди кодов с тем же сроком.
+ACTIVE_PAGE_SCRIPT = """
+local function less_or_equal(a, b)
+    for i = 1, math.min(#a, #b) do
+        local x, y = string.byte(a, i), string.byte(b, i)
+        if x ~= y then
+            return x < y
+        end
+    end
+    return #a <= #b
+end
+
+local start = 0
+if ARGV[1] ~= '' then
+    local rank = redis.call('ZRANK', KEYS[1], ARGV[2])
+    if rank and redis.call('ZSCORE', KEYS[1], ARGV[2]) == ARGV[1] then
+        start = rank + 1
+    else
+        local lo = redis.call('ZCOUNT', KEYS[1], '-inf', '(' .. ARGV[1])
+        local hi = redis.call('ZCOUNT', KEYS[1], '-inf', ARGV[1])
+        while lo < hi do
+            local mid = math.floor((lo + hi) / 2)
+            if less_or_equal(redis.call('ZRANGE', KEYS[1], mid, mid)[1], ARGV[2]) then
+                lo = mid + 1
+            else
+                hi = mid
+            end
+        end
+        start = lo
+    end
+end
+return redis.call('ZRANGE', KEYS[1], start, start + tonumber(ARGV[3]) - 1, 'WITHSCORES')
+"""
+
+
+def promocode_expires_at(promocode) -> float:
+    """Момент окончания действия промокода: конец дня expiration_date (UTC)."""
+    if promocode.expiration_date is None:
+        return float("inf")
+    end = datetime.combine(promocode.expiration_date + timedelta(days=1), datetime.min.time(), timezone.utc)
+    return end.timestamp()
+
 
 class RedisCache(Cache):
-    def __init__(self):
-        self.redis: Union[Redis, None]
+    def __init__(self, redis: Union[Redis, None] = None):
+        self.redis: Union[Redis, None] = redis
+        if redis is not None:
+            self._consume_usage = redis.register_script(CONSUME_USAGE_SCRIPT)
+            self._release_usage = redis.register_script(RELEASE_USAGE_SCRIPT)
+            self._read_usage = redis.register_script(READ_USAGE_SCRIPT)
+            self._ack_usage = redis.register_script(ACK_USAGE_SCRIPT)
+            self._unlock = redis.register_script(UNLOCK_SCRIPT)
+            self._adjust_remaining = redis.register_script(ADJUST_REMAINING_SCRIPT)
+            self._reserve_usage = redis.register_script(RESERVE_USAGE_SCRIPT)
+            self._commit_hold = redis.register_script(COMMIT_HOLD_SCRIPT)
+            self._release_hold = redis.register_script(RELEASE_HOLD_SCRIPT)
+            self._release_expired_holds = redis.register_script(RELEASE_EXPIRED_HOLDS_SCRIPT)
+            self._set_negative = redis.register_script(SET_NEGATIVE_SCRIPT)
+            self._trim_active = redis.register_script(TRIM_ACTIVE_SCRIPT)
+            self._active_page = redis.register_script(ACTIVE_PAGE_SCRIPT)
 
     @backoff.on_exception(backoff.expo, conn_err_redis, max_tries=5)
     async def get(self, key: str) -> Optional[bytes]:
@@ -44,41 +304,371 @@ class RedisCache(Cache):
         await self.delete(code)
 
     @backoff.on_exception(backoff.expo, conn_err_redis, max_tries=5)
-    async def cache_active_promocodes(self, promocodes: List[int], expire: Optional[int] = None):
+    async def index_promocode(self, promocode):
+        """
+        Добавляет действующий промокод в индекс активных промокодов
+        или удаляет из индекса недействующий.
+        """
+        if not promocode.is_active or promocode.is_deleted:
+            await self.remove_promocode_from_index(promocode.code)
+            return
+        expires_at = promocode_expires_at(promocode)
+        if expires_at <= time.time():
+            await self.remove_promocode_from_index(promocode.code)
+            return
+        async with self.redis.pipeline(transaction=True) as pipe:
+            pipe.zadd(ACTIVE_PROMOCODES_KEY, {promocode.code: expires_at})
+            pipe.hset(ACTIVE_PROMOCODES_DATA_KEY, promocode.code, cache_codec.encode(promocode))
+            await pipe.execute()
+
+    @backoff.on_exception(backoff.expo, conn_err_redis, max_tries=5)
+    async def remove_promocode_from_index(self, code: str):
+        async with self.redis.pipeline(transaction=True) as pipe:
+            pipe.zrem(ACTIVE_PROMOCODES_KEY, code)
+            pipe.hdel(ACTIVE_PROMOCODES_DATA_KEY, code)
+            await pipe.execute()
+
+    @backoff.on_exception(backoff.expo, conn_err_redis, max_tries=5)
+    async def trim_active_promocodes(self, batch_size: int = 1000) -> int:
         """
-        Кэширует список активных промокодов.
-        Each promocode is stored in the format: 'promocode_id' -> promocode details.
+        Удаляет из индекса до batch_size истёкших промокодов. Возвращает их количество.
         """
-        for promocode in promocodes:
-            await self.set(f"promocode:{promocode.id}", promocode, expire)
+        return await self._trim_active(
+            keys=[ACTIVE_PROMOCODES_KEY, ACTIVE_PROMOCODES_DATA_KEY], args=[time.time(), batch_size]
+        )
 
     @backoff.on_exception(backoff.expo, conn_err_redis, max_tries=5)
-    async def get_all_active_promocodes(self) -> List[Optional[int]]:
+    async def get_active_promocodes(
+        self, cursor: Optional[Tuple[str, str]] = None, count: int = 100
+    ) -> Tuple[list, Optional[Tuple[str, str]]]:
         """
-        Получает все активные промокоды из кэша.
-        Возвращает список идентификаторов промокодов.
+        Возвращает страницу активных промокодов в порядке истечения срока и курсор
+        следующей страницы - срок и код последнего промокода страницы (None, если
+        страница последняя). Курсор не зависит от удалений из индекса между
+        страницами. Промокоды, срок которых истёк, но ещё не удалены из индекса,
+        пропускаются.
         """
-        keys = await self.redis.keys("promocode:*")
-        values = await self.redis.mget(keys)
-        return [int(value) for value in values if value is not None]
+        await self.trim_active_promocodes()
+        score, member = cursor if cursor is not None else ("", "")
+        reply = await self._active_page(keys=[ACTIVE_PROMOCODES_KEY], args=[score, member, count])
+        members = [(reply[i].decode(), reply[i + 1].decode()) for i in range(0, len(reply), 2)]
+        now = time.time()
+        codes = [code for code, expires_at in members if float(expires_at) > now]
+        values = await self.redis.hmget(ACTIVE_PROMOCODES_DATA_KEY, codes) if codes else []
+        promocodes = [cache_codec.decode(value, PromoCode) for value in values]
+        next_cursor = (members[-1][1], members[-1][0]) if len(members) == count else None
+        return [promocode for promocode in promocodes if promocode is not None], next_cursor
 
     @backoff.on_exception(backoff.expo, conn_err_redis, max_tries=5)
-    async def update_promocode_usage(self, promocode_id: int):
+    async def update_promocode_usage(self, promocode_id: int, num_uses: int) -> Optional[int]:
         """
-        Обновляет количество использований промокода.
-        Например, может уменьшать счетчик использований или выполнять другие действия.
+        Атомарно списывает одно использование промокода.
+        Возвращает оставшееся количество использований или None, если лимит исчерпан.
         """
-        key = f"promocode_usage:{promocode_id}"
-        usage_count = await self.redis.incr(key)  # Увеличиваем счетчик использований
-        return usage_count
+        remaining = await self._consume_usage(
+            keys=[f"promocode_remaining:{promocode_id}", f"promocode_usage:{promocode_id}",
+                  PROMOCODE_USAGE_DIRTY_KEY],
+            args=[num_uses, promocode_id],
+        )
+        if remaining < 0:
+            return None
+        return remaining
 
     @backoff.on_exception(backoff.expo, conn_err_redis, max_tries=5)
     async def cancel_promocode_usage(self, promocode_id: int):
         """
-        Отменяет использование промокода, уменьшая его счетчик использований.
+        Отменяет использование промокода, возвращая его в остаток.
+        """
+        await self._release_usage(
+            keys=[f"promocode_remaining:{promocode_id}", f"promocode_usage:{promocode_id}",
+                  PROMOCODE_USAGE_DIRTY_KEY],
+            args=[promocode_id],
+        )
+
+    @backoff.on_exception(backoff.expo, conn_err_redis, max_tries=5)
+    async def get_promocode_usage(self, batch_size: int) -> List[Tuple[int, int]]:
+        """
+        Возвращает до batch_size изменённых счётчиков, не обнуляя их.
+        Возвращает пары (ид промокода, количество новых использований).
+        """
+        promocode_ids = await self.redis.srandmember(PROMOCODE_USAGE_DIRTY_KEY, batch_size)
+        if not promocode_ids:
+            return []
+        promocode_ids = [promocode_id.decode() for promocode_id in promocode_ids]
+        result = await self._read_usage(
+            keys=[PROMOCODE_USAGE_DIRTY_KEY] + [f"promocode_usage:{promocode_id}" for promocode_id in promocode_ids],
+            args=promocode_ids,
+        )
+        return [(int(result[i]), int(result[i + 1])) for i in range(0, len(result), 2)]
+
+    @backoff.on_exception(backoff.expo, conn_err_redis, max_tries=5)
+    async def ack_promocode_usage(self, usage: List[Tuple[int, int]]):
+        """
+        Вычитает из счётчиков изменения, перенесённые в Postgres.
         """
-        key = f"promocode_usage:{promocode_id}"
-        await self.redis.decr(key)  # Уменьшаем счетчик использований
+        if not usage:
+            return
+        args = [value for promocode_id, delta in usage for value in (promocode_id, delta)]
+        await self._ack_usage(
+            keys=[PROMOCODE_USAGE_DIRTY_KEY] + [f"promocode_usage:{promocode_id}" for promocode_id, _ in usage],
+            args=args,
+        )
+
+    @backoff.on_exception(backoff.expo, conn_err_redis, max_tries=5)
+    async def lock_promocode_usage(self, expire: int) -> Optional[str]:
+        """
+        Захватывает блокировку переноса счётчиков, чтобы одни и те же изменения
+        не перенёс в Postgres второй воркер. Возвращает токен блокировки или None.
+        """
+        return await self._acquire(PROMOCODE_USAGE_LOCK_KEY, expire * 1000)
+
+    @backoff.on_exception(backoff.expo, conn_err_redis, max_tries=5)
+    async def unlock_promocode_usage(self, token: str):
+        await self._unlock(keys=[PROMOCODE_USAGE_LOCK_KEY], args=[token])
+
+    async def _acquire(self, key: str, expire_ms: int) -> Optional[str]:
+        token = uuid.uuid4().hex
+        if await self.redis.set(key, token, nx=True, px=expire_ms):
+            return token
+        return None
+
+    @backoff.on_exception(backoff.expo, conn_err_redis, max_tries=5)
+    async def reserve_promocode_usage(
+        self, promocode_id: int, num_uses: int, hold_id: str, hold: dict, ttl: int
+    ) -> Optional[int]:
+        """
+        Списывает использование промокода и создаёт бронь на ttl секунд.
+        Возвращает оставшееся количество использований или None, если лимит исчерпан.
+        """
+        remaining = await self._reserve_usage(
+            keys=[f"promocode_remaining:{promocode_id}", f"promocode_usage:{promocode_id}",
+                  PROMOCODE_USAGE_DIRTY_KEY, f"promocode_hold:{hold_id}", PROMOCODE_HOLDS_KEY],
+            args=[num_uses, promocode_id, time.time() + ttl, hold["user_id"], hold["tariff_id"],
+                  hold["price"], hold["total_price"], hold_id],
+        )
+        if remaining < 0:
+            return None
+        return remaining
+
+    @backoff.on_exception(backoff.expo, conn_err_redis, max_tries=5)
+    async def commit_promocode_hold(self, hold_id: str, user_id: str) -> Union[dict, str, None]:
+        """
+        Подтверждает бронь и ставит покупку в очередь на запись в Postgres.
+        Возвращает данные брони, 'expired' для просроченной брони или None, если брони нет.
+        """
+        result = await self._commit_hold(
+            keys=[f"promocode_hold:{hold_id}", PROMOCODE_HOLDS_KEY, PENDING_PURCHASES_KEY],
+            args=[hold_id, user_id, time.time()],
+        )
+        if result == -1:
+            return 'expired'
+        if not result:
+            return None
+        return _hold_from_reply(result)
+
+    @backoff.on_exception(backoff.expo, conn_err_redis, max_tries=5)
+    async def release_promocode_hold(self, hold_id: str, user_id: str) -> Optional[dict]:
+        """
+        Отменяет бронь и возвращает использование промокода в остаток.
+        """
+        promocode_id = await self.redis.hget(f"promocode_hold:{hold_id}", "promocode_id")
+        if promocode_id is None:
+            return None
+        promocode_id = promocode_id.decode()
+        result = await self._release_hold(
+            keys=[f"promocode_hold:{hold_id}", PROMOCODE_HOLDS_KEY, f"promocode_remaining:{promocode_id}",
+                  f"promocode_usage:{promocode_id}", PROMOCODE_USAGE_DIRTY_KEY],
+            args=[hold_id, user_id, promocode_id],
+        )
+        if not result:
+            return None
+        return _hold_from_reply(result)
+
+    @backoff.on_exception(backoff.expo, conn_err_redis, max_tries=5)
+    async def release_expired_holds(self, batch_size: int) -> int:
+        """
+        Снимает до batch_size просроченных броней. Возвращает их количество.
+        """
+        now = time.time()
+        hold_ids = await self.redis.zrangebyscore(PROMOCODE_HOLDS_KEY, "-inf", now, start=0, num=batch_size)
+        if not hold_ids:
+            return 0
+        async with self.redis.pipeline(transaction=False) as pipe:
+            for hold_id in hold_ids:
+                pipe.hget(b"promocode_hold:" + hold_id, "promocode_id")
+            promocode_ids = await pipe.execute()
+        keys, args = [PROMOCODE_HOLDS_KEY, PROMOCODE_USAGE_DIRTY_KEY], [now]
+        for hold_id, promocode_id in zip(hold_ids, promocode_ids):
+            promocode_id = (promocode_id or b"").decode()
+            keys += [b"promocode_hold:" + hold_id, f"promocode_remaining:{promocode_id}",
+                     f"promocode_usage:{promocode_id}"]
+            args += [hold_id, promocode_id]
+        return await self._release_expired_holds(keys=keys, args=args)
+
+    @backoff.on_exception(backoff.expo, conn_err_redis, max_tries=5)
+    async def get_pending_purchases(self, batch_size: int) -> List[bytes]:
+        """
+        Возвращает до batch_size подтверждённых покупок, ожидающих записи в Postgres,
+        в том виде, в каком они лежат в очереди.
+        """
+        return await self.redis.lrange(PENDING_PURCHASES_KEY, 0, batch_size - 1)
+
+    @backoff.on_exception(backoff.expo, conn_err_redis, max_tries=5)
+    async def ack_pending_purchases(self, count: int, dead: Optional[List[bytes]] = None):
+        """
+        Удаляет из очереди count обработанных покупок; покупки, которые не удалось
+        записать в Postgres, переносит в очередь разбора purchases:dead.
+        """
+        async with self.redis.pipeline(transaction=True) as pipe:
+            if dead:
+                pipe.rpush(DEAD_PURCHASES_KEY, *dead)
+            pipe.ltrim(PENDING_PURCHASES_KEY, count, -1)
+            await pipe.execute()
+
+    @backoff.on_exception(backoff.expo, conn_err_redis, max_tries=5)
+    async def lock_pending_purchases(self, expire: int) -> Optional[str]:
+        """
+        Захватывает блокировку записи очереди покупок, чтобы её не разбирали несколько воркеров.
+        Возвращает токен блокировки или None, если она занята.
+        """
+        return await self._acquire(PENDING_PURCHASES_LOCK_KEY, expire * 1000)
+
+    @backoff.on_exception(backoff.expo, conn_err_redis, max_tries=5)
+    async def unlock_pending_purchases(self, token: str):
+        await self._unlock(keys=[PENDING_PURCHASES_LOCK_KEY], args=[token])
+
+    @backoff.on_exception(backoff.expo, conn_err_redis, max_tries=5)
+    async def check_promocode_access(self, promocode_id: int, user_id: int, group_id: Optional[int]) -> Optional[bool]:
+        """
+        Проверяет по закэшированному множеству доступов, выдан ли промокод пользователю
+        лично или его группе. Возвращает None, если доступы промокода не закэшированы.
+        """
+        members = [PROMOCODE_ACCESS_LOADED, f"u:{user_id}"]
+        if group_id is not None:
+            members.append(f"g:{group_id}")
+        loaded, *granted = await self.redis.smismember(PROMOCODE_ACCESS_KEY.format(promocode_id=promocode_id), members)
+        if not loaded:
+            return None
+        return any(granted)
+
+    @backoff.on_exception(backoff.expo, conn_err_redis, max_tries=5)
+    async def set_promocode_access(self, promocode_id: int, access: dict, expire: int):
+        key = PROMOCODE_ACCESS_KEY.format(promocode_id=promocode_id)
+        members = [f"u:{user_id}" for user_id in access["users"]] + [f"g:{group_id}" for group_id in access["groups"]]
+        async with self.redis.pipeline(transaction=True) as pipe:
+            pipe.delete(key)
+            for start in range(0, len(members), PROMOCODE_ACCESS_BATCH_SIZE):
+                pipe.sadd(key, *members[start:start + PROMOCODE_ACCESS_BATCH_SIZE])
+            pipe.sadd(key, PROMOCODE_ACCESS_LOADED)
+            pipe.expire(key, expire)
+            await pipe.execute()
+
+    @backoff.on_exception(backoff.expo, conn_err_redis, max_tries=5)
+    async def lock(self, key: str, expire_ms: int) -> Optional[str]:
+        """Захватывает короткую блокировку. Возвращает её токен или None, если она уже занята."""
+        return await self._acquire(key, expire_ms)
+
+    @backoff.on_exception(backoff.expo, conn_err_redis, max_tries=5)
+    async def unlock(self, key: str, token: str):
+        """Снимает блокировку, если её не перехватил другой воркер после истечения срока."""
+        await self._unlock(keys=[key], args=[token])
+
+    @backoff.on_exception(backoff.expo, conn_err_redis, max_tries=5)
+    async def get_promocode_filter_meta(self) -> Optional[dict]:
+        """
+        Возвращает размер, количество хеш-функций и версию фильтра промокодов
+        или None, если фильтр ещё не построен.
+        """
+        meta = await self.redis.hgetall(PROMOCODE_FILTER_META_KEY)
+        if not meta:
+            return None
+        return {key.decode(): int(value) for key, value in meta.items()}
+
+    @backoff.on_exception(backoff.expo, conn_err_redis, max_tries=5)
+    async def get_promocode_filter(self) -> Optional[bytes]:
+        return await self.redis.get(PROMOCODE_FILTER_KEY)
+
+    @backoff.on_exception(backoff.expo, conn_err_redis, max_tries=5)
+    async def get_promocode_filter_updates(self, version: int, count: int) -> List[Tuple[int, Optional[List[int]]]]:
+        """
+        Возвращает до count изменений фильтра промокодов новее version: пары
+        (версия, добавленные биты). None вместо бит - изменение, после которого
+        фильтр нужно загрузить целиком.
+        """
+        entries = await self.redis.xrange(PROMOCODE_FILTER_UPDATES_KEY, min=f"{version + 1}-0", count=count)
+        updates = []
+        for entry_id, fields in entries:
+            positions = fields.get(b"positions")
+            updates.append((
+                int(entry_id.split(b"-")[0]),
+                [int(position) for position in positions.split(b",")] if positions else None,
+            ))
+        return updates
+
+    @backoff.on_exception(backoff.expo, conn_err_redis, max_tries=5)
+    async def get_promocode_negative(self, code: str, user_id: int) -> Optional[str]:
+        """
+        Возвращает закэшированную причину отказа в применении промокода пользователю.
+        """
+        result = await self.redis.hget(PROMOCODE_NEGATIVE_KEY.format(code=code), str(user_id))
+        if result is None:
+            return None
+        outcome, expires_at = result.decode().rsplit("|", 1)
+        if float(expires_at) < time.time():
+            return None
+        return outcome
+
+    @backoff.on_exception(backoff.expo, conn_err_redis, max_tries=5)
+    async def set_promocode_negative(self, code: str, user_id: int, outcome: str, expire: int):
+        await self._set_negative(
+            keys=[PROMOCODE_NEGATIVE_KEY.format(code=code)],
+            args=[str(user_id), outcome, time.time() + expire, expire],
+        )
+
+    @backoff.on_exception(backoff.expo, conn_err_redis, max_tries=5)
+    async def invalidate_promocodes(
+        self,
+        promocodes: List[Tuple[int, str]],
+        num_uses_deltas: Optional[List[Tuple[int, int]]] = None,
+        notification_id: Optional[str] = None,
+    ):
+        """
+        Удаляет всё, что закэшировано по изменённым промокодам: запись, списки
+        доступа, отказы и запись в индексе активных промокодов. Остаток
+        использований не удаляется - в нём есть использования, ещё не перенесённые
+        в Postgres, - а сдвигается на изменение num_uses один раз на notification_id.
+        """
+        async with self.redis.pipeline(transaction=False) as pipe:
+            for promocode_id, code in promocodes:
+                pipe.delete(
+                    f"promocode:{code}",
+                    PROMOCODE_ACCESS_KEY.format(promocode_id=promocode_id),
+                    PROMOCODE_NEGATIVE_KEY.format(code=code),
+                )
+                pipe.zrem(ACTIVE_PROMOCODES_KEY, code)
+                pipe.hdel(ACTIVE_PROMOCODES_DATA_KEY, code)
+            await pipe.execute()
+        if num_uses_deltas and notification_id:
+            await self._adjust_remaining(
+                keys=[PROMOCODE_REMAINING_APPLIED_KEY.format(notification_id=notification_id)]
+                + [f"promocode_remaining:{promocode_id}" for promocode_id, _ in num_uses_deltas],
+                args=[PROMOCODE_REMAINING_APPLIED_TTL] + [delta for _, delta in num_uses_deltas],
+            )
+
+    @backoff.on_exception(backoff.expo, conn_err_redis, max_tries=5)
+    async def invalidate_tariffs(self, tariff_ids: List[int]):
+        await self.redis.delete(*(f"tariff:{tariff_id}" for tariff_id in tariff_ids))
+
+
+def _hold_from_reply(reply: list) -> dict:
+    hold = {reply[i].decode(): reply[i + 1].decode() for i in range(0, len(reply), 2)}
+    return {
+        "promocode_id": int(hold["promocode_id"]),
+        "user_id": int(hold["user_id"]),
+        "tariff_id": int(hold["tariff_id"]),
+        "price": float(hold["price"]),
+        "total_price": float(hold["total_price"]),
+    }
 
 
 redis: Union[RedisCache, None] = None
@@ -0,0 +1,252 @@
+"""
+Двухуровневый кэш сущностей: L1 в памяти воркера перед L2 в Redis.
+
+L1 - ограниченный по размеру LRU со сроком жизни записей. Записи L1 не
+инвалидируются между воркерами, поэтому их срок жизни короче, чем в Redis.
+Для каждой модели задаётся своя политика, модели без политики кэшируются
+только в Redis.
+
+Защита от лавины промахов: одновременные промахи по ключу внутри воркера
+ждут одну загрузку, между воркерами загрузку выполняет владелец короткой
+блокировки в Redis, а популярные ключи пересчитываются заранее с вероятностью,
+растущей к концу срока жизни (XFetch). Для этого запись в Redis хранится в
+конверте со временем загрузки и моментом истечения.
+"""
+import math
+import time
+import random
+import asyncio
+import struct
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple, Type
+
+from core.config import settings
+from models import cache as cache_codec
+from models.promocode import PromoCode
+from models.purchase import Tariff
+from models.user import User
+from .redis_db import RedisCache
+
+
+@dataclass(frozen=True)
+class CachePolicy:
+    # Поле, по которому строится ключ кэша
+    key_field: str
+    # Срок жизни и размер L1
+    l1_ttl: float
+    l1_size: int
+
+
+CACHE_POLICIES: Dict[Type, CachePolicy] = {
+    Tariff: CachePolicy(key_field="id", l1_ttl=60, l1_size=256),
+    PromoCode: CachePolicy(key_field="code", l1_ttl=5, l1_size=10_000),
+    User: CachePolicy(key_field="id", l1_ttl=5, l1_size=10_000),
+}
+
+
+class LRUCache:
+    def __init__(self, size: int):
+        self.size = size
+        self._data: OrderedDict = OrderedDict()
+
+    def get(self, key: str) -> Any:
+        item = self._data.get(key)
+        if item is None:
+            return None
+        expires_at, value = item
+        if expires_at < time.monotonic():
+            del self._data[key]
+            return None
+        self._data.move_to_end(key)
+        return value
+
+    def set(self, key: str, value: Any, ttl: float):
+        self._data[key] = (time.monotonic() + ttl, value)
+        self._data.move_to_end(key)
+        if len(self._data) > self.size:
+            self._data.popitem(last=False)
+
+    def delete(self, key: str):
+        self._data.pop(key, None)
+
+    def clear(self):
+        self._data.clear()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+
+# Конверт записи в Redis: метка, время загрузки (с), момент истечения (unix time)
+ENVELOPE = struct.Struct("!cdd")
+ENVELOPE_TAG = b"E"
+
+
+def pack(instance, delta: float, expires_at: float) -> bytes:
+    return ENVELOPE.pack(ENVELOPE_TAG, delta, expires_at) + cache_codec.encode(instance)
+
+
+def unpack(data: Optional[bytes], model: Type) -> Optional[Tuple[Any, float, float]]:
+    if not data or len(data) <= ENVELOPE.size:
+        return None
+    tag, delta, expires_at = ENVELOPE.unpack_from(data)
+    if tag != ENVELOPE_TAG:
+        return None
+    value = cache_codec.decode(data[ENVELOPE.size:], model)
+    if value is None:
+        return None
+    return value, delta, expires_at
+
+
+class TieredCache:
+    def __init__(self, redis: RedisCache, policies: Dict[Type, CachePolicy] = CACHE_POLICIES):
+        self.redis = redis
+        self.policies = policies
+        self.l1 = {model: LRUCache(policy.l1_size) for model, policy in policies.items()}
+        self.counters = {
+            model.__name__.lower(): {
+                "l1_hits": 0, "l2_hits": 0, "misses": 0,
+                "coalesced": 0, "early_refreshes": 0, "stale_hits": 0,
+            }
+            for model in policies
+        }
+        self._inflight: Dict[str, asyncio.Future] = {}
+
+    def policy(self, model: Type) -> Optional[CachePolicy]:
+        return self.policies.get(model)
+
+    async def get(self, key: str, model: Type):
+        counters = self.counters[model.__name__.lower()]
+        l1 = self.l1[model]
+        value = l1.get(key)
+        if value is not None:
+            counters["l1_hits"] += 1
+            return value
+
+        cached = unpack(await self.redis.get(key), model)
+        if cached is None:
+            counters["misses"] += 1
+            return None
+        counters["l2_hits"] += 1
+        l1.set(key, cached[0], self.policies[model].l1_ttl)
+        return cached[0]
+
+    async def set(
+        self, key: str, instance, model: Type, expire: Optional[int] = None, delta: float = 0, local: bool = True
+    ):
+        """Кладёт сущность в Redis и, если local, в L1 воркера."""
+        expire = expire or settings.entity_cache_ttl
+        value = cache_codec.to_cached(instance)
+        await self.redis.set(key, pack(value, delta, time.time() + expire), expire)
+        if local:
+            self.l1[model].set(key, value, min(self.policies[model].l1_ttl, expire))
+        return value
+
+    async def get_or_load(
+        self, key: str, model: Type, loader: Callable[[], Awaitable[Any]], expire: Optional[int] = None
+    ):
+        """
+        Возвращает сущность из L1 или Redis, а при промахе загружает её через loader.
+        Одновременные промахи по ключу внутри воркера ждут одну загрузку.
+        """
+        value = self.l1[model].get(key)
+        if value is not None:
+            self.counters[model.__name__.lower()]["l1_hits"] += 1
+            return value
+
+        future = self._inflight.get(key)
+        while future is not None:
+            self.counters[model.__name__.lower()]["coalesced"] += 1
+            try:
+                return await asyncio.shield(future)
+            except asyncio.CancelledError:
+                if not future.cancelled():
+                    raise
+            # Запрос, который вёл загрузку, отменён: загрузку ведёт следующий ожидающий
+            future = self._inflight.get(key)
+
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[key] = future
+        try:
+            value = await self._load(key, model, loader, expire)
+        except asyncio.CancelledError:
+            # Отмена запроса - не ошибка загрузки, ожидающим её не передаём
+            future.cancel()
+            raise
+        except Exception as e:
+            future.set_exception(e)
+            # Исключение получат ожидающие, сам future больше никому не нужен
+            future.exception()
+            raise
+        else:
+            future.set_result(value)
+            return value
+        finally:
+            del self._inflight[key]
+
+    async def _load(self, key: str, model: Type, loader, expire: Optional[int]):
+        counters = self.counters[model.__name__.lower()]
+        cached = unpack(await self.redis.get(key), model)
+        if cached is not None:
+            value, delta, expires_at = cached
+            # XFetch: чем дольше загрузка и ближе истечение, тем вероятнее пересчёт заранее
+            if time.time() - delta * settings.cache_early_refresh_beta * math.log(1.0 - random.random()) < expires_at:
+                counters["l2_hits"] += 1
+                self.l1[model].set(key, value, self.policies[model].l1_ttl)
+                return value
+            counters["early_refreshes"] += 1
+
+        lock_key = f"lock:{key}"
+        token = await self.redis.lock(lock_key, settings.cache_lock_ttl_ms)
+        if token is not None:
+            try:
+                return await self._refresh(key, model, loader, expire)
+            finally:
+                await self.redis.unlock(lock_key, token)
+
+        if cached is not None:
+            # Запись пересчитывает другой воркер, пока отдаём текущую
+            counters["stale_hits"] += 1
+            return cached[0]
+
+        # Ждём, пока владелец блокировки положит запись в Redis. Если блокировка
+        # снята, а записи нет - сущность не найдена, загружаем сами
+        deadline = time.monotonic() + settings.cache_lock_ttl_ms / 1000
+        while time.monotonic() < deadline:
+            await asyncio.sleep(settings.cache_lock_poll_interval)
+            cached = unpack(await self.redis.get(key), model)
+            if cached is not None:
+                counters["l2_hits"] += 1
+                self.l1[model].set(key, cached[0], self.policies[model].l1_ttl)
+                return cached[0]
+            if await self.redis.get(lock_key) is None:
+                break
+        return await self._refresh(key, model, loader, expire)
+
+    async def _refresh(self, key: str, model: Type, loader, expire: Optional[int]):
+        self.counters[model.__name__.lower()]["misses"] += 1
+        started = time.monotonic()
+        instance = await loader()
+        if instance is None:
+            return None
+        return await self.set(key, instance, model, expire, delta=time.monotonic() - started)
+
+    async def delete(self, key: str, model: Type):
+        self.l1[model].delete(key)
+        await self.redis.delete(key)
+
+    def invalidate_local(self, key: str, model: Type):
+        self.l1[model].delete(key)
+
+    def stats(self) -> Dict[str, dict]:
+        return {
+            name: {**counters, "l1_size": len(self.l1[model])}
+            for (name, counters), model in zip(self.counters.items(), self.policies)
+        }
+
+
+tiered_cache: Optional[TieredCache] = None
+
+
+async def get_tiered_cache() -> TieredCache:
+    return tiered_cache
@@ -10,16 +10,39 @@ from contextlib import asynccontextmanager
 from backoff import on_exception, expo
 
 from core.config import settings
-from api.v1 import promocode
-from db import redis_db
+from api.v1 import promocode, health
+from db import redis_db, tiered_cache
+from services.usage_reconciler import usage_reconciler
+from services.purchase_writer import purchase_writer
+from services.promocode_filter import promocode_filter
+from services.warmup import cache_warmer
+from services.invalidation_listener import invalidation_listener
+from services.jwks import jwks_client
+from services.permission_registry import permission_registry
 
 
 @on_exception(expo, (ConnectionError), max_tries=10)
 @asynccontextmanager
 async def lifespan(app: FastAPI):
-    redis_db.redis = Redis(host=settings.redis_host, port=settings.redis_port)
+    redis_db.redis = redis_db.RedisCache(Redis(host=settings.redis_host, port=settings.redis_port))
+    tiered_cache.tiered_cache = tiered_cache.TieredCache(redis_db.redis)
+    jwks_client.start()
+    permission_registry.start()
+    # Воркер отвечает на запросы сразу, готовность к трафику показывает /health
+    invalidation_listener.start()
+    cache_warmer.start()
+    usage_reconciler.start()
+    purchase_writer.start()
+    promocode_filter.start()
     yield
-    await redis_db.redis.close()
+    await promocode_filter.stop()
+    await cache_warmer.stop()
+    await purchase_writer.stop()
+    await usage_reconciler.stop()
+    await invalidation_listener.stop()
+    await jwks_client.stop()
+    await permission_registry.stop()
+    await redis_db.redis.redis.close()
 
 
 app = FastAPI(
@@ -63,6 +86,7 @@ class StandaloneApplication(gunicorn.app.base.BaseApplication):
 
 
 app.include_router(promocode.router, prefix="/loyalty/api/v1/promocodes")
+app.include_router(health.router, prefix="/loyalty/api/v1")
 
 if __name__ == "__main__":
     options = {
@@ -0,0 +1,107 @@
+"""
+Представление сущностей в кэше.
+
+Сущность хранится в Redis массивом orjson: [версия схемы, тип, поля по порядку].
+Из кэша читаются лёгкие неизменяемые объекты со __slots__, без гидрации ORM.
+Если версия схемы или тип записи не совпадают, запись считается промахом кэша,
+и сервис читает сущность из базы.
+"""
+from dataclasses import astuple, dataclass, fields
+from datetime import date
+from typing import Optional, Type, Union
+
+import orjson
+
+from .promocode import PromoCode
+from .purchase import Tariff
+from .user import User
+
+# Увеличивается при любом изменении состава или порядка полей
+SCHEMA_VERSION = 1
+
+
+@dataclass(frozen=True, slots=True)
+class CachedPromoCode:
+    id: int
+    code: str
+    discount: float
+    discount_type: str
+    num_uses: int
+    is_active: bool
+    expiration_date: Optional[date]
+    is_deleted: bool
+
+
+@dataclass(frozen=True, slots=True)
+class CachedTariff:
+    id: int
+    name: str
+    price: float
+    description: Optional[str]
+    is_deleted: bool
+
+
+@dataclass(frozen=True, slots=True)
+class CachedUser:
+    id: int
+    uuid: Optional[str]
+    email: str
+    is_active: bool
+    group_id: Optional[int]
+
+
+CachedEntity = Union[CachedPromoCode, CachedTariff, CachedUser]
+
+# Модель ORM -> (тип записи в кэше, класс объекта из кэша)
+CACHED_MODELS = {
+    PromoCode: ("promocode", CachedPromoCode),
+    Tariff: ("tariff", CachedTariff),
+    User: ("user", CachedUser),
+}
+_BY_CLASS = {cls: tag for tag, cls in CACHED_MODELS.values()}
+_DATE_FIELDS = {
+    cls: [i for i, field in enumerate(fields(cls)) if field.type == Optional[date]]
+    for _, cls in CACHED_MODELS.values()
+}
+
+
+def to_cached(instance) -> CachedEntity:
+    """Строит объект для кэша из экземпляра модели ORM."""
+    if type(instance) in _BY_CLASS:
+        return instance
+    _, cls = CACHED_MODELS[type(instance)]
+    values = {}
+    for field in fields(cls):
+        value = getattr(instance, field.name)
+        values[field.name] = str(value) if field.name == "uuid" and value is not None else value
+    return cls(**values)
+
+
+def encode(instance) -> bytes:
+    entity = to_cached(instance)
+    row = list(astuple(entity))
+    for i in _DATE_FIELDS[type(entity)]:
+        if row[i] is not None:
+            row[i] = row[i].toordinal()
+    return orjson.dumps([SCHEMA_VERSION, _BY_CLASS[type(entity)], *row])
+
+
+def decode(data: Optional[bytes], model: Type) -> Optional[CachedEntity]:
+    """
+    Разбирает запись кэша для модели ORM. Возвращает None, если записи нет
+    или она записана в другой схеме.
+    """
+    if not data:
+        return None
+    tag, cls = CACHED_MODELS[model]
+    try:
+        row = orjson.loads(data)
+    except orjson.JSONDecodeError:
+        return None
+    if not isinstance(row, list) or row[:2] != [SCHEMA_VERSION, tag] or len(row) != len(fields(cls)) + 2:
+        return None
+    values = row[2:]
+    for i in _DATE_FIELDS[cls]:
+        if values[i] is not None:
+            values[i] = date.fromordinal(values[i])
+    return cls(*values)
@@ -19,6 +19,8 @@ class PromoCode(Base):
     expiration_date = Column(Date, nullable=True)
     is_deleted = Column(Boolean, default=False)
 
+    available_for_users = relationship("AvailableForUsers", back_populates="promo_code")
+
 
 class AvailableForUsers(Base):
     __tablename__ = "available_for_users"
@@ -13,6 +13,11 @@ class Group(Base):
     description = Column(String, nullable=True)
 
     users = relationship("User", back_populates="group")
+    available_promo_codes = relationship(
+        "AvailableForUsers",
+        secondary="available_groups",
+        back_populates="groups",
+    )
 
 
 class User(Base):
@@ -25,3 +30,9 @@ class User(Base):
     group_id = Column(Integer, ForeignKey("groups.id"))
 
     group = relationship("Group", back_populates="users")
+    purchases = relationship("Purchase", back_populates="user")
+    available_promo_codes = relationship(
+        "AvailableForUsers",
+        secondary="available_users",
+        back_populates="users",
+    )
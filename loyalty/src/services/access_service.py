@@ -1,8 +1,16 @@
+import backoff
+
+from datetime import datetime
+from typing import Dict, List, Optional, Set
+
 from fastapi import Depends
+from sqlalchemy import literal, union_all
 from sqlalchemy.future import select
+from asyncpg.exceptions import PostgresConnectionError as conn_err_pg
 from sqlalchemy.ext.asyncio import AsyncSession
 
-from models.promocode import AvailableForUsers
+from core.config import settings
+from models.promocode import PromoCode, AvailableForUsers, AvailableUsers, AvailableGroups
 from .base_service import BaseService
 from db.postgres_db import get_session
 from db.redis_db import RedisCache, get_redis
@@ -14,15 +22,57 @@ class AccessService(BaseService):
         self.model = AvailableForUsers
 
     async def is_promocode_available_for_user(self, promocode_id: int, user_id: int, group_id: int) -> bool:
-        user_access = await self.storage.execute(
-            select(AvailableForUsers).filter(
-                AvailableForUsers.promo_code_id == promocode_id,
-                (AvailableForUsers.users.contains(user_id) |
-                 AvailableForUsers.groups.contains(group_id))
+        """
+        Проверяет, выдан ли промокод пользователю лично или его группе. Доступы промокода
+        кэшируются в Redis множеством, проверка не читает его целиком.
+        """
+        granted = await self.cache.check_promocode_access(promocode_id, user_id, group_id)
+        if granted is None:
+            access = (await self.select_access_lists([promocode_id]))[promocode_id]
+            await self.cache.set_promocode_access(promocode_id, access, settings.entity_cache_ttl)
+            granted = user_id in access["users"] or (group_id is not None and group_id in access["groups"])
+        return granted
+
+    @backoff.on_exception(backoff.expo, conn_err_pg, max_tries=5)
+    async def select_access_lists(self, promocode_ids: List[int]) -> Dict[int, Dict[str, Set[int]]]:
+        """Загружает списки доступа для нескольких промокодов одним запросом."""
+        stmt = union_all(
+            select(AvailableForUsers.promo_code_id, literal("users"), AvailableUsers.user_id)
+            .join(AvailableUsers, AvailableUsers.available_for_users_id == AvailableForUsers.id)
+            .filter(AvailableForUsers.promo_code_id.in_(promocode_ids)),
+            select(AvailableForUsers.promo_code_id, literal("groups"), AvailableGroups.group_id)
+            .join(AvailableGroups, AvailableGroups.available_for_users_id == AvailableForUsers.id)
+            .filter(AvailableForUsers.promo_code_id.in_(promocode_ids)),
+        )
+        access = {promocode_id: {"users": set(), "groups": set()} for promocode_id in promocode_ids}
+        for promocode_id, kind, member_id in await self.storage.execute(stmt):
+            access[promocode_id][kind].add(member_id)
+        return access
+
+    async def get_available_promocodes(self, user_id: int, group_id: Optional[int]) -> List[PromoCode]:
+        """
+        Возвращает активные промокоды, доступные пользователю, одним запросом.
+        Выборка строится от выданных пользователю и его группе доступов,
+        поэтому время ответа не зависит от общего числа активных промокодов.
+        """
+        grants = select(AvailableUsers.available_for_users_id).filter(AvailableUsers.user_id == user_id)
+        if group_id is not None:
+            grants = grants.union(
+                select(AvailableGroups.available_for_users_id).filter(AvailableGroups.group_id == group_id)
+            )
+        granted_promocodes = select(AvailableForUsers.promo_code_id).filter(AvailableForUsers.id.in_(grants))
+        stmt = (
+            select(PromoCode)
+            .filter(
+                PromoCode.id.in_(granted_promocodes),
+                PromoCode.is_active == True,
+                PromoCode.is_deleted == False,
+                PromoCode.expiration_date >= datetime.utcnow().date(),
             )
+            .order_by(PromoCode.expiration_date, PromoCode.id)
         )
-        user_promo_access = user_access.scalars().first()
-        return user_promo_access is not None
+        result = await self.storage.execute(stmt)
+        return result.scalars().all()
 
 
 async def get_access_service(
@@ -2,15 +2,19 @@ import backoff
 import sentry_sdk
 
 from datetime import datetime
-from typing import List
+from typing import List, Optional
 from abc import ABC
 from sqlalchemy.exc import DBAPIError
 from fastapi.encoders import jsonable_encoder
 from sqlalchemy.future import select
 from asyncpg.exceptions import PostgresConnectionError as conn_err_pg
 
+from core.config import settings
+from db import tiered_cache
 from db.redis_db import RedisCache
+from db.tiered_cache import CACHE_POLICIES
 from db.postgres_db import AsyncSession
+from models import cache as cache_codec
 from models.user import User
 
 
@@ -40,19 +44,16 @@ class BaseService(AbstractBaseService):
         await self.storage.refresh(instance)
         return instance
 
-    @backoff.on_exception(backoff.expo, conn_err_pg, max_tries=5)
     async def get_instance_by_id(self, id: str):
-        stmt = select(self.model).filter(self.model.id == id)
-        try:
-            result = await self.storage.execute(stmt)
-            instance = result.scalars().first()
-            return instance
-        except Exception as e:
-            sentry_sdk.capture_exception(e)
-            return None
+        return await self.get_instance("id", id)
 
-    @backoff.on_exception(backoff.expo, conn_err_pg, max_tries=5)
     async def get_user_by_id(self, user_id: str):
+        return await self.get_cached_or_load(
+            f"user:{user_id}", lambda: self.select_user(user_id), settings.user_cache_ttl, User
+        )
+
+    @backoff.on_exception(backoff.expo, conn_err_pg, max_tries=5)
+    async def select_user(self, user_id: str):
         stmt = select(User).filter(User.id == user_id)
         try:
             result = await self.storage.execute(stmt)
@@ -76,9 +77,49 @@ class BaseService(AbstractBaseService):
             sentry_sdk.capture_exception(e)
             return None
 
-    @backoff.on_exception(backoff.expo, conn_err_pg, max_tries=5)
     async def get_instance_by_code(self, code: str):
-        stmt = select(self.model).filter(self.model.code == code)
+        return await self.get_instance("code", code)
+
+    async def get_instance(self, field: str, value):
+        """
+        Получает экземпляр модели по значению поля. Если для модели задана политика
+        кэширования по этому полю, экземпляр читается из L1, затем из Redis и только
+        потом из базы.
+        """
+        policy = CACHE_POLICIES.get(self.model)
+        if policy is None or policy.key_field != field:
+            return await self.select_instance(field, value)
+
+        return await self.get_cached_or_load(
+            f"{self.model.__name__.lower()}:{value}",
+            lambda: self.select_instance(field, value),
+            settings.entity_cache_ttl,
+        )
+
+    async def get_cached_or_load(self, cache_key: str, loader, expire: int, model=None):
+        """
+        Возвращает сущность из кэша, а при промахе загружает её через loader и кэширует.
+        Через двухуровневый кэш одновременные промахи по ключу выполняют одну загрузку.
+        """
+        model = model or self.model
+        tiered = tiered_cache.tiered_cache
+        if tiered is not None and tiered.policy(model):
+            return await tiered.get_or_load(cache_key, model, loader, expire)
+        # Сервис без кэша (например, в бенчмарках) читает сущность напрямую
+        if self.cache is None:
+            return await loader()
+
+        instance = await self.get_cache(cache_key, model)
+        if instance:
+            return instance
+        instance = await loader()
+        if instance:
+            await self.set_cache(cache_key, instance, expire, model)
+        return instance
+
+    @backoff.on_exception(backoff.expo, conn_err_pg, max_tries=5)
+    async def select_instance(self, field: str, value):
+        stmt = select(self.model).filter(getattr(self.model, field) == value)
         try:
             result = await self.storage.execute(stmt)
             instance = result.scalars().first()
@@ -90,7 +131,7 @@ class BaseService(AbstractBaseService):
     @backoff.on_exception(backoff.expo, conn_err_pg, max_tries=5)
     async def del_instance_by_id(self, id: str) -> bool:
         try:
-            instance = await self.get_instance_by_id(id)
+            instance = await self.select_instance("id", id)
             if instance:
                 await self.storage.delete(instance)
                 await self.storage.commit()
@@ -104,13 +145,26 @@ class BaseService(AbstractBaseService):
             sentry_sdk.capture_exception(e)
             return False
 
-    async def set_cache(self, cache_key: str, cache_value: dict) -> None:
-        await self.cache.set(cache_key, jsonable_encoder(cache_value))
+    def cache_key(self, instance) -> str:
+        policy = CACHE_POLICIES.get(self.model)
+        return f"{self.model.__name__.lower()}:{getattr(instance, policy.key_field if policy else 'id')}"
 
-    async def get_cache(self, cache_key: str):
-        return await self.cache.redis.get(cache_key)
+    async def set_cache(self, cache_key: str, instance, expire: Optional[int] = None, model=None) -> None:
+        model = model or self.model
+        tiered = tiered_cache.tiered_cache
+        if tiered is not None and tiered.policy(model):
+            await tiered.set(cache_key, instance, model, expire)
+        else:
+            await self.cache.set(cache_key, cache_codec.encode(instance), expire)
 
-    async def cache_active_instances(self, instances: List):
-        for instance in instances:
+    async def get_cache(self, cache_key: str, model=None):
+        """Возвращает объект из кэша или None при промахе и при записи в устаревшей схеме."""
+        model = model or self.model
+        tiered = tiered_cache.tiered_cache
+        if tiered is not None and tiered.policy(model):
+            return await tiered.get(cache_key, model)
+        return cache_codec.decode(await self.cache.get(cache_key), model)
 
-            await self.set_cache(f"{self.model.__name__.lower()}:{instance.id}", instance)
+    async def cache_active_instances(self, instances: List, expire: Optional[int] = None):
+        for instance in instances:
+            await self.set_cache(self.cache_key(instance), instance, expire or settings.entity_cache_ttl)
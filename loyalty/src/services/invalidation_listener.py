@@ -0,0 +1,110 @@
+import asyncio
+from typing import Optional
+
+import asyncpg
+import orjson
+import sentry_sdk
+
+from core.config import settings, pg_config_data
+from db import redis_db, tiered_cache
+from models.promocode import PromoCode
+from models.purchase import Tariff
+
+CHANNEL = "cache_invalidation"
+
+
+class InvalidationListener:
+    """
+    Сбрасывает кэши по уведомлениям Postgres из канала cache_invalidation.
+
+    Уведомления отправляют триггеры админки на promo_codes, tariffs и таблицах
+    доступа к промокодам, поэтому изменения из админки, массовых операций и
+    ручных запросов видны сразу, а не по истечении срока жизни кэша. Большие
+    изменения приходят несколькими уведомлениями. Каждый воркер держит своё
+    соединение: уведомление очищает его L1 и ключи в Redis, а остатки
+    использований в Redis сдвигает только один воркер - по ид уведомления.
+    После переподключения L1 очищается целиком, так как уведомления за время
+    разрыва потеряны.
+    """
+
+    def __init__(self, reconnect_interval: float):
+        self.reconnect_interval = reconnect_interval
+        self._queue: asyncio.Queue = asyncio.Queue()
+        self._task: asyncio.Task = None
+        self._connection: Optional[asyncpg.Connection] = None
+
+    def start(self):
+        self._task = asyncio.create_task(self.run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+        await self._close()
+
+    async def run(self):
+        while True:
+            try:
+                await self.listen()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                sentry_sdk.capture_exception(e)
+            await self._close()
+            await asyncio.sleep(self.reconnect_interval)
+
+    async def listen(self):
+        self._connection = await asyncpg.connect(
+            user=pg_config_data.user,
+            password=pg_config_data.password,
+            host=pg_config_data.host,
+            port=pg_config_data.port,
+            database=pg_config_data.dbname,
+        )
+        await self._connection.add_listener(CHANNEL, self._on_notify)
+        self.clear_local()
+        while not self._connection.is_closed():
+            try:
+                payload = await asyncio.wait_for(self._queue.get(), timeout=self.reconnect_interval)
+            except asyncio.TimeoutError:
+                continue
+            try:
+                await self.handle(orjson.loads(payload))
+            except Exception as e:
+                sentry_sdk.capture_exception(e)
+
+    def _on_notify(self, connection, pid, channel, payload):
+        self._queue.put_nowait(payload)
+
+    async def handle(self, message: dict):
+        entity = message["entity"]
+        if entity == "promocode":
+            items = [(item[0], item[1]) for item in message["items"]]
+            # Третий элемент - изменение num_uses, на него сдвигается остаток в Redis
+            num_uses_deltas = [(item[0], item[2]) for item in message["items"] if len(item) > 2 and item[2]]
+            for _, code in items:
+                tiered_cache.tiered_cache.invalidate_local(f"promocode:{code}", PromoCode)
+            await redis_db.redis.invalidate_promocodes(items, num_uses_deltas, message.get("id"))
+        elif entity == "tariff":
+            for tariff_id in message["items"]:
+                tiered_cache.tiered_cache.invalidate_local(f"tariff:{tariff_id}", Tariff)
+            await redis_db.redis.invalidate_tariffs(message["items"])
+
+    @staticmethod
+    def clear_local():
+        for l1 in tiered_cache.tiered_cache.l1.values():
+            l1.clear()
+
+    async def _close(self):
+        if self._connection is not None and not self._connection.is_closed():
+            try:
+                await self._connection.close(timeout=1)
+            except Exception:
+                self._connection.terminate()
+        self._connection = None
+
+
+invalidation_listener = InvalidationListener(reconnect_interval=settings.cache_invalidation_reconnect_interval)
@@ -0,0 +1,86 @@
+import asyncio
+import time
+from typing import Dict, Optional
+
+import aiohttp
+import jwt
+import sentry_sdk
+
+from core.config import settings
+
+
+class JWKSClient:
+    """
+    Открытые ключи подписи токенов сервиса авторизации.
+
+    Ключи загружаются из JWKS при старте воркера и обновляются раз в interval,
+    разобранные объекты ключей хранятся в памяти по kid, поэтому проверка
+    подписи токена не обращается к сети. Токен с неизвестным kid (например,
+    после ротации ключей) вызывает внеочередную загрузку, но не чаще раза в
+    min_refetch_interval.
+    """
+
+    def __init__(self, url: str, interval: float, min_refetch_interval: float):
+        self.url = url
+        self.interval = interval
+        self.min_refetch_interval = min_refetch_interval
+        self.keys: Dict[str, jwt.PyJWK] = {}
+        self._fetched_at = float("-inf")
+        self._lock = asyncio.Lock()
+        self._task: asyncio.Task = None
+
+    def start(self):
+        self._task = asyncio.create_task(self.run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+
+    async def run(self):
+        while True:
+            try:
+                await self.fetch()
+            except Exception as e:
+                sentry_sdk.capture_exception(e)
+            # Пока ключей нет, загрузка повторяется чаще
+            await asyncio.sleep(self.interval if self.keys else self.min_refetch_interval)
+
+    async def fetch(self):
+        """Загружает JWKS. При ошибке загрузки остаются прежние ключи."""
+        self._fetched_at = time.monotonic()
+        async with aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=5)) as client:
+            async with client.get(self.url) as response:
+                response.raise_for_status()
+                jwks = await response.json()
+        keys = {}
+        for data in jwks.get("keys", []):
+            try:
+                keys[data.get("kid")] = jwt.PyJWK(data)
+            except jwt.exceptions.PyJWKError as e:
+                sentry_sdk.capture_exception(e)
+        self.keys = keys
+
+    async def get_key(self, kid: Optional[str]) -> Optional[jwt.PyJWK]:
+        key = self.keys.get(kid)
+        if key is not None:
+            return key
+        async with self._lock:
+            key = self.keys.get(kid)
+            if key is None and time.monotonic() - self._fetched_at >= self.min_refetch_interval:
+                try:
+                    await self.fetch()
+                except Exception as e:
+                    sentry_sdk.capture_exception(e)
+                key = self.keys.get(kid)
+        return key
+
+
+jwks_client = JWKSClient(
+    url=settings.auth_jwks_url,
+    interval=settings.jwks_refresh_interval,
+    min_refetch_interval=settings.jwks_min_refetch_interval,
+)
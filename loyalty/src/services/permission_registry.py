@@ -0,0 +1,78 @@
+import asyncio
+import time
+from typing import Dict, Optional
+
+import aiohttp
+import sentry_sdk
+
+from core.config import settings
+
+# Claims access токена: маска разрешений (hex) и версия реестра битов
+PERMISSIONS_CLAIM = "perm"
+PERMISSIONS_VERSION_CLAIM = "pv"
+
+
+class PermissionRegistry:
+    """
+    Реестр битов разрешений сервиса авторизации: имя разрешения -> номер бита
+    в маске access токена.
+
+    Биты не переиспользуются, поэтому реестр читает маску любого токена с
+    версией не больше своей. Токен с более новой версией вызывает
+    внеочередную загрузку, но не чаще раза в min_refetch_interval.
+    """
+
+    def __init__(self, url: str, interval: float, min_refetch_interval: float):
+        self.url = url
+        self.interval = interval
+        self.min_refetch_interval = min_refetch_interval
+        self.version = 0
+        self.bits: Dict[str, int] = {}
+        self._fetched_at = float("-inf")
+        self._lock = asyncio.Lock()
+        self._task: asyncio.Task = None
+
+    def start(self):
+        self._task = asyncio.create_task(self.run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+
+    async def run(self):
+        while True:
+            try:
+                await self.fetch()
+            except Exception as e:
+                sentry_sdk.capture_exception(e)
+            await asyncio.sleep(self.interval)
+
+    async def fetch(self):
+        self._fetched_at = time.monotonic()
+        async with aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=5)) as client:
+            async with client.get(self.url) as response:
+                response.raise_for_status()
+                registry = await response.json()
+        self.bits = registry["permissions"]
+        self.version = registry["version"]
+
+    async def get_bit(self, name: str, token_version: int) -> Optional[int]:
+        if token_version > self.version:
+            async with self._lock:
+                if token_version > self.version and time.monotonic() - self._fetched_at >= self.min_refetch_interval:
+                    try:
+                        await self.fetch()
+                    except Exception as e:
+                        sentry_sdk.capture_exception(e)
+        return self.bits.get(name)
+
+
+permission_registry = PermissionRegistry(
+    url=settings.auth_permissions_url,
+    interval=settings.permission_registry_refresh_interval,
+    min_refetch_interval=settings.jwks_min_refetch_interval,
+)
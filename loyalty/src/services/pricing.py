@@ -0,0 +1,62 @@
+"""
+Векторный расчёт стоимости тарифов со скидками.
+
+Деньги хранятся в целых копейках, процентные скидки - в сотых долях процента,
+поэтому результат не зависит от ошибок округления float.
+"""
+from typing import Sequence
+
+import numpy as np
+
+PERCENTAGE = 0
+FIXED = 1
+TRIAL = 2
+
+DISCOUNT_TYPES = {
+    "percentage": PERCENTAGE,
+    "fixed": FIXED,
+    "trial": TRIAL,
+}
+
+# 100% в сотых долях процента
+FULL_PERCENT = 100 * 100
+
+
+def to_kopecks(amounts: Sequence[float]) -> np.ndarray:
+    """Переводит суммы в рублях в целые копейки."""
+    return np.rint(np.asarray(amounts, dtype=np.float64) * 100).astype(np.int64)
+
+
+def from_kopecks(amounts: np.ndarray) -> np.ndarray:
+    """Переводит суммы в копейках обратно в рубли."""
+    return amounts / 100
+
+
+def encode_discount_types(discount_types: Sequence[str]) -> np.ndarray:
+    """Кодирует типы скидок числами для векторного расчёта."""
+    try:
+        return np.fromiter((DISCOUNT_TYPES[t] for t in discount_types), dtype=np.int8, count=len(discount_types))
+    except KeyError as e:
+        raise ValueError(f"Unsupported discount type: {e.args[0]}")
+
+
+def price_matrix(prices: np.ndarray, discount_types: np.ndarray, discounts: Sequence[float]) -> np.ndarray:
+    """
+    Считает итоговую стоимость каждого тарифа с каждым промокодом за один проход.
+
+    prices - цены тарифов в копейках, форма (T,);
+    discount_types - коды типов скидок из DISCOUNT_TYPES, форма (P,);
+    discounts - значения скидок промокодов (проценты или рубли), форма (P,).
+    Возвращает матрицу (T, P) итоговых цен в копейках.
+    """
+    prices = np.asarray(prices, dtype=np.int64)[:, np.newaxis]
+    discounts = np.asarray(discounts, dtype=np.float64)
+
+    # Процент считаем в сотых долях, округление до копейки - половина вверх
+    percent = np.clip(np.rint(discounts * 100), 0, FULL_PERCENT).astype(np.int64)
+    by_percentage = (prices * (FULL_PERCENT - percent) + FULL_PERCENT // 2) // FULL_PERCENT
+    by_fixed = prices - to_kopecks(discounts)
+
+    result = np.where(discount_types == PERCENTAGE, by_percentage, by_fixed)
+    result = np.where(discount_types == TRIAL, 0, result)
+    return np.maximum(result, 0)
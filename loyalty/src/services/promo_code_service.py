@@ -1,15 +1,17 @@
 import sentry_sdk
 
-from typing import List
+from typing import List, Union
 from datetime import datetime
 from fastapi import Depends
 from sqlalchemy.ext.asyncio import AsyncSession
 
+from core.config import settings
 from models.promocode import PromoCode
 from .base_service import BaseService
 from db.postgres_db import get_session
 from db.redis_db import RedisCache, get_redis
 from .access_service import AccessService, get_access_service
+from .promocode_filter import promocode_filter
 
 
 class PromoCodeService(BaseService):
@@ -18,39 +20,58 @@ class PromoCodeService(BaseService):
         self.model = PromoCode
         self.access_service = access_service
 
+    async def select_instance(self, field: str, value):
+        promocode = await super().select_instance(field, value)
+        if promocode is not None:
+            # Каждая загрузка промокода из базы обновляет индекс активных промокодов
+            await self.cache.index_promocode(promocode)
+        return promocode
+
     async def get_valid_promocode(self, promocode_str: str, user_id: int) -> PromoCode:
         """Проверяет валидность промокода."""
-        promocode_cache_key = f"promocode:{promocode_str}"
-        cached_promocode = await self.get_cache(promocode_cache_key)
-
-        if not cached_promocode:
-            try:
-                promocode: PromoCode = await self.get_instance_by_code(promocode_str)
-                if not promocode or not promocode.is_active:
-                    return 'not found'
-
-                user = await self.get_user_by_id(user_id)
+        # Несуществующие коды отбрасываются фильтром Блума без обращения к Redis и Postgres
+        if not promocode_filter.might_exist(promocode_str):
+            return 'not found'
+
+        # Повторные неудачные попытки стоят одного запроса к Redis
+        negative = await self.cache.get_promocode_negative(promocode_str, user_id)
+        if negative:
+            return negative
+
+        try:
+            # Промокод и пользователь читаются через двухуровневый кэш,
+            # доступ пользователя к промокоду проверяется при каждом применении
+            promocode = await self.check_promocode(promocode_str, user_id)
+            if isinstance(promocode, str):
+                await self.cache.set_promocode_negative(
+                    promocode_str, user_id, promocode, settings.negative_cache_ttl[promocode]
+                )
+            return promocode
+        except Exception as e:
+            sentry_sdk.capture_exception(e)
+            raise e
+
+    async def check_promocode(self, promocode_str: str, user_id: int) -> Union[PromoCode, str]:
+        """Проверяет промокод. Возвращает промокод или причину отказа."""
+        promocode: PromoCode = await self.get_instance_by_code(promocode_str)
+        if not promocode or not promocode.is_active or promocode.is_deleted:
+            return 'not found'
 
-                if not user:
-                    return 'User not found'
+        user = await self.get_user_by_id(user_id)
 
-                # Проверяем доступность промокода для пользователя через AccessService
-                user_has_access = await self.access_service.is_promocode_available_for_user(promocode.id, user_id, user.group_id)
+        if not user:
+            return 'User not found'
 
-                if not user_has_access:
-                    return 'not access'
+        # Проверяем доступность промокода для пользователя через AccessService
+        user_has_access = await self.access_service.is_promocode_available_for_user(promocode.id, user.id, user.group_id)
 
-                if promocode.expiration_date and promocode.expiration_date < datetime.utcnow().date():
-                    return 'expired'
+        if not user_has_access:
+            return 'not access'
 
-                # Кэшируем активный промокод
-                await self.cache_active_instances([promocode])
-                return promocode
+        if promocode.expiration_date and promocode.expiration_date < datetime.utcnow().date():
+            return 'expired'
 
-            except Exception as e:
-                sentry_sdk.capture_exception(e)
-                raise e
-        return cached_promocode
+        return promocode
 
     async def get_active_promocodes_for_user(self, user_id: int) -> List[dict]:
         """Получает активные промокоды для пользователя."""
@@ -59,17 +80,18 @@ class PromoCodeService(BaseService):
         if not user:
             return None
 
-        active_promocodes = self.get_active_promocodes()
-
-        user_promocodes = []
-        for promo in active_promocodes:
-            if await self.access_service.is_promocode_available_for_user(promo.id, user_id, user.group_id):
-                user_promocodes.append({
-                    "code": promo.code,
-                    "discount_type": promo.discount_type,
-                    "discount_value": promo.discount,
-                    "expiration_date": promo.expiration_date,
-                })
+        # Доступность проверяется одним запросом вместо запроса на каждый промокод
+        active_promocodes = await self.access_service.get_available_promocodes(user_id, user.group_id)
+
+        user_promocodes = [
+            {
+                "code": promo.code,
+                "discount_type": promo.discount_type,
+                "discount_value": promo.discount,
+                "expiration_date": promo.expiration_date,
+            }
+            for promo in active_promocodes
+        ]
 
         return user_promocodes
 
@@ -0,0 +1,83 @@
+import asyncio
+
+import sentry_sdk
+
+from core.config import settings
+from db import redis_db
+from utils.bloom import BloomFilter
+
+# На сколько версий воркер догоняет фильтр по потоку изменений, дальше - полная загрузка
+MAX_UPDATES = 1000
+
+
+class PromoCodeFilter:
+    """
+    Держит в памяти воркера фильтр Блума по существующим промокодам. При смене
+    версии применяет биты, добавленные в следующих версиях, из потока изменений
+    в Redis; фильтр загружается целиком при первом запуске, при пропуске версий
+    и после перестроения или объединения с большим фильтром. Пока фильтр не
+    загружен, пропускает все коды.
+    """
+
+    def __init__(self, interval: float):
+        self.interval = interval
+        self.version: int = None
+        self.bloom: BloomFilter = None
+        self._task: asyncio.Task = None
+
+    def might_exist(self, code: str) -> bool:
+        return self.bloom is None or code in self.bloom
+
+    def start(self):
+        self._task = asyncio.create_task(self.run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+
+    async def run(self):
+        while True:
+            try:
+                await self.refresh()
+            except Exception as e:
+                sentry_sdk.capture_exception(e)
+            await asyncio.sleep(self.interval)
+
+    async def refresh(self):
+        meta = await redis_db.redis.get_promocode_filter_meta()
+        if meta is None:
+            # Фильтр ещё не построен или удалён - не отбрасываем ничего
+            self.bloom, self.version = None, None
+            return
+        if meta["version"] == self.version:
+            return
+        if await self.apply_updates(meta):
+            return
+        bits = await redis_db.redis.get_promocode_filter()
+        self.bloom = BloomFilter(meta["m"], meta["k"], bits or b"")
+        self.version = meta["version"]
+
+    async def apply_updates(self, meta: dict) -> bool:
+        """Догоняет версию фильтра по потоку изменений. False - нужна полная загрузка."""
+        if self.bloom is None or (self.bloom.m, self.bloom.k) != (meta["m"], meta["k"]):
+            return False
+        missing = meta["version"] - self.version
+        if not 0 < missing <= MAX_UPDATES:
+            return False
+        updates = await redis_db.redis.get_promocode_filter_updates(self.version, missing)
+        versions = [version for version, _ in updates]
+        if versions != list(range(self.version + 1, meta["version"] + 1)):
+            return False
+        if any(positions is None for _, positions in updates):
+            return False
+        for _, positions in updates:
+            self.bloom.set_positions(positions)
+        self.version = meta["version"]
+        return True
+
+
+promocode_filter = PromoCodeFilter(interval=settings.promocode_filter_refresh_interval)
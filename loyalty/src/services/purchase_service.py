@@ -1,25 +1,35 @@
+import uuid
+import backoff
 import sentry_sdk
 
-from datetime import datetime
+from datetime import datetime, timedelta
+from typing import List, Union
 from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.future import select
 from fastapi import Depends
+from asyncpg.exceptions import PostgresConnectionError as conn_err_pg
 
+from core.config import settings
 from models.purchase import Tariff, Purchase
 from models.promocode import PromoCode
+from . import pricing
 from .base_service import BaseService
-from .promo_code_service import PromoCodeService
+from .promo_code_service import PromoCodeService, get_promo_code_service
 from db.postgres_db import get_session
 from db.redis_db import RedisCache, get_redis
 
 
 class PurchaseService(BaseService):
-    def __init__(self, cache: RedisCache, storage: AsyncSession):
+    def __init__(self, cache: RedisCache, storage: AsyncSession, promo_code_service: PromoCodeService):
         super().__init__(cache, storage)
+        self.model = Purchase
+        self.promo_code_service = promo_code_service
 
+    @staticmethod
     def calculate_final_amount(original_amount: float, promocode: PromoCode) -> float:
         discount_value = promocode.discount
         if promocode.discount_type == "percentage":
-            final_amount = original_amount * (100 - discount_value / 100)
+            final_amount = original_amount * (100 - discount_value) / 100
         elif promocode.discount_type == "fixed":
             final_amount = original_amount - discount_value
         elif promocode.discount_type == "trial":
@@ -29,6 +39,74 @@ class PurchaseService(BaseService):
 
         return max(final_amount, 0)
 
+    async def get_tariff(self, tariff_id: int) -> Tariff:
+        """Получает действующий тариф по ID."""
+        tariff = await self.get_cached_or_load(
+            f"tariff:{tariff_id}", lambda: self.select_tariff(tariff_id), settings.entity_cache_ttl, Tariff
+        )
+        if not tariff or tariff.is_deleted:
+            return None
+        return tariff
+
+    @backoff.on_exception(backoff.expo, conn_err_pg, max_tries=5)
+    async def select_tariff(self, tariff_id: int) -> Tariff:
+        stmt = select(Tariff).filter(Tariff.id == tariff_id)
+        try:
+            result = await self.storage.execute(stmt)
+            return result.scalars().first()
+        except Exception as e:
+            sentry_sdk.capture_exception(e)
+            return None
+
+    @backoff.on_exception(backoff.expo, conn_err_pg, max_tries=5)
+    async def get_tariffs(self) -> List[Tariff]:
+        """Получает все действующие тарифы."""
+        stmt = select(Tariff).filter(Tariff.is_deleted == False).order_by(Tariff.id)
+        try:
+            result = await self.storage.execute(stmt)
+            return result.scalars().all()
+        except Exception as e:
+            sentry_sdk.capture_exception(e)
+            return []
+
+    async def quote_tariffs(self, user_id: int) -> List[dict]:
+        """
+        Считает стоимость всех действующих тарифов без промокода и с каждым
+        активным промокодом пользователя. Вся матрица тариф x промокод
+        считается одним векторным проходом.
+        """
+        user = await self.get_user_by_id(user_id)
+        if not user:
+            return None
+
+        tariffs = await self.get_tariffs()
+        promocodes = await self.promo_code_service.access_service.get_available_promocodes(user.id, user.group_id)
+
+        prices = pricing.to_kopecks([tariff.price for tariff in tariffs])
+        matrix = pricing.from_kopecks(pricing.price_matrix(
+            prices,
+            pricing.encode_discount_types([promo.discount_type for promo in promocodes]),
+            [promo.discount for promo in promocodes],
+        )).tolist()
+
+        return [
+            {
+                "tariff_id": tariff.id,
+                "name": tariff.name,
+                "price": tariff.price,
+                "offers": [
+                    {
+                        "code": promo.code,
+                        "discount_type": promo.discount_type,
+                        "discount_value": promo.discount,
+                        "final_amount": final_amount,
+                    }
+                    for promo, final_amount in zip(promocodes, row)
+                ],
+            }
+            for tariff, row in zip(tariffs, matrix)
+        ]
+
     async def get_purchase(self, purchase_id: int, user_id: int) -> Purchase:
         """Получает запись о покупке по ID для конкретного пользователя."""
         purchase: Purchase = await self.get_instance_by_id(purchase_id)
@@ -36,36 +114,50 @@ class PurchaseService(BaseService):
             return None
         return purchase
 
-    async def cancel_purchase(self, purchase_id: int, user_id: int) -> None:
-        """Отменяет покупку по ID."""
+    async def cancel_purchase(self, purchase_id: int, user_id: int) -> float:
+        """Отменяет покупку по ID и возвращает стандартную стоимость тарифа."""
         purchase: Purchase = await self.get_instance_by_id(purchase_id)
 
         if not purchase or purchase.user_id != user_id:
             return None
 
-        await self.del_instance_by_id(purchase_id)
-
-    async def use_promocode(self, user_id: int, promocode_str: str, tariff_id: int) -> dict:
-        """Использует промокод для покупки и возвращает данные о результате."""
+        tariff: Tariff = await self.get_tariff(purchase.tariff_id)
+        if not await self.del_instance_by_id(purchase_id):
+            return None
+        if purchase.promo_code_id:
+            # Возвращаем использование промокода в остаток
+            await self.cache.cancel_promocode_usage(purchase.promo_code_id)
+        return tariff.price if tariff else purchase.total_price
+
+    async def reserve_promocode(self, user_id: int, promocode_str: str, tariff_id: int) -> Union[dict, str, None]:
+        """
+        Бронирует использование промокода для покупки тарифа на settings.promocode_hold_ttl секунд.
+        В Postgres ничего не пишется: бронь живёт в Redis до подтверждения или отмены.
+        """
         try:
-            promocode_service = PromoCodeService(self.cache, self.storage)
-            promocode: PromoCode = await promocode_service.get_valid_promocode(promocode_str, user_id)
+            promocode: PromoCode = await self.promo_code_service.get_valid_promocode(promocode_str, user_id)
+            if isinstance(promocode, str):
+                return promocode
 
-            tariff: Tariff = await self.get_instance_by_id(tariff_id)
+            tariff: Tariff = await self.get_tariff(tariff_id)
             if not tariff:
                 return None
-            final_amount = await self.calculate_final_amount(tariff.price, promocode)
-
-            purchase = Purchase(
-                user_id=user_id,
-                tariff_id=tariff_id,
-                promocode_id=promocode.id,
-                amount=final_amount,
-                created_at=datetime.utcnow()
+
+            final_amount = self.calculate_final_amount(tariff.price, promocode)
+            reservation_id = uuid.uuid4().hex
+            remaining = await self.cache.reserve_promocode_usage(
+                promocode.id,
+                promocode.num_uses,
+                reservation_id,
+                {"user_id": user_id, "tariff_id": tariff_id, "price": tariff.price, "total_price": final_amount},
+                settings.promocode_hold_ttl,
             )
-            await self.create_new_instance(purchase)
+            if remaining is None:
+                return 'exhausted'
 
             return {
+                "reservation_id": reservation_id,
+                "expires_at": datetime.utcnow() + timedelta(seconds=settings.promocode_hold_ttl),
                 "discount_type": promocode.discount_type,
                 "discount_value": promocode.discount,
                 "final_amount": final_amount,
@@ -74,9 +166,46 @@ class PurchaseService(BaseService):
             sentry_sdk.capture_exception(e)
             raise e
 
+    async def commit_reservation(self, reservation_id: str, user_id: int) -> Union[dict, str, None]:
+        """
+        Подтверждает бронь после успешной оплаты. Покупка записывается в Postgres
+        фоновым PurchaseWriter пачкой вместе с другими подтверждёнными покупками.
+        """
+        hold = await self.cache.commit_promocode_hold(reservation_id, str(user_id))
+        if not isinstance(hold, dict):
+            return hold
+        return {
+            "promo_code_id": hold["promocode_id"],
+            "tariff_id": hold["tariff_id"],
+            "final_amount": hold["total_price"],
+        }
+
+    async def cancel_reservation(self, reservation_id: str, user_id: int) -> float:
+        """Отменяет бронь и возвращает стандартную стоимость тарифа."""
+        hold = await self.cache.release_promocode_hold(reservation_id, str(user_id))
+        if not hold:
+            return None
+        return hold["price"]
+
+    async def use_promocode(self, user_id: int, promocode_str: str, tariff_id: int) -> Union[dict, str, None]:
+        """Использует промокод для покупки: бронирует использование и сразу подтверждает бронь."""
+        reservation = await self.reserve_promocode(user_id, promocode_str, tariff_id)
+        if not isinstance(reservation, dict):
+            return reservation
+
+        if not isinstance(await self.commit_reservation(reservation["reservation_id"], user_id), dict):
+            return None
+
+        return {
+            "discount_type": reservation["discount_type"],
+            "discount_value": reservation["discount_value"],
+            "final_amount": reservation["final_amount"],
+        }
+
 
 async def get_purchase_service(
     redis: RedisCache = Depends(get_redis),
     db: AsyncSession = Depends(get_session),
-) -> PromoCodeService:
-    return PromoCodeService(redis, db)
+    promo_code_service: PromoCodeService = Depends(get_promo_code_service),
+) -> PurchaseService:
+    return PurchaseService(redis, db, promo_code_service)
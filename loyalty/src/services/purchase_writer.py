@@ -0,0 +1,113 @@
+import asyncio
+from datetime import datetime
+from typing import List
+
+import orjson
+import sentry_sdk
+from sqlalchemy import insert
+from sqlalchemy.exc import DataError, IntegrityError
+
+from core.config import settings
+from db import redis_db
+from db.postgres_db import async_session
+from models.purchase import Purchase
+
+# Ошибки, которые повторная запись не исправит: испорченная запись или нарушение ограничений
+BAD_PURCHASE_ERRORS = (DataError, IntegrityError, KeyError, TypeError, ValueError)
+
+
+class PurchaseWriter:
+    """
+    Переносит подтверждённые покупки из очереди Redis в purchases пачками
+    и снимает просроченные брони промокодов.
+    """
+
+    def __init__(self, interval: float, batch_size: int):
+        self.interval = interval
+        self.batch_size = batch_size
+        self._task: asyncio.Task = None
+
+    def start(self):
+        self._task = asyncio.create_task(self.run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+        # Записываем всё подтверждённое перед остановкой воркера
+        try:
+            while await self.flush():
+                pass
+        except Exception as e:
+            sentry_sdk.capture_exception(e)
+
+    async def run(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                while await redis_db.redis.release_expired_holds(self.batch_size) == self.batch_size:
+                    pass
+                while await self.flush() == self.batch_size:
+                    pass
+            except Exception as e:
+                sentry_sdk.capture_exception(e)
+
+    async def flush(self) -> int:
+        # Очередь разбирает один воркер, иначе одни и те же покупки будут записаны дважды
+        token = await redis_db.redis.lock_pending_purchases(expire=max(int(self.interval * 10), 10))
+        if token is None:
+            return 0
+        try:
+            records = await redis_db.redis.get_pending_purchases(self.batch_size)
+            if records:
+                dead = await self.write(records)
+                await redis_db.redis.ack_pending_purchases(len(records), dead)
+            return len(records)
+        finally:
+            await redis_db.redis.unlock_pending_purchases(token)
+
+    async def write(self, records: List[bytes]) -> List[bytes]:
+        """
+        Записывает пачку покупок. Если пачку отвергла база, покупки пишутся по одной,
+        а те, что не записались и так, возвращаются для очереди разбора: иначе одна
+        испорченная запись навсегда останавливает очередь.
+        """
+        try:
+            await self.apply([self.parse(record) for record in records])
+            return []
+        except BAD_PURCHASE_ERRORS as e:
+            sentry_sdk.capture_exception(e)
+        dead = []
+        for record in records:
+            try:
+                await self.apply([self.parse(record)])
+            except BAD_PURCHASE_ERRORS as e:
+                sentry_sdk.capture_exception(e)
+                dead.append(record)
+        return dead
+
+    @staticmethod
+    def parse(record: bytes) -> dict:
+        purchase = orjson.loads(record)
+        return {
+            "user_id": int(purchase["user_id"]),
+            "tariff_id": int(purchase["tariff_id"]),
+            "promo_code_id": int(purchase["promocode_id"]),
+            "total_price": float(purchase["total_price"]),
+            "purchase_date": datetime.utcfromtimestamp(purchase["purchase_date"]),
+        }
+
+    @staticmethod
+    async def apply(purchases: List[dict]):
+        async with async_session() as session:
+            await session.execute(insert(Purchase.__table__), purchases)
+            await session.commit()
+
+
+purchase_writer = PurchaseWriter(
+    interval=settings.purchase_flush_interval,
+    batch_size=settings.purchase_flush_batch_size,
+)
@@ -0,0 +1,82 @@
+import asyncio
+from typing import List, Tuple
+
+import sentry_sdk
+from sqlalchemy import bindparam, func, text, update
+
+from core.config import settings
+from db import redis_db
+from db.postgres_db import async_session
+from models.promocode import PromoCode
+
+
+class UsageReconciler:
+    """Переносит счётчики использований промокодов из Redis в promo_codes пачками."""
+
+    def __init__(self, interval: float, batch_size: int):
+        self.interval = interval
+        self.batch_size = batch_size
+        self._task: asyncio.Task = None
+
+    def start(self):
+        self._task = asyncio.create_task(self.run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+        # Переносим всё накопленное перед остановкой воркера
+        try:
+            while await self.reconcile():
+                pass
+        except Exception as e:
+            sentry_sdk.capture_exception(e)
+
+    async def run(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                while await self.reconcile() == self.batch_size:
+                    pass
+            except Exception as e:
+                sentry_sdk.capture_exception(e)
+
+    async def reconcile(self) -> int:
+        # Счётчики уменьшаются только после коммита: остаток, заново инициализированный
+        # во время переноса, учитывает ещё не перенесённые использования
+        token = await redis_db.redis.lock_promocode_usage(expire=max(int(self.interval * 10), 10))
+        if token is None:
+            return 0
+        try:
+            usage = await redis_db.redis.get_promocode_usage(self.batch_size)
+            if usage:
+                await self.apply(usage)
+                await redis_db.redis.ack_promocode_usage(usage)
+            return len(usage)
+        finally:
+            await redis_db.redis.unlock_promocode_usage(token)
+
+    @staticmethod
+    async def apply(usage: List[Tuple[int, int]]):
+        table = PromoCode.__table__
+        stmt = (
+            update(table)
+            .where(table.c.id == bindparam("promocode_id"))
+            .values(num_uses=func.greatest(table.c.num_uses - bindparam("delta"), 0))
+        )
+        async with async_session() as session:
+            # Остатки в Redis уже актуальны, перенос счётчиков не должен сбрасывать кэши
+            await session.execute(text("SET LOCAL loyalty.cache_notify = 'off'"))
+            await session.execute(
+                stmt, [{"promocode_id": promocode_id, "delta": delta} for promocode_id, delta in usage]
+            )
+            await session.commit()
+
+
+usage_reconciler = UsageReconciler(
+    interval=settings.usage_reconcile_interval,
+    batch_size=settings.usage_reconcile_batch_size,
+)
@@ -0,0 +1,124 @@
+import asyncio
+import time
+from datetime import datetime
+from typing import List
+
+import sentry_sdk
+from sqlalchemy.future import select
+
+from core.config import settings
+from db import redis_db, tiered_cache
+from db.postgres_db import async_session
+from models.promocode import PromoCode
+from models.purchase import Tariff
+from .access_service import AccessService
+
+WARMUP_LOCK_KEY = "cache_warmup:lock"
+WARMUP_DONE_KEY = "cache_warmup:done"
+
+
+class CacheWarmer:
+    """
+    Прогревает кэши воркера при старте: тарифы, активные промокоды и списки доступа к ним.
+
+    Из базы промокоды загружает только один воркер - владелец блокировки в Redis,
+    пачками с ограниченным параллелизмом, и кладёт их только в Redis: L1 живёт
+    секунды и к первым запросам уже пуст. Остальные воркеры дожидаются его.
+    """
+
+    def __init__(self, concurrency: int, batch_size: int):
+        self.concurrency = concurrency
+        self.batch_size = batch_size
+        self.ready = False
+        self.stats = {"tariffs": 0, "promocodes": 0, "source": None, "seconds": None}
+        self._task: asyncio.Task = None
+
+    def start(self):
+        self._task = asyncio.create_task(self.run())
+
+    async def stop(self):
+        if self._task is not None and not self._task.done():
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+
+    async def run(self):
+        started = time.monotonic()
+        try:
+            await self.warm_tariffs()
+            warmed = await redis_db.redis.get(WARMUP_DONE_KEY)
+            token = None
+            if not warmed:
+                token = await redis_db.redis.lock(WARMUP_LOCK_KEY, int(settings.warmup_timeout * 1000))
+            if token is not None:
+                try:
+                    await self.warm_promocodes_from_db()
+                    await redis_db.redis.set(WARMUP_DONE_KEY, 1, expire=settings.entity_cache_ttl)
+                finally:
+                    await redis_db.redis.unlock(WARMUP_LOCK_KEY, token)
+            else:
+                await self.wait_for_promocodes()
+        except Exception as e:
+            # Холодный воркер работает медленнее, но корректно
+            sentry_sdk.capture_exception(e)
+        self.stats["seconds"] = round(time.monotonic() - started, 3)
+        self.ready = True
+
+    async def warm_tariffs(self):
+        async with async_session() as session:
+            result = await session.execute(select(Tariff).filter(Tariff.is_deleted == False))
+            tariffs = result.scalars().all()
+        for tariff in tariffs:
+            await tiered_cache.tiered_cache.set(f"tariff:{tariff.id}", tariff, Tariff, settings.entity_cache_ttl)
+        self.stats["tariffs"] = len(tariffs)
+
+    async def warm_promocodes_from_db(self):
+        self.stats["source"] = "postgres"
+        async with async_session() as session:
+            # Прогреваются самые новые промокоды в пределах warmup_max_promocodes
+            result = await session.execute(
+                select(PromoCode.id).filter(*self.active_filter())
+                .order_by(PromoCode.id.desc()).limit(settings.warmup_max_promocodes)
+            )
+            ids = result.scalars().all()
+
+        semaphore = asyncio.Semaphore(self.concurrency)
+
+        async def warm_batch(batch: List[int]):
+            async with semaphore, async_session() as session:
+                result = await session.execute(select(PromoCode).filter(PromoCode.id.in_(batch)))
+                promocodes = result.scalars().all()
+                access = await AccessService(redis_db.redis, session).select_access_lists(batch)
+            for promocode in promocodes:
+                await tiered_cache.tiered_cache.set(
+                    f"promocode:{promocode.code}", promocode, PromoCode, settings.entity_cache_ttl, local=False
+                )
+                await redis_db.redis.index_promocode(promocode)
+                await redis_db.redis.set_promocode_access(promocode.id, access[promocode.id], settings.entity_cache_ttl)
+            self.stats["promocodes"] += len(promocodes)
+
+        await asyncio.gather(*(
+            warm_batch(ids[start:start + self.batch_size]) for start in range(0, len(ids), self.batch_size)
+        ))
+
+    async def wait_for_promocodes(self):
+        self.stats["source"] = "redis"
+        # Ждём, пока другой воркер загрузит промокоды из базы в Redis
+        deadline = time.monotonic() + settings.warmup_timeout
+        while time.monotonic() < deadline and not await redis_db.redis.get(WARMUP_DONE_KEY):
+            if await redis_db.redis.get(WARMUP_LOCK_KEY) is None:
+                break
+            await asyncio.sleep(0.2)
+
+    @staticmethod
+    def active_filter():
+        return (
+            PromoCode.is_active == True,
+            PromoCode.is_deleted == False,
+            (PromoCode.expiration_date == None) | (PromoCode.expiration_date >= datetime.utcnow().date()),
+        )
+
+
+cache_warmer = CacheWarmer(concurrency=settings.warmup_concurrency, batch_size=settings.warmup_batch_size)
@@ -1,20 +1,27 @@
 import jwt
-import aiohttp
 
 from fastapi import status, HTTPException, Request
 from fastapi.security import HTTPAuthorizationCredentials, HTTPBearer
 from typing import Optional
 
 from core.config import settings
+from db import redis_db
+from db.postgres_db import async_session
+from services.base_service import BaseService
+from services.jwks import jwks_client
+from services.permission_registry import permission_registry, PERMISSIONS_CLAIM, PERMISSIONS_VERSION_CLAIM
 
 
-def decode_jwt(
+async def decode_jwt(
     jwt_token: str,
-    private_key: str = settings.auth_jwt.secret_key,
-    algorithm: str = settings.auth_jwt.algorithm,
+    algorithms: list = settings.auth_jwt.algorithms,
 ):
+    # Подпись проверяется открытым ключом из кэша воркера, без запроса в сервис авторизации
     try:
-        decoded = jwt.decode(jwt_token, private_key, algorithms=[algorithm])
+        key = await jwks_client.get_key(jwt.get_unverified_header(jwt_token).get("kid"))
+        if key is None:
+            raise jwt.exceptions.InvalidSignatureError("Unknown signing key")
+        decoded = jwt.decode(jwt_token, key.key, algorithms=algorithms)
     except jwt.exceptions.DecodeError:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
@@ -36,6 +43,15 @@ def decode_jwt(
     return decoded
 
 
+async def has_permission(payload: dict, name: str) -> bool:
+    """Проверка разрешения по битовой маске из access токена, без запроса в сервис авторизации."""
+    bit = await permission_registry.get_bit(name, payload.get(PERMISSIONS_VERSION_CLAIM, 0))
+    encoded_mask = payload.get(PERMISSIONS_CLAIM)
+    if not encoded_mask or bit is None:
+        return False
+    return (int(encoded_mask, 16) >> bit) & 1 == 1
+
+
 class JWTBearer(HTTPBearer):
     def __init__(self, check_user: bool = False, auto_error: bool = True):
         super().__init__(auto_error=auto_error)
@@ -53,7 +69,7 @@ class JWTBearer(HTTPBearer):
                 status_code=status.HTTP_401_UNAUTHORIZED,
                 detail="Only Bearer token might be accepted",
             )
-        decoded_token = self.parse_token(credentials.credentials)
+        decoded_token = await self.parse_token(credentials.credentials)
         if not decoded_token:
             raise HTTPException(
                 status_code=status.HTTP_403_FORBIDDEN,
@@ -61,13 +77,10 @@ class JWTBearer(HTTPBearer):
             )
 
         if self.check_user:
-            # проверить usera в бд
-            response = await self.check(
-                "http://127.0.0.1:8080/api/v1/users/me",
-                params={},
-                headers={"Authorization": f"Bearer {credentials.credentials}"},
-            )
-            if response.status != status.HTTP_202_ACCEPTED:
+            # пользователь проверяется по базе лояльности через кэш пользователей
+            async with async_session() as session:
+                user = await BaseService(redis_db.redis, session).get_user_by_id(decoded_token.get("sub"))
+            if user is None or not user.is_active:
                 raise HTTPException(
                     status_code=status.HTTP_403_FORBIDDEN, detail="User doesn't exist"
                 )
@@ -75,14 +88,8 @@ class JWTBearer(HTTPBearer):
         return decoded_token
 
     @staticmethod
-    def parse_token(jwt_token: str) -> Optional[dict]:
-        return decode_jwt(jwt_token=jwt_token)
-
-    @staticmethod
-    async def check(query: str, params: dict = {}, headers: dict = {}, json: dict = {}):
-        async with aiohttp.ClientSession(headers=headers) as client:
-            response = await client.get(query, json=json, params=params)
-        return response
+    async def parse_token(jwt_token: str) -> Optional[dict]:
+        return await decode_jwt(jwt_token=jwt_token)
 
 
 security_jwt = JWTBearer()
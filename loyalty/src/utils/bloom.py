@@ -0,0 +1,38 @@
+import hashlib
+from typing import Iterable, List
+
+
+class BloomFilter:
+    """
+    Фильтр Блума по промокодам, построенный админкой (admin/promocodes/bloom.py).
+    Хеширование и порядок бит должны совпадать с реализацией в админке.
+    """
+
+    def __init__(self, m: int, k: int, bits: bytes):
+        self.m = m
+        self.k = k
+        self.bits = bits
+
+    def set_positions(self, positions: Iterable[int]):
+        """Устанавливает биты, добавленные в фильтр в Redis после загрузки."""
+        bits = self.bits if isinstance(self.bits, bytearray) else bytearray(self.bits)
+        if len(bits) < self.m // 8:
+            bits.extend(bytes(self.m // 8 - len(bits)))
+        for position in positions:
+            bits[position >> 3] |= 0x80 >> (position & 7)
+        self.bits = bits
+
+    def positions(self, code: str) -> List[int]:
+        digest = hashlib.blake2b(code.encode(), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], "big")
+        h2 = int.from_bytes(digest[8:], "big") | 1
+        return [(h1 + i * h2) % self.m for i in range(self.k)]
+
+    def __contains__(self, code: str) -> bool:
+        bits = self.bits
+        for position in self.positions(code):
+            byte = position >> 3
+            # Redis не хранит нулевой хвост битовой строки
+            if byte >= len(bits) or not bits[byte] & (0x80 >> (position & 7)):
+                return False
+        return True
@@ -0,0 +1,112 @@
+"""
+Бенчмарк получения активных промокодов пользователя.
+
+Наполняет базу N активными промокодами (каждый выдан отдельному пользователю,
+10 из них - пользователю бенчмарка) и замеряет время
+PromoCodeService.get_active_promocodes_for_user. Все данные создаются внутри
+транзакции, которая откатывается в конце, поэтому запускать можно на тестовой базе
+с применёнными миграциями.
+
+Запуск (из каталога loyalty/src, с заполненным .env):
+    python ../tests/benchmarks/bench_active_promocodes.py --sizes 10 1000 100000
+"""
+import argparse
+import asyncio
+import statistics
+import sys
+import time
+import uuid
+from datetime import datetime, timedelta
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[2] / "src"))
+
+from sqlalchemy import insert, text  # noqa: E402
+
+from db.postgres_db import async_session  # noqa: E402
+from models.promocode import PromoCode, AvailableForUsers, AvailableUsers  # noqa: E402
+from models.user import User, Group  # noqa: E402
+from services.access_service import AccessService  # noqa: E402
+from services.promo_code_service import PromoCodeService  # noqa: E402
+
+USER_PROMOCODES = 10
+CHUNK = 5000
+
+
+async def seed(session, size: int) -> int:
+    run = uuid.uuid4().hex[:8]
+    group_id = (await session.execute(
+        insert(Group).values(name=f"bench-{run}").returning(Group.id)
+    )).scalar_one()
+    user_id = (await session.execute(
+        insert(User).values(uuid=uuid.uuid4(), email=f"bench-{run}@example.com", group_id=group_id)
+        .returning(User.id)
+    )).scalar_one()
+    expiration = (datetime.utcnow() + timedelta(days=30)).date()
+
+    for start in range(0, size, CHUNK):
+        stop = min(start + CHUNK, size)
+        promo_ids = (await session.execute(
+            insert(PromoCode).returning(PromoCode.id),
+            [
+                {"code": f"B{run}{i}", "discount": 10, "discount_type": "fixed",
+                 "num_uses": 1, "is_active": True, "is_deleted": False,
+                 "expiration_date": expiration}
+                for i in range(start, stop)
+            ],
+        )).scalars().all()
+        access_ids = (await session.execute(
+            insert(AvailableForUsers).returning(AvailableForUsers.id),
+            [{"promo_code_id": promo_id} for promo_id in promo_ids],
+        )).scalars().all()
+        owners = (await session.execute(
+            insert(User).returning(User.id),
+            [{"uuid": uuid.uuid4(), "email": f"bench-{run}-{i}@example.com"} for i in range(start, stop)],
+        )).scalars().all()
+        # Первые USER_PROMOCODES промокодов выдаются пользователю бенчмарка
+        await session.execute(
+            insert(AvailableUsers),
+            [
+                {"available_for_users_id": access_id,
+                 "user_id": user_id if start + i < USER_PROMOCODES else owner_id}
+                for i, (access_id, owner_id) in enumerate(zip(access_ids, owners))
+            ],
+        )
+    # Статистика планировщика должна учитывать только что вставленные строки
+    await session.execute(text("ANALYZE promo_codes, available_for_users, available_users"))
+    return user_id
+
+
+async def measure(size: int, repeats: int) -> dict:
+    async with async_session() as session:
+        try:
+            user_id = await seed(session, size)
+            service = PromoCodeService(None, session, AccessService(None, session))
+            timings = []
+            for _ in range(repeats):
+                started = time.perf_counter()
+                result = await service.get_active_promocodes_for_user(user_id)
+                timings.append((time.perf_counter() - started) * 1000)
+            assert len(result) == min(size, USER_PROMOCODES)
+        finally:
+            await session.rollback()
+    return {
+        "size": size,
+        "median_ms": statistics.median(timings),
+        "p95_ms": sorted(timings)[int(len(timings) * 0.95) - 1],
+    }
+
+
+async def main(sizes, repeats):
+    print(f"{'active codes':>12} {'median, ms':>11} {'p95, ms':>9}")
+    for size in sizes:
+        row = await measure(size, repeats)
+        print(f"{row['size']:>12} {row['median_ms']:>11.2f} {row['p95_ms']:>9.2f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10, 100, 1000, 10000, 100000])
+    parser.add_argument("--repeats", type=int, default=50)
+    args = parser.parse_args()
+    asyncio.run(main(args.sizes, args.repeats))
@@ -0,0 +1,68 @@
+"""
+Микробенчмарк расчёта матрицы цен тариф x промокод.
+
+Сравнивает скалярный PurchaseService.calculate_final_amount, вызываемый для
+каждой пары, с векторным services.pricing.price_matrix и проверяет, что
+результаты совпадают с точностью до копейки.
+
+Запуск (из каталога loyalty/src, с заполненным .env):
+    python ../tests/benchmarks/bench_pricing.py --tariffs 10 100 --promocodes 10 1000
+"""
+import argparse
+import random
+import sys
+import timeit
+from pathlib import Path
+from types import SimpleNamespace
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[2] / "src"))
+
+from services import pricing  # noqa: E402
+from services.purchase_service import PurchaseService  # noqa: E402
+
+
+def make_data(tariffs: int, promocodes: int):
+    rnd = random.Random(tariffs * 100003 + promocodes)
+    prices = [rnd.randrange(100, 100000) / 100 for _ in range(tariffs)]
+    promos = []
+    for _ in range(promocodes):
+        discount_type = rnd.choice(list(pricing.DISCOUNT_TYPES))
+        discount = rnd.randrange(1, 100) if discount_type == "percentage" else rnd.randrange(0, 50000) / 100
+        promos.append(SimpleNamespace(discount_type=discount_type, discount=discount))
+    return prices, promos
+
+
+def scalar(prices, promos):
+    return [[PurchaseService.calculate_final_amount(price, promo) for promo in promos] for price in prices]
+
+
+def vectorized(prices, promos):
+    return pricing.price_matrix(
+        pricing.to_kopecks(prices),
+        pricing.encode_discount_types([promo.discount_type for promo in promos]),
+        [promo.discount for promo in promos],
+    )
+
+
+def main(tariff_sizes, promocode_sizes, repeats):
+    print(f"{'tariffs':>8} {'promos':>8} {'scalar, ms':>11} {'numpy, ms':>10} {'speedup':>8}")
+    for tariffs in tariff_sizes:
+        for promocodes in promocode_sizes:
+            prices, promos = make_data(tariffs, promocodes)
+            expected = pricing.to_kopecks(scalar(prices, promos))
+            assert np.abs(vectorized(prices, promos) - expected).max() <= 1
+
+            scalar_ms = min(timeit.repeat(lambda: scalar(prices, promos), number=1, repeat=repeats)) * 1000
+            numpy_ms = min(timeit.repeat(lambda: vectorized(prices, promos), number=1, repeat=repeats)) * 1000
+            print(f"{tariffs:>8} {promocodes:>8} {scalar_ms:>11.3f} {numpy_ms:>10.3f} {scalar_ms / numpy_ms:>7.1f}x")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--tariffs", type=int, nargs="+", default=[5, 50, 500])
+    parser.add_argument("--promocodes", type=int, nargs="+", default=[10, 100, 1000])
+    parser.add_argument("--repeats", type=int, default=20)
+    args = parser.parse_args()
+    main(args.tariffs, args.promocodes, args.repeats)
@@ -0,0 +1,79 @@
+"""
+Нагрузочный бенчмарк /use_promocode для одного промокода.
+
+Отправляет --requests запросов с параллельностью --concurrency и проверяет,
+что успешных покупок не больше, чем допустимое количество использований
+промокода (--num-uses). Токен подписывается закрытым ключом сервиса
+авторизации (--key, файл <kid>.pem из каталога ключей auth).
+
+Запуск (из каталога loyalty/src, с заполненным .env и поднятым сервисом):
+    python ../tests/benchmarks/bench_use_promocode.py --key ../../auth/src/keys/initial.pem \
+        --code FLASH --tariff 1 --user 1 --num-uses 100
+"""
+import argparse
+import asyncio
+import statistics
+import sys
+import time
+from collections import Counter
+from pathlib import Path
+
+import aiohttp
+import jwt
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[2] / "src"))
+
+from core.config import settings  # noqa: E402
+
+
+def make_token(user_id: str, key_path: str) -> str:
+    key = Path(key_path)
+    return jwt.encode(
+        {"sub": user_id, "type": "access", "exp": time.time() + 3600},
+        key.read_bytes(),
+        settings.auth_jwt.algorithms[0],
+        headers={"kid": key.stem},
+    )
+
+
+async def main(args):
+    url = f"{args.url}/loyalty/api/v1/promocodes/use_promocode"
+    headers = {"Authorization": f"Bearer {make_token(args.user, args.key)}"}
+    params = {"promocode": args.code, "tariff_id": args.tariff}
+    statuses = Counter()
+    latencies = []
+    semaphore = asyncio.Semaphore(args.concurrency)
+
+    async with aiohttp.ClientSession(headers=headers) as client:
+        async def hit():
+            async with semaphore:
+                started = time.perf_counter()
+                async with client.post(url, params=params) as response:
+                    await response.read()
+                    statuses[response.status] += 1
+                latencies.append((time.perf_counter() - started) * 1000)
+
+        started = time.perf_counter()
+        await asyncio.gather(*(hit() for _ in range(args.requests)))
+        elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    print(f"requests: {args.requests}, concurrency: {args.concurrency}, {args.requests / elapsed:.0f} rps")
+    print(f"latency p50: {statistics.median(latencies):.1f} ms, p99: {latencies[int(len(latencies) * 0.99) - 1]:.1f} ms")
+    print("statuses:", dict(statuses))
+    if statuses[200] > args.num_uses:
+        print(f"OVERSOLD: {statuses[200]} successful uses for limit {args.num_uses}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--url", default=f"http://127.0.0.1:{settings.service_port}")
+    parser.add_argument("--key", required=True)
+    parser.add_argument("--code", required=True)
+    parser.add_argument("--tariff", type=int, required=True)
+    parser.add_argument("--user", required=True)
+    parser.add_argument("--num-uses", type=int, required=True)
+    parser.add_argument("--requests", type=int, default=5000)
+    parser.add_argument("--concurrency", type=int, default=200)
+    asyncio.run(main(parser.parse_args()))
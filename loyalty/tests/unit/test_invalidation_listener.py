@@ -0,0 +1,27 @@
+import sys
+from pathlib import Path
+
+import pytest
+from fakeredis.aioredis import FakeRedis
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[2] / "src"))
+
+from db import redis_db, tiered_cache  # noqa: E402
+from services.invalidation_listener import InvalidationListener  # noqa: E402
+
+
+@pytest.mark.asyncio
+async def test_num_uses_delta_is_applied_once():
+    redis_db.redis = redis_db.RedisCache(FakeRedis())
+    tiered_cache.tiered_cache = tiered_cache.TieredCache(redis_db.redis)
+    await redis_db.redis.redis.set("promocode_remaining:1", 10)
+    message = {"id": "b9d8f0a2-3c4e-4f5a-8b6c-7d8e9f0a1b2c", "entity": "promocode", "items": [[1, "FLASH", 5]]}
+
+    # Уведомление получает каждый воркер со своим слушателем
+    for listener in (InvalidationListener(reconnect_interval=1), InvalidationListener(reconnect_interval=1)):
+        await listener.handle(message)
+
+    assert int(await redis_db.redis.redis.get("promocode_remaining:1")) == 15
+
+    await InvalidationListener(reconnect_interval=1).handle({**message, "id": "another"})
+    assert int(await redis_db.redis.redis.get("promocode_remaining:1")) == 20